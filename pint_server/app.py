@@ -15,7 +15,11 @@
 # To contact SUSE about this file by physical or electronic mail,
 # you may find current contact information at www.suse.com
 
+import base64
 import datetime
+import functools
+import hashlib
+import io
 import math
 import os
 import re
@@ -23,13 +27,18 @@ import gzip
 import bz2
 import lzma
 import json 
-from collections import namedtuple
-from dateutil.relativedelta import relativedelta
-from decimal import Decimal
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from decimal import Decimal, InvalidOperation
 from flask import (
     abort,
+    copy_current_request_context,
     Flask,
-    jsonify,
+    g,
+    has_app_context,
     redirect,
     request,
     Response)
@@ -38,14 +47,31 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import (
     desc,
     asc,
-    or_,
+    case,
+    cast,
+    Date,
+    func,
+    inspect,
+    null,
+    select,
     text)
 from sqlalchemy.exc import DataError
-from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
-from xml.dom import minidom
-import xml.etree.ElementTree as ET
+from werkzeug.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 import pint_server
+from pint_server.change_log import change_log_base_table, change_log_table
+from pint_server.deletion_date import (
+    get_deletion_interval,
+    get_deletiondate_column)
 from pint_models.database import init_db, get_psql_server_version
 from pint_models.models import (ImageState, AmazonImagesModel,
                                 OracleImagesModel, AlibabaImagesModel,
@@ -55,14 +81,6 @@ from pint_models.models import (ImageState, AmazonImagesModel,
                                 VersionsModel, MicrosoftRegionMapModel)
 
 
-# hashable helper class to create named tuples from the details in
-# an image entry that are relevant for deletion date tracking.
-DeletionDetails = namedtuple("DeletionDetails",
-                             " ".join(["state",
-                                       "deprecatedon",
-                                       "deletedon"]))
-
-
 # helper regexp matcher for dates specified in the %Y%m%d (4 digits
 # for year, 2 digits for month, 2 digits for day) format
 date_matcher = re.compile(
@@ -143,29 +161,202 @@ SUPPORTED_CATEGORIES = ['images', 'servers']
 # "MAX_PAYLOAD_SIZE" environment variable.
 DEFAULT_MAX_PAYLOAD_SIZE = 5000000
 
-# Provider specific deletion relative time deltas
-DELETION_RELATIVE_DELTA_MAP = {
-    'amazon': {
-        'years':2,
-        'months':0,
-        'days':0
-    }
+# Image and server lists can be requested a page at a time with the "limit"
+# and "cursor" query arguments, in which case they are never trimmed. The
+# cursor for the next page, if any, is returned in the "nextcursor"
+# attribute of the collection and in a Link header.
+MAX_PAGE_LIMIT = 10000
+
+PAGINATED_ENDPOINTS = frozenset([
+    'list_provider_resource',
+    'list_provider_resource_for_category',
+    'list_images_for_provider_state',
+    'list_images_for_provider_region_and_state',
+    'list_servers_for_provider_type',
+    'list_servers_for_provider_region_and_type'
+])
+
+# The query arguments of the image filters, see get_image_filters()
+IMAGE_FILTER_ARGS = ('name', 'publishedafter', 'publishedbefore', 'state')
+
+# The query arguments recognised by each endpoint, other than the "limit"
+# and "cursor" of the paginated endpoints. Only these are included in the
+# response cache key, so that other arguments can't add cache entries.
+ENDPOINT_ARGS = {
+    'list_provider_resource': ('fields',) + IMAGE_FILTER_ARGS,
+    'list_provider_resource_for_category': ('fields',) + IMAGE_FILTER_ARGS,
+    'list_images_for_provider_state': ('fields',) + IMAGE_FILTER_ARGS,
+    'list_images_for_provider_region_and_state':
+        ('fields',) + IMAGE_FILTER_ARGS,
+    'list_servers_for_provider_type': ('fields',),
+    'list_servers_for_provider_region_and_type': ('fields',),
+    'list_images_deletedby': ('fields',) + IMAGE_FILTER_ARGS,
+    'list_images_deletedby_for_provider': ('fields',) + IMAGE_FILTER_ARGS,
+    'list_images_deletedby_for_provider_region':
+        ('fields',) + IMAGE_FILTER_ARGS,
+    'get_images_deletiondates_for_provider': ('names',),
+    'get_images_deletiondates_for_provider_region': ('names',),
+    'get_provider_category_data_version': ('category',),
+    'list_provider_images_changes': ('since',),
+    'list_provider_servers_changes': ('since',),
 }
 
-# Default deletion relative time deltas
-DELETION_RELATIVE_DELTA_DEFAULT = {
-    'years':0,
-    'months':6,
-    'days':0
+# The deletion dates of up to this many images can be requested at once,
+# with the "names" query argument or a POST request body.
+MAX_DELETIONDATE_IMAGES = 1000
+
+# XML responses are indented by default. They can be generated without any
+# indentation or newlines by setting the "XML_COMPACT" environment
+# variable to true.
+DEFAULT_XML_COMPACT = False
+
+# Supported content codings, mapped to the Content-Encoding header value
+# returned for them. NOTE: "lzma" is returned for xz for backwards
+# compatibility. zstd and br require the optional zstandard and brotli
+# libraries respectively.
+CONTENT_CODINGS = {
+    'zstd': 'zstd',
+    'br': 'br',
+    'gzip': 'gzip',
+    'bzip2': 'bzip2',
+    'xz': 'lzma'
 }
 
+# The order in which the content codings are preferred when the client
+# accepts several with the same quality value, which can be overwritten
+# with a comma separated list in the "COMPRESSION_PREFERENCE" environment
+# variable.
+DEFAULT_COMPRESSION_PREFERENCE = ['zstd', 'br', 'gzip', 'bzip2', 'xz']
+
+# Compression levels for each content coding by payload size band, as
+# (minimum uncompressed size, level) pairs in increasing size order, so
+# that small payloads use a fast level and large payloads, where the
+# savings matter most, use a higher one. These can be overwritten with a
+# comma separated list of coding:level[@min_size] entries in the
+# "COMPRESSION_LEVELS" environment variable, e.g.
+# "gzip:6,gzip:9@65536,zstd:3", where the entries for a coding replace
+# all of its default size bands.
+DEFAULT_COMPRESSION_LEVELS = {
+    'zstd': [(0, 3), (65536, 9)],
+    'br': [(0, 4), (65536, 6)],
+    'gzip': [(0, 6), (65536, 9)],
+    # the level only sets the block size, which makes no difference for
+    # payloads smaller than the level 1 block size
+    'bzip2': [(0, 1), (100000, 9)],
+    'xz': [(0, 1), (65536, 6), (1000000, 9)]
+}
+
+# Payloads smaller than this many bytes are not compressed, as the
+# savings don't outweigh the cost, which can be overwritten with the
+# "COMPRESSION_MIN_SIZE" environment variable.
+DEFAULT_COMPRESSION_MIN_SIZE = 256
+
+# gzip compressed images lists are made up of members of at least this
+# many bytes of uncompressed data, holding whole publishedon date groups.
+GZIP_MEMBER_MIN_SIZE = 262144
+
+# The compressed gzip members are cached, up to a total size that can be
+# overwritten with the "GZIP_MEMBER_CACHE_MAX_SIZE" environment variable.
+# Setting it to 0 disables the cache. Like the response cache, the default
+# fits within the default 128MB Lambda function memory.
+DEFAULT_GZIP_MEMBER_CACHE_MAX_SIZE = 5000000
 
 DATE_FORMAT = '%Y%m%d'
 
+# NOTE: the provider tables only change when data_update.py bumps the
+# associated entries in the versions table, so the list endpoints are
+# served from an in-memory snapshot of those tables that is reloaded when
+# the versions change. The versions themselves are re-checked at most once
+# per interval, in seconds, which can be overridden with the
+# "DATA_VERSION_CHECK_INTERVAL" environment variable. Setting it to 0 will
+# check the versions on every request.
+DEFAULT_DATA_VERSION_CHECK_INTERVAL = 60
+
+# The images to be deleted by a date are queried for all providers at once
+# by a pool of worker threads, each using its own DB session. The size of
+# the pool, and so the number of DB connections used, defaults to one per
+# provider and can be overridden with the "DELETEDBY_WORKERS" environment
+# variable.
+DEFAULT_DELETEDBY_WORKERS = 5
+
+# Tables that don't have an entry in the versions table are refreshed
+# whenever any of the listed versioned tables change.
+UNVERSIONED_TABLE_DEPENDENCIES = {
+    MicrosoftRegionMapModel.__tablename__: [
+        MicrosoftImagesModel.__tablename__,
+        MicrosoftServersModel.__tablename__
+    ]
+}
+
+# helper class to hold the loaded rows of a table along with the
+# data version it was loaded for.
+TableSnapshot = namedtuple("TableSnapshot", "version rows")
+
+# helper class to hold the lookup tables used to validate provider
+# specific requests, along with the data version they were built for.
+ProviderRegistry = namedtuple("ProviderRegistry",
+                              " ".join(["version",
+                                        "regions",
+                                        "region_set",
+                                        "server_types"]))
+
+# helper class to hold the Azure region name lookup tables built from
+# the region map, along with the data version they were built for.
+AzureRegionIndex = namedtuple("AzureRegionIndex",
+                              " ".join(["version",
+                                        "canonical_names",
+                                        "environments",
+                                        "aliases",
+                                        "regions"]))
+
+# compiled row serializers, keyed by model class and excluded attributes
+_row_serializers = {}
+
+# cached data versions and the time they were last checked
+_data_versions = {'versions': None, 'checked': None}
+
+# supported providers derived from the cached data versions
+_supported_providers = {'versions': None, 'providers': []}
 
-def get_deletion_relative_delta(provider):
-    return relativedelta(**DELETION_RELATIVE_DELTA_MAP.get(
-            provider, DELETION_RELATIVE_DELTA_DEFAULT))
+# built provider registries, keyed by provider
+_provider_registries = {}
+
+# built Azure region index
+_azure_region_index = {'index': None}
+
+# loaded table snapshots, keyed by tablename
+_table_snapshots = {}
+
+_snapshot_lock = threading.Lock()
+
+# worker thread pool for the all providers deletedby queries, created
+# when first needed
+_deletedby_executor = {'executor': None}
+
+_deletedby_executor_lock = threading.Lock()
+
+# NOTE: the fully encoded payloads of successful responses are cached,
+# keyed on the canonical route, the output format, the content encoding
+# and the data version, so that repeated requests don't need to be
+# serialized and compressed again. The cache is bounded by the total size
+# of the cached payloads, in bytes, evicting the least recently used
+# entries first. The limit can be overridden with the
+# "RESPONSE_CACHE_MAX_SIZE" environment variable; setting it to 0 disables
+# the response cache. The default is kept small enough to leave room for
+# the other caches within the default 128MB Lambda function memory.
+DEFAULT_RESPONSE_CACHE_MAX_SIZE = 5000000
+
+# Response headers that are saved along with a cached payload
+CACHED_RESPONSE_HEADERS = ['Content-Type', 'Content-Encoding', 'Link']
+
+# helper class to hold a cached response payload and its headers
+CachedResponse = namedtuple("CachedResponse", "payload headers")
+
+# NOTE: responses carry a strong ETag derived from the same details as the
+# response cache key, so clients and CDNs can revalidate them cheaply with
+# If-None-Match. The Cache-Control max-age, in seconds, can be overridden
+# with the "CACHE_CONTROL_MAX_AGE" environment variable.
+DEFAULT_CACHE_CONTROL_MAX_AGE = 60
 
 
 def get_datetime_date(date):
@@ -175,10 +366,308 @@ def get_datetime_date(date):
         abort(Response('', status=404))
 
 
+def get_data_version_check_interval():
+    if 'DATA_VERSION_CHECK_INTERVAL' in os.environ:
+        return float(os.environ.get('DATA_VERSION_CHECK_INTERVAL'))
+    else:
+        return DEFAULT_DATA_VERSION_CHECK_INTERVAL
+
+
+def get_deletedby_workers():
+    if 'DELETEDBY_WORKERS' in os.environ:
+        return int(os.environ.get('DELETEDBY_WORKERS'))
+    else:
+        return DEFAULT_DELETEDBY_WORKERS
+
+
+def get_deletedby_executor():
+    with _deletedby_executor_lock:
+        if _deletedby_executor['executor'] is None:
+            _deletedby_executor['executor'] = ThreadPoolExecutor(
+                max_workers=get_deletedby_workers(),
+                thread_name_prefix='deletedby')
+        return _deletedby_executor['executor']
+
+
+def get_data_versions():
+    """Return a dict mapping tablename to data version, re-reading the
+    versions table only if the check interval has elapsed."""
+    # use the same versions for the whole of a request
+    if has_app_context() and 'data_versions' in g:
+        return g.data_versions
+
+    now = time.monotonic()
+    checked = _data_versions['checked']
+    if (_data_versions['versions'] is None or checked is None or
+            now - checked >= get_data_version_check_interval()):
+        _data_versions['versions'] = {
+            v.tablename: v.version for v in VersionsModel.query.all()}
+        _data_versions['checked'] = now
+
+    if has_app_context():
+        g.data_versions = _data_versions['versions']
+    return _data_versions['versions']
+
+
+def get_table_data_version(model):
+    versions = get_data_versions()
+    tablename = model.__tablename__
+    if tablename in versions:
+        return versions[tablename]
+    return tuple(versions.get(t)
+                 for t in UNVERSIONED_TABLE_DEPENDENCIES.get(tablename, []))
+
+
+def get_images_order_by(model):
+    # newest images first, with the name and primary key columns as tie
+    # breakers so that the ordering is stable.
+    order_by = [desc(model.publishedon), model.name]
+    order_by.extend(c for c in model.__table__.primary_key.columns
+                    if c.name != 'name')
+    return order_by
+
+
+def get_row_sort_attrs(model):
+    """Return the names of the attributes load_table_rows() orders the
+    rows of the given model by."""
+    if hasattr(model, 'publishedon'):
+        return [c.key for c in [model.publishedon] +
+                get_images_order_by(model)[1:]]
+    return [c.key for c in model.__table__.primary_key.columns]
+
+
+def get_row_sort_key(model):
+    """Return a key function ordering the row tuples selected by
+    select_model_rows() the same as load_table_rows() does."""
+    attrs = get_model_attrs(model)
+    indexes = [attrs.index(a) for a in get_row_sort_attrs(model)]
+    if hasattr(model, 'publishedon'):
+        # newest images first
+        return lambda row: (-row[indexes[0]].toordinal(),
+                            *[row[i] for i in indexes[1:]])
+    return lambda row: tuple(row[i] for i in indexes)
+
+
+def load_table_rows(model):
+    if hasattr(model, 'publishedon'):
+        order_by = get_images_order_by(model)
+    else:
+        order_by = list(model.__table__.primary_key.columns)
+    rows = db_session.execute(
+        select_model_rows(model).order_by(*order_by)).all()
+    # NOTE: the DB's collation may order names differently, so the rows
+    # are re-sorted using Python's string ordering, which the pagination
+    # cursors are compared with.
+    rows.sort(key=get_row_sort_key(model))
+    return rows
+
+
+def get_table_snapshot(model):
+    """Return the rows of the specified table, reloading them from the
+    DB only if the table's data version has changed since they were last
+    loaded."""
+    version = get_table_data_version(model)
+    snapshot = _table_snapshots.get(model.__tablename__)
+    if snapshot is None or snapshot.version != version:
+        with _snapshot_lock:
+            # another thread may have already reloaded the table
+            snapshot = _table_snapshots.get(model.__tablename__)
+            if snapshot is None or snapshot.version != version:
+                snapshot = TableSnapshot(version, load_table_rows(model))
+                _table_snapshots[model.__tablename__] = snapshot
+    return snapshot.rows
+
+
+class ResponseCache:
+    """Least recently used cache of encoded response payloads, bounded
+    by the total size of the cached payloads. The size of an entry is
+    determined by the entry_size function."""
+
+    def __init__(self, entry_size=lambda entry: len(entry.payload)):
+        self._entries = OrderedDict()
+        self._entry_size = entry_size
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry, max_size):
+        entry_size = self._entry_size(entry)
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._size -= self._entry_size(old_entry)
+
+            # don't evict everything else for an entry that can't fit
+            if entry_size > max_size:
+                return
+
+            self._entries[key] = entry
+            self._size += entry_size
+            while self._size > max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= self._entry_size(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+response_cache = ResponseCache()
+
+# cache of compressed gzip members, keyed by the digest of their data
+gzip_member_cache = ResponseCache(entry_size=len)
+
+
+def get_gzip_member_cache_max_size():
+    if 'GZIP_MEMBER_CACHE_MAX_SIZE' in os.environ:
+        return int(os.environ.get('GZIP_MEMBER_CACHE_MAX_SIZE'))
+    else:
+        return DEFAULT_GZIP_MEMBER_CACHE_MAX_SIZE
+
+
+def get_response_cache_max_size():
+    if 'RESPONSE_CACHE_MAX_SIZE' in os.environ:
+        return int(os.environ.get('RESPONSE_CACHE_MAX_SIZE'))
+    else:
+        return DEFAULT_RESPONSE_CACHE_MAX_SIZE
+
+
+def get_request_data_version():
+    """Return the data versions relevant to the current request, i.e. the
+    versions of the requested provider's tables, or of all tables if the
+    request isn't provider specific."""
+    return get_provider_data_version(
+        (request.view_args or {}).get('provider'))
+
+
+def get_response_cache_args():
+    """Return the names of the query arguments recognised by the current
+    request's endpoint."""
+    names = set(ENDPOINT_ARGS.get(request.endpoint, ()))
+    # the image filters don't apply to server lists
+    if (request.view_args or {}).get('category', 'images') != 'images':
+        names.difference_update(IMAGE_FILTER_ARGS)
+    if request.endpoint in PAGINATED_ENDPOINTS:
+        names.update(['limit', 'cursor'])
+    return names
+
+
+def get_response_cache_key():
+    # The .json, .xml and suffix-less variants of a route share the same
+    # endpoint and view args, so the canonical route is derived from them,
+    # rather than the request path, along with the recognised query
+    # arguments.
+    names = get_response_cache_args()
+    route = (request.endpoint,
+             tuple(sorted((request.view_args or {}).items())),
+             tuple(sorted((name, value) for name, value
+                          in request.args.items(multi=True)
+                          if name in names)))
+    _, content_encoding, _ = negotiate_compression()
+    return (route, get_response_format(), content_encoding,
+            get_request_data_version())
+
+
+def get_cache_control_max_age():
+    if 'CACHE_CONTROL_MAX_AGE' in os.environ:
+        return int(os.environ.get('CACHE_CONTROL_MAX_AGE'))
+    else:
+        return DEFAULT_CACHE_CONTROL_MAX_AGE
+
+
+def get_response_etag(cache_key):
+    return hashlib.sha256(repr(cache_key).encode('utf-8')).hexdigest()[:32]
+
+
+def get_response_last_modified(cache_key):
+    # the integer part of a data version is the date stamp, in DATE_FORMAT,
+    # of the pint-data commit it was loaded from.
+    data_version = cache_key[-1]
+    try:
+        last_modified = max(int(Decimal(v)) for _, v in data_version)
+        return datetime.datetime.strptime(str(last_modified), DATE_FORMAT)
+    except ValueError:
+        return None
+
+
+def get_conditional_headers(cache_key):
+    headers = {
+        'ETag': '"%s"' % get_response_etag(cache_key),
+        'Cache-Control': 'public, max-age=%d' % get_cache_control_max_age(),
+        'Vary': 'Accept-Encoding'
+    }
+    last_modified = get_response_last_modified(cache_key)
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(cache_key, cached):
+    # NOTE: If-Modified-Since is not honoured as the Last-Modified date
+    # doesn't change for multiple data updates on the same day.
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return False
+    # only report a '*' match for responses known to exist
+    if if_none_match.star_tag:
+        return cached
+    return if_none_match.contains_weak(get_response_etag(cache_key))
+
+
+def get_provider_for_tablename(tablename):
+    return re.sub('(servers|images|regionmap)', '', tablename)
+
+
+def get_provider_data_version(provider=None):
+    # the versions of the specified provider's tables, or of all tables
+    # if no provider was specified
+    versions = get_data_versions()
+    return tuple(sorted((t, str(v)) for t, v in versions.items()
+                        if provider is None or
+                        get_provider_for_tablename(t) == provider))
+
+
+def build_provider_registry(provider, version):
+    regions = query_provider_regions(provider)
+    server_types = {t['name'] for t in get_provider_servers_types(provider)}
+    return ProviderRegistry(version, regions, frozenset(regions),
+                            frozenset(server_types))
+
+
+def get_provider_registry(provider):
+    """Return the lookup tables for the specified provider, rebuilding
+    them only if the provider's data version has changed."""
+    version = get_provider_data_version(provider)
+    registry = _provider_registries.get(provider)
+    if registry is None or registry.version != version:
+        registry = build_provider_registry(provider, version)
+        _provider_registries[provider] = registry
+    return registry
+
+
 def get_supported_providers():
-    versions  = VersionsModel.query.with_entities(VersionsModel.tablename)
-    # sort the list of providers so that the order is consistent going forward
-    return sorted({re.sub('(servers|images)', '', v.tablename) for v in versions})
+    versions = get_data_versions()
+    if _supported_providers['versions'] is not versions:
+        # sort the list of providers so that the order is consistent
+        # going forward
+        _supported_providers['providers'] = sorted(
+            {get_provider_for_tablename(t) for t in versions})
+        _supported_providers['versions'] = versions
+    return _supported_providers['providers']
 
 
 def get_providers():
@@ -186,24 +675,104 @@ def get_providers():
     return [{'name': provider} for provider in get_supported_providers()]
 
 
-def json_to_xml(json_obj, collection_name, element_name):
+def _escape_xml(value):
+    # escape the same characters as minidom does when writing text and
+    # attribute values
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    return value
+
+
+def _xml_element(tag, attrs, indent, newl):
+    return '%s<%s%s/>%s' % (
+        indent, tag,
+        ''.join([' %s="%s"' % (name, _escape_xml(value))
+                 for name, value in attrs.items()]),
+        newl)
+
+
+def _iter_xml_nested_element(tag, obj, indent, newl, depth):
+    # the list values of obj are nested collections of elements, named
+    # for the singular of the key, and the other values are attributes
+    attrs = {name: value for name, value in obj.items()
+             if not isinstance(value, list)}
+    collections = [(name, value) for name, value in obj.items()
+                   if isinstance(value, list)]
+    if not collections:
+        yield _xml_element(tag, attrs, indent * depth, newl)
+        return
+    yield '%s<%s%s>%s' % (
+        indent * depth, tag,
+        ''.join([' %s="%s"' % (name, _escape_xml(value))
+                 for name, value in attrs.items()]),
+        newl)
+    for name, elements in collections:
+        if not elements:
+            yield _xml_element(name, {}, indent * (depth + 1), newl)
+            continue
+        yield '%s<%s>%s' % (indent * (depth + 1), name, newl)
+        for element in elements:
+            yield from _iter_xml_nested_element(name[:-1], element, indent,
+                                                newl, depth + 2)
+        yield '%s</%s>%s' % (indent * (depth + 1), name, newl)
+    yield '%s</%s>%s' % (indent * depth, tag, newl)
+
+
+def iter_xml(json_obj, collection_name, element_name, compact=False,
+             collection_attrs=None):
+    """Generate the XML document for the given JSON object in chunks,
+    matching the output of minidom's toprettyxml(indent='  '), or without
+    any indentation or newlines if compact is True. Any collection_attrs
+    are added as attributes of the collection element."""
+    indent, newl = ('', '') if compact else ('  ', '\n')
+    yield '<?xml version="1.0" ?>' + newl
     if collection_name:
-        root = ET.Element(collection_name)
-        for dict in json_obj:
-            ET.SubElement(root, element_name, dict)
+        if not json_obj:
+            yield _xml_element(collection_name, collection_attrs or {}, '',
+                               newl)
+            return
+        yield '<%s%s>%s' % (
+            collection_name,
+            ''.join([' %s="%s"' % (name, _escape_xml(value))
+                     for name, value in (collection_attrs or {}).items()]),
+            newl)
+        # the elements of a collection are all alike, so only the first
+        # is checked for nested collections
+        if any(isinstance(value, list) for value in json_obj[0].values()):
+            for element in json_obj:
+                yield from _iter_xml_nested_element(element_name, element,
+                                                    indent, newl, 1)
+        else:
+            for element in json_obj:
+                yield _xml_element(element_name, element, indent, newl)
+        yield '</%s>%s' % (collection_name, newl)
+    elif element_name:
+        yield _xml_element(element_name, json_obj, '', newl)
     else:
-        if element_name:
-            root = ET.Element(element_name, json_obj)
+        # NOTE(gyee): if neither collection_name and element_name are
+        # specified, we assume the json_obj has a single key value pair
+        # with key as the tag and value as the text
+        tag = list(json_obj.keys())[0]
+        content = json_obj[tag]
+        if content:
+            # XML parsers normalize line endings in text content
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+            yield '<%s>%s</%s>%s' % (tag, _escape_xml(content), tag, newl)
         else:
-            # NOTE(gyee): if neither collection_name and element_name are
-            # specified, we assume the json_obj has a single key value pair
-            # with key as the tag and value as the text
-            tag = list(json_obj.keys())[0]
-            root = ET.Element(tag)
-            root.text = json_obj[tag]
-    parsed = minidom.parseString(
-        ET.tostring(root, encoding='utf8', method='xml'))
-    return parsed.toprettyxml(indent='  ')
+            yield '<%s/>%s' % (tag, newl)
+
+
+def json_to_xml(json_obj, collection_name, element_name, compact=False,
+                collection_attrs=None):
+    return ''.join(iter_xml(json_obj, collection_name, element_name,
+                            compact=compact,
+                            collection_attrs=collection_attrs))
 
 
 def get_formatted_dict(obj, extra_attrs=None, exclude_attrs=None):
@@ -256,15 +825,335 @@ def get_formatted_dict(obj, extra_attrs=None, exclude_attrs=None):
     return obj_dict
 
 
+def _format_decimal(value, row):
+    return float(value) if isinstance(value, Decimal) else null_to_empty(value)
+
+
+def _format_image_state(value, row):
+    return value.value if isinstance(value, ImageState) else null_to_empty(value)
+
+
+def _make_server_type_formatter(shape_index):
+    def _format_server_type(value, row):
+        if not isinstance(value, ServerType):
+            return null_to_empty(value)
+
+        # NOTE(gyee): we need to reverse map the server type
+        # to make it backward compatible
+        shape = row[shape_index]
+        if shape:
+            return "%s-%s" % (REGIONSERVER_SMT_REVERSED_MAP[value.value],
+                              shape)
+        return REGIONSERVER_SMT_REVERSED_MAP[value.value]
+
+    return _format_server_type
+
+
+@functools.lru_cache(maxsize=8192)
+def _strftime(value):
+    # the same dates are repeated across many rows
+    return value.strftime(DATE_FORMAT)
+
+
+def _format_date(value, row):
+    if isinstance(value, datetime.date):
+        return _strftime(value)
+    return null_to_empty(value)
+
+
+def _get_column_formatter(column, attrs):
+    # None means the value only needs null_to_empty(), which is inlined
+    # by the serializer
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+
+    if python_type is ImageState:
+        return _format_image_state
+    elif python_type is ServerType:
+        return _make_server_type_formatter(attrs.index('shape'))
+    elif issubclass(python_type, Decimal):
+        return _format_decimal
+    elif issubclass(python_type, datetime.date):
+        return _format_date
+    return None
+
+
+def get_model_attrs(model):
+    """Return the names of the mapped column attributes of the given model,
+    in the order they are selected by select_model_rows()."""
+    return tuple(prop.key for prop in inspect(model).column_attrs)
+
+
+def select_model_rows(model, attrs=None):
+    # select plain row tuples, rather than ORM entities, as the rows are
+    # only ever read and formatted. If attrs is given, only those columns
+    # are read, with NULL selected in place of the others so that the
+    # layout of the row tuples stays the same.
+    return select(*[getattr(model, attr) if attrs is None or attr in attrs
+                    else null().label(attr)
+                    for attr in get_model_attrs(model)])
+
+
+def get_serialized_attrs(model, exclude_attrs=None):
+    """Return the names of the attributes get_formatted_dict() includes
+    for instances of the given model, in the order they are included."""
+    if exclude_attrs is None:
+        exclude_attrs = []
+
+    # NOTE: see get_formatted_dict() for why these are special cased
+    return [attr for attr in get_model_attrs(model)
+            if attr.lower() != 'shape' and attr not in exclude_attrs and
+            attr[0] != '_']
+
+
+def compile_row_serializer(model, exclude_attrs=None, include_attrs=None):
+    """Return a function producing the same dict as get_formatted_dict()
+    for row tuples selected by select_model_rows(), with the column list
+    and the per column formatting worked out once up front rather than
+    for every row. If include_attrs is given, only those attributes are
+    included."""
+    attrs = get_model_attrs(model)
+    serialized_attrs = get_serialized_attrs(model, exclude_attrs)
+    columns = {prop.key: prop.columns[0]
+               for prop in inspect(model).column_attrs}
+    fields = []
+    for index, attr in enumerate(attrs):
+        if attr not in serialized_attrs:
+            continue
+        if include_attrs is not None and attr not in include_attrs:
+            continue
+        fields.append((index, attr,
+                       _get_column_formatter(columns[attr], attrs),
+                       attr.lower() in ['urn', 'changeinfo']))
+    fields = tuple(fields)
+
+    def serialize(row, extra_attrs=None):
+        obj_dict = {}
+        for index, attr, formatter, omit_empty in fields:
+            value = row[index]
+            if omit_empty and not value:
+                continue
+            if formatter is None:
+                obj_dict[attr] = value or ''
+            else:
+                obj_dict[attr] = formatter(value, row)
+        if extra_attrs:
+            obj_dict.update(extra_attrs)
+        return obj_dict
+
+    return serialize
+
+
+def get_row_serializer(model, exclude_attrs=None, include_attrs=None):
+    key = (model, tuple(exclude_attrs or ()), include_attrs)
+    serializer = _row_serializers.get(key)
+    if serializer is None:
+        serializer = compile_row_serializer(model, exclude_attrs,
+                                            include_attrs)
+        _row_serializers[key] = serializer
+    return serializer
+
+
+def get_page_request():
+    """Return the (limit, cursor) arguments of a request for a page of an
+    image or server list, or None if the whole list was requested."""
+    if (request.endpoint not in PAGINATED_ENDPOINTS or
+            'limit' not in request.args):
+        return None
+    try:
+        limit = int(request.args['limit'])
+    except ValueError:
+        abort(Response('', status=400))
+    if not 0 < limit <= MAX_PAGE_LIMIT:
+        abort(Response('', status=400))
+    return limit, request.args.get('cursor')
+
+
+def encode_cursor(model, row):
+    # the cursor holds the sort attribute values of the last row of a page
+    attrs = get_model_attrs(model)
+    values = []
+    for attr in get_row_sort_attrs(model):
+        value = row[attrs.index(attr)]
+        if isinstance(value, datetime.date):
+            value = value.strftime(DATE_FORMAT)
+        values.append(value)
+    return base64.urlsafe_b64encode(
+        encode_json(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(model, cursor):
+    """Return the get_row_sort_key() key of the row the cursor was encoded
+    for."""
+    attrs = get_model_attrs(model)
+    columns = {prop.key: prop.columns[0]
+               for prop in inspect(model).column_attrs}
+    sort_attrs = get_row_sort_attrs(model)
+    row = {}
+    try:
+        values = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(sort_attrs):
+            raise ValueError(cursor)
+        for attr, value in zip(sort_attrs, values):
+            python_type = columns[attr].type.python_type
+            if python_type is datetime.date:
+                value = datetime.datetime.strptime(value, DATE_FORMAT).date()
+            elif not isinstance(value, python_type):
+                raise ValueError(cursor)
+            row[attrs.index(attr)] = value
+    except (TypeError, ValueError):
+        abort(Response('', status=400))
+    return get_row_sort_key(model)(row)
+
+
+def bisect_rows(rows, key, sort_key):
+    # the same as bisect.bisect_right(rows, key, key=sort_key), which
+    # requires Python 3.10
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if key < sort_key(rows[mid]):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def paginate_rows(model, rows):
+    """Return the requested page of the rows, which are ordered by
+    get_row_sort_key(), if a page was requested, saving the cursor for the
+    next page, if any.
+
+    NOTE: the page is found by a binary search for the cursor's row, rather
+    than its position, so that the cursor remains valid when rows are added
+    or removed by a data update."""
+    page = get_page_request()
+    if page is None:
+        return rows
+
+    limit, cursor = page
+    start = 0
+    if cursor:
+        start = bisect_rows(rows, decode_cursor(model, cursor),
+                            get_row_sort_key(model))
+    page_rows = rows[start:start + limit]
+    if start + limit < len(rows):
+        g.next_cursor = encode_cursor(model, page_rows[-1])
+    return page_rows
+
+
+def get_requested_fields():
+    """Return the frozenset of the attributes requested with the "fields"
+    query argument, or None if all attributes were requested."""
+    if 'fields' not in request.args:
+        return None
+    fields = frozenset(f.strip() for f in request.args['fields'].split(',')
+                       if f.strip())
+    if not fields:
+        abort(Response('', status=400))
+    return fields
+
+
+def _escape_like(value):
+    return (value.replace('\\', '\\\\').replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def get_filter_date(name):
+    try:
+        return datetime.datetime.strptime(
+            request.args[name], DATE_FORMAT).date()
+    except ValueError:
+        abort(Response('', status=400))
+
+
+def get_image_filters(model):
+    """Return the (SQL condition, row predicate) pairs for the image
+    filters requested with the query arguments:
+
+      name: the image name, where '*' matches any characters, e.g.
+            "suse-sles-15-sp5-*"
+      publishedafter, publishedbefore: exclusive publishedon date bounds,
+            in the DATE_FORMAT format
+      state: a comma separated list of image states
+
+    The conditions are used for images queried from the DB, and the
+    predicates for images filtered from the table snapshots."""
+    filters = []
+    if 'name' in request.args:
+        parts = request.args['name'].split('*')
+        name_re = re.compile('.*'.join(re.escape(p) for p in parts))
+        filters.append((
+            model.name.like('%'.join(_escape_like(p) for p in parts),
+                            escape='\\'),
+            lambda image: name_re.fullmatch(image.name) is not None))
+    if 'publishedafter' in request.args:
+        published_after = get_filter_date('publishedafter')
+        filters.append((
+            model.publishedon > published_after,
+            lambda image: image.publishedon > published_after))
+    if 'publishedbefore' in request.args:
+        published_before = get_filter_date('publishedbefore')
+        filters.append((
+            model.publishedon < published_before,
+            lambda image: image.publishedon < published_before))
+    if 'state' in request.args:
+        states = request.args['state'].split(',')
+        if not all(state in ImageState.__members__ for state in states):
+            abort(Response('', status=400))
+        states = frozenset(ImageState(state) for state in states)
+        filters.append((
+            model.state.in_(states),
+            lambda image: image.state in states))
+    return filters
+
+
+def get_image_filter_conditions(model):
+    return [condition for condition, _ in get_image_filters(model)]
+
+
+def filter_images(model, images):
+    predicates = [predicate for _, predicate in get_image_filters(model)]
+    if not predicates:
+        return images
+    return [i for i in images if all(p(i) for p in predicates)]
+
+
+def get_next_page_link(next_cursor):
+    args = request.args.copy()
+    args['cursor'] = next_cursor
+    return '<%s?%s>; rel="next"' % (
+        request.base_url, urlencode(list(args.items(multi=True))))
+
+
 # Helper functions for performing provider specific formatting of
 # the response dictionary
-def formatted_provider_results(provider, results, exclude_attrs, extra_attrs):
+def formatted_provider_results(provider, model, results, exclude_attrs,
+                               extra_attrs, partial_fields=False):
+    # only the requested fields, which must be attributes of the results,
+    # unless partial_fields is set, are included
+    fields = get_requested_fields()
+    if fields is not None and model is not None:
+        valid_fields = set(get_serialized_attrs(model, exclude_attrs))
+        valid_fields.update(extra_attrs or ())
+        if not partial_fields and not fields <= valid_fields:
+            abort(Response('', status=400))
+        if extra_attrs:
+            extra_attrs = {name: value for name, value in extra_attrs.items()
+                           if name in fields}
+
+    # NOTE: there are no tables, and so no results, for some provider
+    # categories
+    if not results:
+        return []
 
+    results = paginate_rows(model, results)
+    serializer = get_row_serializer(model, exclude_attrs, fields)
     try:
-        formatted = [get_formatted_dict(r,
-                                        exclude_attrs=exclude_attrs,
-                                        extra_attrs=extra_attrs)
-                     for r in results]
+        formatted = [serializer(r, extra_attrs) for r in results]
     except DataError:
         abort(Response('', status=404))
 
@@ -272,13 +1161,17 @@ def formatted_provider_results(provider, results, exclude_attrs, extra_attrs):
 
 
 # Formatting helper for provider image list results
-def formatted_provider_images(provider, images, extra_attrs=None):
+def formatted_provider_images(provider, images, extra_attrs=None,
+                              partial_fields=False):
     # retrieve list of attrs that should be excluded for provider images
     exclude_attrs = PROVIDER_IMAGES_EXCLUDE_ATTRS.get(provider)
 
-    return formatted_provider_results(provider, images,
+    return formatted_provider_results(provider,
+                                      PROVIDER_IMAGES_MODEL_MAP.get(provider),
+                                      images,
                                       exclude_attrs=exclude_attrs,
-                                      extra_attrs=extra_attrs)
+                                      extra_attrs=extra_attrs,
+                                      partial_fields=partial_fields)
 
 
 # Formatting helper for provider image list results
@@ -286,7 +1179,9 @@ def formatted_provider_servers(provider, servers, extra_attrs=None):
     # retrieve list of attrs that should be excluded for provider servers
     exclude_attrs = PROVIDER_SERVERS_EXCLUDE_ATTRS.get(provider)
 
-    return formatted_provider_results(provider, servers,
+    return formatted_provider_results(provider,
+                                      PROVIDER_SERVERS_MODEL_MAP.get(provider),
+                                      servers,
                                       exclude_attrs=exclude_attrs,
                                       extra_attrs=extra_attrs)
 
@@ -296,8 +1191,7 @@ def get_mapped_server_type_for_provider(provider, server_type):
         abort(Response('', status=404))
     mapped_server_type = REGIONSERVER_SMT_MAP[server_type]
     if PROVIDER_SERVERS_MODEL_MAP.get(provider):
-        server_types_json = get_provider_servers_types(provider)
-        server_types = [t['name'] for t in server_types_json]
+        server_types = get_provider_registry(provider).server_types
         if mapped_server_type not in server_types:
             abort(Response('', status=404))
     return mapped_server_type
@@ -313,16 +1207,19 @@ def get_provider_servers_for_type(provider, server_type):
     if not PROVIDER_SERVERS_MODEL_MAP.get(provider):
         return servers
 
-    servers = PROVIDER_SERVERS_MODEL_MAP[provider].query.filter(
-        PROVIDER_SERVERS_MODEL_MAP[provider].type == mapped_server_type)
+    mapped_server_type = ServerType(mapped_server_type)
+    servers = [s for s in get_table_snapshot(
+                   PROVIDER_SERVERS_MODEL_MAP[provider])
+               if s.type == mapped_server_type]
     return formatted_provider_servers(provider, servers)
 
 
 def get_provider_servers_types(provider):
     if PROVIDER_SERVERS_MODEL_MAP.get(provider) != None:
-        servers = PROVIDER_SERVERS_MODEL_MAP[provider].query.distinct(
-            PROVIDER_SERVERS_MODEL_MAP[provider].type)
-        return [{'name': server.type.value} for server in servers]
+        server_types = {server.type for server in get_table_snapshot(
+                            PROVIDER_SERVERS_MODEL_MAP[provider])}
+        # report the types in their enum declaration order
+        return [{'name': t.value} for t in ServerType if t in server_types]
     else:
         # NOTE(gyee): currently we don't have DB tables for both Alibaba and
         # Oracle servers. In order to maintain compatibility with the
@@ -336,101 +1233,107 @@ def query_provider_regions(provider):
     if provider == 'microsoft':
         return _get_all_azure_regions()
 
-    servers = []
-    images = []
-    region_list = [] # Combination list
+    server_regions = set()
+    image_regions = set()
     if PROVIDER_SERVERS_MODEL_MAP.get(provider) != None:
-        servers = PROVIDER_SERVERS_MODEL_MAP[provider].query.with_entities(
-            PROVIDER_SERVERS_MODEL_MAP[provider].region).distinct(
-                PROVIDER_SERVERS_MODEL_MAP[provider].region)
+        server_regions = {s.region for s in get_table_snapshot(
+                              PROVIDER_SERVERS_MODEL_MAP[provider])}
     if hasattr(PROVIDER_IMAGES_MODEL_MAP[provider], 'region'):
-        images = PROVIDER_IMAGES_MODEL_MAP[provider].query.with_entities(
-            PROVIDER_IMAGES_MODEL_MAP[provider].region).distinct(
-                PROVIDER_IMAGES_MODEL_MAP[provider].region)
-    for server in servers:
-        if server.region not in region_list:
-            region_list.append(server.region)
-    for image in images:
-        if image.region not in region_list:
-            region_list.append(image.region)
+        image_regions = {i.region for i in get_table_snapshot(
+                             PROVIDER_IMAGES_MODEL_MAP[provider])}
 
-    return region_list
+    # servers regions first, followed by any image only regions
+    return (sorted(server_regions) +
+            sorted(image_regions - server_regions))
 
 
 def get_provider_regions(provider):
 
-    regions = query_provider_regions(provider)
+    regions = get_provider_registry(provider).regions
 
     return [{'name': r } for r in regions]
 
 
-def _get_all_azure_regions():
-    regions = set()
-    environments = MicrosoftRegionMapModel.query.all()
-    for environment in environments:
-        regions.update((environment.region, environment.canonicalname))
-    return sorted(regions)
+def _build_azure_region_index(version):
+    canonical_names = {}
+    environments = {}
+    aliases = {}
+    for entry in get_table_snapshot(MicrosoftRegionMapModel):
+        # a canonical name maps to itself, but a region entry takes
+        # precedence if the same name is used for both.
+        canonical_names.setdefault(entry.canonicalname, entry.canonicalname)
+        canonical_names[entry.region] = entry.canonicalname
+        environments.setdefault(entry.canonicalname, entry.environment)
+        aliases.setdefault(entry.canonicalname, set()).add(entry.region)
+
+    return AzureRegionIndex(
+        version,
+        canonical_names,
+        environments,
+        {c: frozenset(a) for c, a in aliases.items()},
+        sorted(canonical_names))
+
+
+def _get_azure_region_index():
+    """Return the Azure region name lookup tables, rebuilding them only if
+    the region map's data version has changed."""
+    version = get_table_data_version(MicrosoftRegionMapModel)
+    index = _azure_region_index['index']
+    if index is None or index.version != version:
+        index = _build_azure_region_index(version)
+        _azure_region_index['index'] = index
+    return index
 
 
-def _get_azure_servers(region, server_type=None):
-    # first lookup canonical name for the given region
-    environment = MicrosoftRegionMapModel.query.filter(
-        or_(MicrosoftRegionMapModel.region == region,
-            MicrosoftRegionMapModel.canonicalname == region)).first()
+def _get_all_azure_regions():
+    return _get_azure_region_index().regions
 
-    if not environment:
+
+def _get_azure_canonical_region(region):
+    # lookup the canonical name for the given region or canonical name
+    canonical_name = _get_azure_region_index().canonical_names.get(region)
+    if canonical_name is None:
         abort(Response('', status=404))
 
-    # then get all the regions with the canonical name
-    environments = MicrosoftRegionMapModel.query.filter(
-        MicrosoftRegionMapModel.canonicalname == environment.canonicalname)
+    return canonical_name
+
+
+def _get_azure_servers(region, server_type=None):
+    # first lookup canonical name for the given region
+    canonical_name = _get_azure_canonical_region(region)
 
     # get all the possible names for the region
-    all_regions = []
-    for environment in environments:
-        if environment.region not in all_regions:
-            all_regions.append(environment.region)
+    all_regions = _get_azure_region_index().aliases[canonical_name]
 
     # get all the severs for that region
+    servers = get_table_snapshot(MicrosoftServersModel)
     if server_type:
-        mapped_server_type = get_mapped_server_type_for_provider(
-            'microsoft', server_type)
-        servers = MicrosoftServersModel.query.filter(
-            MicrosoftServersModel.type == mapped_server_type,
-            MicrosoftServersModel.region.in_(all_regions))
+        mapped_server_type = ServerType(get_mapped_server_type_for_provider(
+            'microsoft', server_type))
+        servers = [s for s in servers
+                   if s.type == mapped_server_type and s.region in all_regions]
     else:
-        servers = MicrosoftServersModel.query.filter(
-            MicrosoftServersModel.region.in_(all_regions))
+        servers = [s for s in servers if s.region in all_regions]
 
     return formatted_provider_servers('microsoft', servers)
 
 
 def _get_azure_environment_name_for_region(region):
     # lookup environment for given region, assuming unique per region
-    environment = MicrosoftRegionMapModel.query.filter(
-        or_(MicrosoftRegionMapModel.region == region,
-            MicrosoftRegionMapModel.canonicalname == region)).first()
-
-    if not environment:
-        abort(Response('', status=404))
-
-    return environment.environment
+    return _get_azure_region_index().environments[
+        _get_azure_canonical_region(region)]
 
 def _get_azure_images_for_region_state(provider, region, state=None):
     environment_name = _get_azure_environment_name_for_region(region)
 
-    # query all images with matching environment and state (if specified)
-    if state is None:
-        images = MicrosoftImagesModel.query.filter(
-            MicrosoftImagesModel.environment == environment_name).order_by(
-            desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
-    else:
-        images = MicrosoftImagesModel.query.filter(
-            MicrosoftImagesModel.environment == environment_name,
-            MicrosoftImagesModel.state == state).order_by(
-            desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+    # select all images with matching environment and state (if specified)
+    images = [i for i in get_table_snapshot(MicrosoftImagesModel)
+              if i.environment == environment_name]
+    if state is not None:
+        state = ImageState(state)
+        images = [i for i in images if i.state == state]
 
-    return images
+    return filter_images(MicrosoftImagesModel, images)
 
 
 def query_provider_images_for_region_and_state(provider, region, state):
@@ -439,14 +1342,19 @@ def query_provider_images_for_region_and_state(provider, region, state):
         images = _get_azure_images_for_region_state(provider, region, state)
 
     elif (hasattr(PROVIDER_IMAGES_MODEL_MAP[provider], 'region')):
-        images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
-            PROVIDER_IMAGES_MODEL_MAP[provider].region == region,
-            PROVIDER_IMAGES_MODEL_MAP[provider].state == state).order_by(
-            desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+        state = ImageState(state)
+        images = filter_images(
+            PROVIDER_IMAGES_MODEL_MAP[provider],
+            [i for i in get_table_snapshot(
+                 PROVIDER_IMAGES_MODEL_MAP[provider])
+             if i.region == region and i.state == state])
     else:
-        images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
-            PROVIDER_IMAGES_MODEL_MAP[provider].state == state).order_by(
-            desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+        state = ImageState(state)
+        images = filter_images(
+            PROVIDER_IMAGES_MODEL_MAP[provider],
+            [i for i in get_table_snapshot(
+                 PROVIDER_IMAGES_MODEL_MAP[provider])
+             if i.state == state])
 
     return images
 
@@ -463,23 +1371,27 @@ def get_provider_images_for_region_and_state(provider, region, state):
 
 
 def get_provider_images_for_state(provider, state):
-    images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
-        PROVIDER_IMAGES_MODEL_MAP[provider].state == state).order_by(
-        desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+    state = ImageState(state)
+    images = filter_images(
+        PROVIDER_IMAGES_MODEL_MAP[provider],
+        [i for i in get_table_snapshot(PROVIDER_IMAGES_MODEL_MAP[provider])
+         if i.state == state])
     return trim_images_payload(
                 formatted_provider_images(provider, images))
 
 
-def _get_azure_deprecatedby_images_for_region(provider, deprecatedby, region):
+def _get_azure_deletedby_images_for_region(provider, deletedby, region):
     environment_name = _get_azure_environment_name_for_region(region)
 
     # query all images with matching environment, in the deprecated
-    # state, with a deprecatedon date <= deprecatedby.
-    images = MicrosoftImagesModel.query.filter(
+    # state, with a deletion date before deletedby.
+    images = db_session.execute(select_model_rows(
+        MicrosoftImagesModel, get_requested_fields()).where(
         MicrosoftImagesModel.environment == environment_name,
         MicrosoftImagesModel.state == ImageState.deprecated,
-        MicrosoftImagesModel.deprecatedon < deprecatedby,
-    ).order_by(desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+        get_deletiondate_column(MicrosoftImagesModel) < deletedby,
+        *get_image_filter_conditions(MicrosoftImagesModel)
+    ).order_by(desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon))).all()
 
 
     return images
@@ -489,35 +1401,40 @@ def query_deletedby_images_in_provider_region(
         deletedby, provider, region=None
     ):
 
-    # get provider specific relative delta for deletions
-    deletion_delta = get_deletion_relative_delta(provider)
-
-    # calculate deprecatedby data associated with deletedby date
-    deprecatedby = deletedby - deletion_delta
+    # the expected deletion dates of the images are maintained by the
+    # data update, so the images to be deleted are a range of them
+    deletiondate = get_deletiondate_column(PROVIDER_IMAGES_MODEL_MAP[provider])
 
     images = None
 
     if region:
         # microsoft needs special handling for region queries
         if provider == 'microsoft':
-            images = _get_azure_deprecatedby_images_for_region(provider,
-                                                               deprecatedby,
-                                                               region)
+            images = _get_azure_deletedby_images_for_region(provider,
+                                                            deletedby,
+                                                            region)
         # if provider images table has region column retrieve matching images
         elif hasattr(PROVIDER_IMAGES_MODEL_MAP[provider], 'region'):
-            images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
+            images = db_session.execute(select_model_rows(
+                PROVIDER_IMAGES_MODEL_MAP[provider],
+                get_requested_fields()).where(
                 PROVIDER_IMAGES_MODEL_MAP[provider].region == region,
                 PROVIDER_IMAGES_MODEL_MAP[provider].state == ImageState.deprecated,
-                PROVIDER_IMAGES_MODEL_MAP[provider].deprecatedon < deprecatedby,
-            ).order_by(asc(PROVIDER_IMAGES_MODEL_MAP[provider].deletedon)).all()
+                deletiondate < deletedby,
+                *get_image_filter_conditions(
+                    PROVIDER_IMAGES_MODEL_MAP[provider])
+            ).order_by(asc(PROVIDER_IMAGES_MODEL_MAP[provider].deletedon))).all()
 
     # if region was not specified, or provider wasn't microsoft or
     # provider images table doesn't have a region column
     if images is None:
-        images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
+        images = db_session.execute(select_model_rows(
+            PROVIDER_IMAGES_MODEL_MAP[provider],
+            get_requested_fields()).where(
             PROVIDER_IMAGES_MODEL_MAP[provider].state == ImageState.deprecated,
-            PROVIDER_IMAGES_MODEL_MAP[provider].deprecatedon < deprecatedby,
-        ).order_by(desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+            deletiondate < deletedby,
+            *get_image_filter_conditions(PROVIDER_IMAGES_MODEL_MAP[provider])
+        ).order_by(desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon))).all()
 
     return images
 
@@ -534,106 +1451,150 @@ def get_provider_images_to_be_deletedby(deletedby, provider, region=None):
                                      extra_attrs=extra_attrs)
 
 
-def _query_image_in_azure_region(image_name, provider, region):
-    # lookup environment for given region, assuming unique per region
-    environment_name = _get_azure_environment_name_for_region(region)
-
-    # retrieve matching images for region
-    images = MicrosoftImagesModel.query.filter(
-        MicrosoftImagesModel.environment == environment_name,
-        MicrosoftImagesModel.name == image_name).order_by(
-        desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
-
-    return images
-
-
-def query_image_in_provider_region(image_name, provider, region=None):
-    images = None
-
+def _query_deletedby_images_in_provider(deletedby, provider):
+    # NOTE: this runs in a deletedby worker thread, where db_session is the
+    # thread's own session, which is removed when the copied request
+    # context, and so its app context, is torn down.
+    return query_deletedby_images_in_provider_region(deletedby, provider)
+
+
+def get_images_to_be_deletedby(deletedby):
+    # the requested fields must be attributes of some provider's images,
+    # and are left out of the images of the providers that lack them
+    fields = get_requested_fields()
+    if fields is not None:
+        valid_fields = set()
+        for provider, model in PROVIDER_IMAGES_MODEL_MAP.items():
+            valid_fields.update(get_serialized_attrs(
+                model, PROVIDER_IMAGES_EXCLUDE_ATTRS.get(provider)))
+        if not fields <= valid_fields:
+            abort(Response('', status=400))
+
+    # each provider's images are queried concurrently, in a copy of the
+    # request context so that the request arguments are available
+    executor = get_deletedby_executor()
+    futures = [(provider, executor.submit(
+                    copy_current_request_context(
+                        _query_deletedby_images_in_provider),
+                    deletedby, provider))
+               for provider in PROVIDER_IMAGES_MODEL_MAP]
+
+    providers = [dict(name=provider,
+                      images=formatted_provider_images(
+                          provider, future.result(), partial_fields=True))
+                 for provider, future in futures]
+    return trim_providers_images_payload(providers)
+
+
+def trim_providers_images_payload(providers):
+    """Trim the images of each provider by the same share of their size
+    so that the combined payload doesn't exceed MAX_PAYLOAD_SIZE."""
+    # NOTE: unlike a single provider's images, which are trimmed by their
+    # compressed size when compressed, the combined images are always
+    # trimmed by their JSON encoded size.
+    max_payload_size = get_max_payload_size()
+    overhead = len(encode_json(
+        {'providers': [dict(p, images=[]) for p in providers]})) + 1
+    sizes = [get_encoded_rows_payload_size(
+                 'images', [encode_json(i) for i in p['images']]) -
+             len(encode_json({'images': []})) - 1
+             for p in providers]
+    payload_size = overhead + sum(sizes)
+    if payload_size <= max_payload_size:
+        return providers
+
+    share = max(max_payload_size - overhead, 0) / (payload_size - overhead)
+    for provider, size in zip(providers, sizes):
+        if provider['images']:
+            provider['images'] = get_trimmed_images(
+                size, math.floor(size * share), provider['images'])
+    return providers
+
+
+def select_image_deletiondate(provider):
+    """Select the number of entries matching an image, and its deletion
+    date, with a single aggregate row per image.
+
+    Depending on provider there may be multiple entries for an image, all
+    of which should have the same state, deprecatedon and deletedon values.
+    Only the deprecated or deleted entries are considered; if any of them
+    is deleted the deletion date is the earliest deletedon date, otherwise
+    it is the earliest deprecatedon date plus the provider specific
+    relative deletion delta. It is NULL if no entry is deprecated or
+    deleted."""
+    model = PROVIDER_IMAGES_MODEL_MAP[provider]
+    expiring = model.state.in_([ImageState.deprecated, ImageState.deleted])
+    deletiondate = case(
+        (func.bool_or(model.state == ImageState.deleted),
+         func.min(model.deletedon).filter(expiring)),
+        else_=cast(func.min(model.deprecatedon).filter(expiring) +
+                   get_deletion_interval(provider), Date))
+    return select(func.count().label('images'),
+                  deletiondate.label('deletiondate'))
+
+
+def where_image_in_provider_region(statement, provider, region=None):
     if region:
-        # microsoft needs special handling for region queries
+        # microsoft needs special handling for region queries, looking up
+        # the environment for the given region, assuming unique per region
         if provider == 'microsoft':
-            images = _query_image_in_azure_region(image_name, provider, region)
+            return statement.where(
+                MicrosoftImagesModel.environment ==
+                _get_azure_environment_name_for_region(region))
         # if provider images table has region column retrieve matching images
-        elif (hasattr(PROVIDER_IMAGES_MODEL_MAP[provider], 'region')):
-            images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
-                PROVIDER_IMAGES_MODEL_MAP[provider].region == region,
-                PROVIDER_IMAGES_MODEL_MAP[provider].name == image_name).order_by(
-                desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+        elif hasattr(PROVIDER_IMAGES_MODEL_MAP[provider], 'region'):
+            return statement.where(
+                PROVIDER_IMAGES_MODEL_MAP[provider].region == region)
 
     # if region was not specified, or provider wasn't microsoft or
     # provider images table doesn't have region column
-    if images is None:
-        images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
-            PROVIDER_IMAGES_MODEL_MAP[provider].name == image_name).order_by(
-            desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+    return statement
 
 
-    return images
+def query_image_in_provider_region(image_name, provider, region=None):
+    return db_session.execute(where_image_in_provider_region(
+        select_image_deletiondate(provider).where(
+            PROVIDER_IMAGES_MODEL_MAP[provider].name == image_name),
+        provider, region)).one()
+
+
+def format_deletiondate(deletiondate):
+    # if no entry is deprecated or deleted the deletion date is empty
+    if deletiondate is None:
+        return ''
+    return deletiondate.strftime(DATE_FORMAT)
 
 
 def get_image_deletiondate_in_provider(image, provider, region=None):
 
-    images = query_image_in_provider_region(image, provider, region)
+    image = query_image_in_provider_region(image, provider, region)
 
     # if no images were found then the provided image name is invalid
-    if len(images) == 0:
+    if image.images == 0:
         abort(Response('', status=404))
 
-    # depending on provider there may be multiple images all of
-    # which should have the same state, deprecatedon and deletedon
-    # values. Use a set to eliminate duplicates, and a namedtuple
-    # helper to create a hashable object.
-    image_set = {DeletionDetails(i.state,
-                                 i.deprecatedon,
-                                 i.deletedon)
-                 for i in images
-                 if i.state in [ImageState.deprecated,
-                                ImageState.deleted]}
-
-    # If we get back multiple sets of results, we should use
-    # the earliest deprecatedon or deletedon date depending on
-    # the found state(s).
-    if len(image_set) > 1:
-        image_states = {i.state for i in image_set}
-        deprecatedon_dates = sorted({i.deprecatedon for i in image_set if i.deprecatedon})
-        if not deprecatedon_dates:
-            deprecatedon_dates = ['']
-        deletedon_dates = sorted({i.deletedon for i in image_set if i.deletedon})
-        if not deletedon_dates:
-            deletedon_dates = ['']
-
-        if ImageState.deleted in image_states:
-            image_state = ImageState.deleted
-        else:
-            image_state = ImageState.deprecated
-
-        image_set = set([DeletionDetails(image_state,
-                                         deprecatedon_dates[0],
-                                         deletedon_dates[0])])
+    return dict(deletiondate=format_deletiondate(image.deletiondate))
 
-    # if image is in not in deprecated/deleted state the image set
-    # will be empty, so the result will be an empty deletiondate.
-    if len(image_set) < 1:
-        result = ""
 
-    else:
-        image = image_set.pop()
+def query_images_in_provider_region(image_names, provider, region=None):
+    """Return the name and the select_image_deletiondate() aggregate of
+    each of the named images found, with a single query."""
+    model = PROVIDER_IMAGES_MODEL_MAP[provider]
+    return db_session.execute(where_image_in_provider_region(
+        select_image_deletiondate(provider).add_columns(model.name).where(
+            model.name.in_(image_names)).group_by(model.name),
+        provider, region)).all()
 
-        # if the image is already in the deleted state return the
-        # deletedon date.
-        if image.state == ImageState.deleted:
-            deletiondate = image.deletedon
-        else:
-            # otherwise calculate the expected deletion date using the
-            # provider specific relative deletion delta
-            deletiondate = image.deprecatedon + get_deletion_relative_delta(
-                                                    provider)
 
-        # result is determined deltion date
-        result = deletiondate.strftime(DATE_FORMAT)
+def get_images_deletiondates_in_provider(image_names, provider, region=None):
+    deletiondates = {image.name: image.deletiondate
+                     for image in query_images_in_provider_region(
+                         image_names, provider, region)}
 
-    return dict(deletiondate=result)
+    # NOTE: unlike a single image request, which fails if the image isn't
+    # found, unknown image names are simply left out of the result.
+    return {name: format_deletiondate(deletiondates[name])
+            for name in image_names if name in deletiondates}
 
 
 def get_provider_servers_for_region(provider, region):
@@ -642,8 +1603,9 @@ def get_provider_servers_for_region(provider, region):
         return _get_azure_servers(region)
 
     if PROVIDER_SERVERS_MODEL_MAP.get(provider) != None:
-        servers = PROVIDER_SERVERS_MODEL_MAP[provider].query.filter(
-            PROVIDER_SERVERS_MODEL_MAP[provider].region == region)
+        servers = [s for s in get_table_snapshot(
+                       PROVIDER_SERVERS_MODEL_MAP[provider])
+                   if s.region == region]
 
     return formatted_provider_servers(provider, servers)
 
@@ -660,9 +1622,10 @@ def get_provider_servers_for_region_and_type(provider, region, server_type):
     if not PROVIDER_SERVERS_MODEL_MAP.get(provider):
         return servers
 
-    servers = PROVIDER_SERVERS_MODEL_MAP[provider].query.filter(
-        PROVIDER_SERVERS_MODEL_MAP[provider].region == region,
-        PROVIDER_SERVERS_MODEL_MAP[provider].type == mapped_server_type)
+    mapped_server_type = ServerType(mapped_server_type)
+    servers = [s for s in get_table_snapshot(
+                   PROVIDER_SERVERS_MODEL_MAP[provider])
+               if s.region == region and s.type == mapped_server_type]
     return formatted_provider_servers(provider, servers)
 
 def get_provider_images_for_region(provider, region):
@@ -673,18 +1636,27 @@ def get_provider_images_for_region(provider, region):
         extra_attrs['region'] = region
 
     elif hasattr(PROVIDER_IMAGES_MODEL_MAP[provider], 'region'):
-        images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
-            PROVIDER_IMAGES_MODEL_MAP[provider].region == region).order_by(
-            desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+        images = filter_images(
+            PROVIDER_IMAGES_MODEL_MAP[provider],
+            [i for i in get_table_snapshot(
+                 PROVIDER_IMAGES_MODEL_MAP[provider])
+             if i.region == region])
     return formatted_provider_images(provider, images, extra_attrs)
 
 
 def get_provider_servers(provider):
     servers = []
     if PROVIDER_SERVERS_MODEL_MAP.get(provider) != None:
-        servers = PROVIDER_SERVERS_MODEL_MAP[provider].query.all()
+        servers = get_table_snapshot(PROVIDER_SERVERS_MODEL_MAP[provider])
     return formatted_provider_servers(provider, servers)
 
+def get_xml_compact():
+    if 'XML_COMPACT' in os.environ:
+        return os.environ.get('XML_COMPACT').lower() in ['1', 'true', 'yes']
+    else:
+        return DEFAULT_XML_COMPACT
+
+
 def get_max_payload_size():
     if 'MAX_PAYLOAD_SIZE' in os.environ:
         return int(os.environ.get('MAX_PAYLOAD_SIZE'))
@@ -692,13 +1664,38 @@ def get_max_payload_size():
         return DEFAULT_MAX_PAYLOAD_SIZE
 
 
+class EncodedRows(list):
+    """A list of formatted rows along with the JSON encoding of each row,
+    so that the rows encoded to determine the payload size don't need to
+    be encoded again to generate the JSON response."""
+
+    def __init__(self, rows, encoded):
+        super().__init__(rows)
+        self.encoded = encoded
+
+
+def encode_json(content):
+    return json.dumps(content, separators=(',', ':'))
+
+
+def get_encoded_rows_payload_size(collection_name, encoded):
+    # the size of jsonify({collection_name: rows}), i.e. the encoded rows
+    # separated by commas, wrapped in the collection and a trailing newline
+    return (len(encode_json({collection_name: []})) + 1 +
+            sum(map(len, encoded)) + max(len(encoded) - 1, 0))
+
+
 def trim_images_payload(images):
-    payload_size = jsonify(images=images).content_length
+    encoded = [encode_json(i) for i in images]
+    payload_size = get_encoded_rows_payload_size('images', encoded)
     max_payload_size = get_max_payload_size()
-    accepted_encodings = acceptable_encodings()
-    if not supported_encoding(accepted_encodings) and (payload_size > max_payload_size):
+    compression_type, _, _ = negotiate_compression()
+    if (compression_type is None and payload_size > max_payload_size and
+            get_page_request() is None):
         images = get_trimmed_images(payload_size, max_payload_size, images)
-    return images
+        # trimming only ever removes rows from the end of the list
+        encoded = encoded[:len(images)]
+    return EncodedRows(images, encoded)
 
 
 def get_trimmed_images(payload_size, max_payload_size, images):
@@ -709,41 +1706,153 @@ def get_trimmed_images(payload_size, max_payload_size, images):
     # trim the same percentage off the list, rounding up to be safe.
     trim_size  = math.ceil(
         ((payload_size - max_payload_size) / payload_size) * len(images))
-    last_publishedon = images[-trim_size]['publishedon']
+    if trim_size >= len(images):
+        return []
+    last_trimmed = images[-trim_size]
     images = images[:-trim_size]
 
+    # the images can only be trimmed individually if their publishedon
+    # dates weren't among the requested fields
+    if 'publishedon' not in last_trimmed:
+        return images
+    last_publishedon = last_trimmed['publishedon']
+
     # Now make sure we don't have partial data by finished triming all the
     # images from all regions that have the same publishedon date that of
     # the last image that got trimmed.
     trim_size = 0
-    while images[-(trim_size + 1)]['publishedon'] == last_publishedon:
+    while (trim_size < len(images) and
+           images[-(trim_size + 1)]['publishedon'] == last_publishedon):
         trim_size += 1
     if trim_size:
         images = images[:-trim_size]
     return images
 
 def get_provider_images(provider):
-    images = PROVIDER_IMAGES_MODEL_MAP[provider].query.filter(
-            PROVIDER_IMAGES_MODEL_MAP[provider].state.in_([
-                ImageState.active,
-                ImageState.inactive,
-                ImageState.deprecated])).order_by(
-        desc(PROVIDER_IMAGES_MODEL_MAP[provider].publishedon)).all()
+    states = [ImageState.active, ImageState.inactive, ImageState.deprecated]
+    images = filter_images(
+        PROVIDER_IMAGES_MODEL_MAP[provider],
+        [i for i in get_table_snapshot(PROVIDER_IMAGES_MODEL_MAP[provider])
+         if i.state in states])
     return trim_images_payload(
                 formatted_provider_images(provider, images))
 
 
 def get_data_version_for_provider_category(provider, category):
     tablename = provider + category
-    try:
-        version = VersionsModel.query.filter(
-            VersionsModel.tablename == tablename).one()
-    except (NoResultFound, MultipleResultsFound):
-        # NOTE(gyee): we should never run into MultipleResultsFound exception
-        # or otherse we have data corruption problem in the database.
+    versions = get_data_versions()
+    if tablename not in versions:
         abort(Response('', status=404))
 
-    return {'version': str(version.version)}
+    return {'version': str(versions[tablename])}
+
+
+def get_requested_image_names():
+    """Return the image names of a batch deletion date request, given as
+    a comma separated list by the names argument or form field, or as a
+    list in the names member of a JSON body."""
+    body = request.get_json(silent=True) if request.method == 'POST' else None
+    if body is not None:
+        names = body.get('names') if isinstance(body, dict) else None
+        if (not isinstance(names, list) or
+                not all(isinstance(n, str) for n in names)):
+            abort(Response('', status=400))
+    else:
+        names = request.values.get('names', '').split(',')
+
+    # drop empty and duplicate names, preserving the requested order
+    names = list(OrderedDict.fromkeys(n for n in names if n))
+    if not names or len(names) > MAX_DELETIONDATE_IMAGES:
+        abort(Response('', status=400))
+    return names
+
+
+def make_deletiondates_response(deletiondates):
+    # a name to date map in JSON, and an element per image in XML
+    if get_response_format() == 'xml':
+        images = [dict(name=name, deletiondate=deletiondate)
+                  for name, deletiondate in deletiondates.items()]
+        return make_response(images, 'deletiondates', 'image')
+    return make_response({'deletiondates': deletiondates}, None, None)
+
+
+def get_changes_since():
+    """Return the data version, given by the since argument, from which
+    the changes made to a table were requested."""
+    if 'since' not in request.args:
+        abort(Response('', status=400))
+    try:
+        since = Decimal(request.args['since'])
+    except InvalidOperation:
+        abort(Response('', status=400))
+    if not since.is_finite():
+        abort(Response('', status=400))
+    return since
+
+
+def query_change_log_base_version(tablename):
+    return db_session.execute(select(change_log_base_table.c.version).where(
+        change_log_base_table.c.tablename == tablename)).scalar()
+
+
+def query_change_log(tablename, since, version):
+    return db_session.execute(select(
+        change_log_table.c.operation,
+        change_log_table.c.version,
+        change_log_table.c.data).where(
+        change_log_table.c.tablename == tablename,
+        change_log_table.c.version > since,
+        change_log_table.c.version <= version).order_by(
+        change_log_table.c.version, change_log_table.c.id)).all()
+
+
+def decode_change_row(model, data):
+    """Return the row tuple select_model_rows() would select for a row
+    with the column values recorded in a change log entry."""
+    columns = {prop.key: prop.columns[0]
+               for prop in inspect(model).column_attrs}
+    row = []
+    for attr in get_model_attrs(model):
+        value = data.get(attr)
+        if value is not None:
+            python_type = columns[attr].type.python_type
+            if issubclass(python_type, datetime.date):
+                value = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+            elif python_type in (ImageState, ServerType, Decimal):
+                value = python_type(value)
+        row.append(value)
+    return tuple(row)
+
+
+def get_provider_changes_since(provider, category, since):
+    if category == 'images':
+        model = PROVIDER_IMAGES_MODEL_MAP.get(provider)
+        exclude_attrs = PROVIDER_IMAGES_EXCLUDE_ATTRS.get(provider)
+    else:
+        model = PROVIDER_SERVERS_MODEL_MAP.get(provider)
+        exclude_attrs = PROVIDER_SERVERS_EXCLUDE_ATTRS.get(provider)
+
+    # NOTE: there are no tables, and so no changes, for some provider
+    # categories
+    versions = get_data_versions()
+    if model is None or model.__tablename__ not in versions:
+        return []
+    version = versions[model.__tablename__]
+    if since >= version:
+        return []
+
+    # the changes since versions that have been pruned from the change
+    # log are gone, so the client must fetch the whole list again
+    base_version = query_change_log_base_version(model.__tablename__)
+    if base_version is None or since < base_version:
+        abort(Response('', status=410))
+
+    serializer = get_row_serializer(model, exclude_attrs)
+    return [serializer(decode_change_row(model, data),
+                       {'operation': operation,
+                        'version': str(change_version)})
+            for operation, change_version, data in query_change_log(
+                model.__tablename__, since, version)]
 
 
 def assert_valid_provider(provider):
@@ -754,7 +1863,7 @@ def assert_valid_provider(provider):
 
 
 def assert_valid_provider_region(provider, region):
-    provider_regions = query_provider_regions(provider)
+    provider_regions = get_provider_registry(provider).region_set
     if region not in provider_regions:
         abort(Response('', status=404))
 
@@ -775,29 +1884,147 @@ def assert_valid_date(date):
 
 
 def acceptable_encodings():
+    """Return the content codings listed in the Accept-Encoding header,
+    mapped to their quality values."""
     accept_encoding = request.headers.get("Accept-Encoding")
     if not accept_encoding:
-        return []
-    return [e.strip() for e in accept_encoding.split(",")]
+        return {}
+
+    encodings = {}
+    for element in accept_encoding.split(","):
+        coding, _, params = element.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        qvalue = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == 'q':
+                try:
+                    qvalue = min(max(float(value.strip()), 0.0), 1.0)
+                except ValueError:
+                    qvalue = None
+        if qvalue is not None:
+            encodings.setdefault(coding, qvalue)
+    return encodings
+
+
+def get_available_content_codings():
+    # zstd and br are only available if the optional libraries are
+    # installed
+    available = []
+    for coding in CONTENT_CODINGS:
+        if coding == 'zstd' and zstandard is None:
+            continue
+        if coding == 'br' and brotli is None:
+            continue
+        available.append(coding)
+    return available
+
+
+def get_compression_preference():
+    if 'COMPRESSION_PREFERENCE' in os.environ:
+        return [c.strip().lower() for c in
+                os.environ.get('COMPRESSION_PREFERENCE').split(',')]
+    else:
+        return DEFAULT_COMPRESSION_PREFERENCE
+
+
+def get_compression_levels(compression_type):
+    levels = []
+    if 'COMPRESSION_LEVELS' in os.environ:
+        for entry in os.environ.get('COMPRESSION_LEVELS').split(','):
+            coding, _, value = entry.partition(':')
+            if coding.strip().lower() == compression_type:
+                level, _, min_size = value.partition('@')
+                levels.append((int(min_size or 0), int(level)))
+    return sorted(levels) or DEFAULT_COMPRESSION_LEVELS[compression_type]
+
+
+def get_compression_level(compression_type, payload_size):
+    """Return the compression level for the size band of the payload."""
+    levels = get_compression_levels(compression_type)
+    level = levels[0][1]
+    for min_size, band_level in levels:
+        if payload_size >= min_size:
+            level = band_level
+    return level
+
+
+def get_compression_min_size():
+    if 'COMPRESSION_MIN_SIZE' in os.environ:
+        return int(os.environ.get('COMPRESSION_MIN_SIZE'))
+    else:
+        return DEFAULT_COMPRESSION_MIN_SIZE
+
+
+def get_response_format():
+    if 'xml' in request.path:
+        return 'xml'
+    return 'json'
+
+
+def negotiate_compression():
+    """Return the compression type and associated Content-Encoding header
+    value to use for the response, or (None, None) if the response should
+    not be compressed, along with the quality value of the identity coding,
+    which is None if the client didn't give one.
+
+    The content coding with the highest quality value in the Accept-Encoding
+    header is used, with ties broken by the server's preference order. The
+    response is not compressed if the client prefers the identity coding,
+    and a 406 is returned if neither it nor any supported coding is
+    acceptable (RFC 9110 section 12.5.3)."""
+    accepted_encodings = acceptable_encodings()
+    if not accepted_encodings:
+        return None, None, None
+
+    wildcard = accepted_encodings.get('*')
+    available = get_available_content_codings()
+    best_coding, best_qvalue = None, 0
+    for coding in get_compression_preference():
+        if coding not in available:
+            continue
+        qvalue = accepted_encodings.get(coding, wildcard) or 0
+        if qvalue > best_qvalue:
+            best_coding, best_qvalue = coding, qvalue
 
+    # the identity coding is always acceptable unless explicitly excluded,
+    # but is only preferred over a content coding if given a higher
+    # quality value
+    identity_qvalue = accepted_encodings.get('identity', wildcard)
+    if best_coding is None or (identity_qvalue is not None and
+                               best_qvalue < identity_qvalue):
+        if identity_qvalue == 0:
+            abort(Response('', status=406))
+        return None, None, identity_qvalue
 
-def supported_encoding(accept_encoding):
-    return (accept_encoding is not None) and any(comp_type in accept_encoding for comp_type in (
-            'bzip2', 'gzip', 'xz'))
+    return best_coding, CONTENT_CODINGS[best_coding], identity_qvalue
 
 
 def make_response_payload(
-        content_dict, collection_name, element_name, charset):
+        content_dict, collection_name, element_name, charset,
+        collection_attrs=None):
     # generate xml or json formatted payload
-    if 'xml' in request.path:
-        payload = json_to_xml(content_dict, collection_name, element_name)
+    if get_response_format() == 'xml':
+        payload = json_to_xml(content_dict, collection_name, element_name,
+                              compact=get_xml_compact(),
+                              collection_attrs=collection_attrs)
         app_type = 'xml'
     else:
-        if collection_name:
-            content = {collection_name: content_dict}
+        if collection_name and isinstance(content_dict, EncodedRows):
+            payload = '{%s:[%s]%s}' % (
+                json.dumps(collection_name), ','.join(content_dict.encoded),
+                ''.join([',%s:%s' % (json.dumps(name), json.dumps(value))
+                         for name, value in
+                         (collection_attrs or {}).items()]))
         else:
-            content = content_dict
-        payload = json.dumps(content, separators=(',', ':'))
+            if collection_name:
+                content = {collection_name: content_dict}
+                content.update(collection_attrs or {})
+            else:
+                content = content_dict
+            payload = encode_json(content)
         app_type = 'json'
 
     # encode the payload with the desired charset
@@ -805,84 +2032,334 @@ def make_response_payload(
     return app_type, payload
 
 
+def is_trimmable_collection(content_dict, collection_name):
+    # only lists of images, sorted by publishedon, can be trimmed, and
+    # pages of them never are
+    return bool(collection_name == 'images' and content_dict and
+                get_page_request() is None)
+
+
 def make_response(content_dict, collection_name, element_name):
 
     charset = 'utf-8'
     content_encoding_header = None
-    app_type, payload = make_response_payload(
-        content_dict, collection_name, element_name, charset)
-    content_type = 'application/%s;charset=%s' % (app_type, charset)
-
-    accepted_encodings = acceptable_encodings()
-    if supported_encoding(accepted_encodings):
-        if 'bzip2' in accepted_encodings:
-            compression_type = 'bz2'
-            content_encoding_header = 'bzip2'
-        elif 'gzip' in accepted_encodings:
-            compression_type = 'gzip'
-            content_encoding_header = 'gzip'
-        elif 'xz' in accepted_encodings:
-            compression_type = 'lzma'
-            content_encoding_header = 'lzma'
-
-        app_type, payload = make_compressed_response(
-            payload, collection_name, element_name, compression_type)
+    content_type = 'application/%s;charset=%s' % (
+        get_response_format(), charset)
+
+    next_cursor = g.get('next_cursor')
+    collection_attrs = {'nextcursor': next_cursor} if next_cursor else None
+
+    compression_type, content_encoding_header, identity_qvalue = (
+        negotiate_compression())
+    if (compression_type == 'gzip' and
+            is_trimmable_collection(content_dict, collection_name)):
+        payload_parts = get_collection_payload_parts(
+            content_dict, collection_name, element_name, charset)
+        opening, parts, closing = payload_parts
+        payload_size = len(opening) + sum(map(len, parts)) + len(closing)
+        app_type = get_response_format()
+        payload = None
+    else:
+        payload_parts = None
+        app_type, payload = make_response_payload(
+            content_dict, collection_name, element_name, charset,
+            collection_attrs)
+        payload_size = len(payload)
+
+    # small payloads aren't worth compressing, unless the client refuses
+    # them uncompressed
+    if (compression_type and identity_qvalue != 0 and
+            payload_size < get_compression_min_size()):
+        compression_type = content_encoding_header = None
+
+    if compression_type:
+        start = time.perf_counter()
+        if payload_parts:
+            app_type = compression_type
+            payload = get_gzip_members_payload(
+                content_dict, payload_parts, collection_name, element_name,
+                charset, get_max_payload_size())
+        else:
+            app_type, payload = make_compressed_response(
+                payload, content_dict, collection_name, element_name,
+                compression_type, charset)
+        log_compression(compression_type, payload_size, len(payload),
+                        time.perf_counter() - start)
+    elif payload is None:
+        payload = b''.join([opening] + parts + [closing])
 
     mimetype = 'application/%s;charset=%s' % (app_type, charset)
     response = Response(payload, mimetype=mimetype)
     if content_encoding_header:
         response.headers["Content-Encoding"] = content_encoding_header
         response.headers["Content-Type"] = content_type
+    if next_cursor:
+        response.headers["Link"] = get_next_page_link(next_cursor)
     return response
 
 
-def make_compressed_response(
-        payload, collection_name, element_name, compression_type):
-     uncompressed_payload = payload
-     payload = get_compressed_payload(payload, compression_type)
-     max_payload_size = get_max_payload_size()
+def log_compression(compression_type, payload_size, compressed_size,
+                    elapsed):
+    # NOTE: the ratio is against the whole payload, so it includes the
+    # effect of trimming the payload to MAX_PAYLOAD_SIZE
+    app.logger.info(
+        '%s compressed %d bytes to %d bytes with %s level %d: '
+        'ratio=%.3f time=%.1fms', request.path, payload_size,
+        compressed_size, compression_type,
+        get_compression_level(compression_type, payload_size),
+        compressed_size / payload_size, elapsed * 1000)
 
-     # Check length of compressed payload
-     if len(payload) > max_payload_size:
-         max_size = get_max_payload_for_limit(
-             uncompressed_payload, max_payload_size)
 
-         # Trim the payload so that compressed data does not exceed
-         # MAX_PAYLOAD_SIZE limit
-         trimmed_payload = get_trimmed_images(
-             len(uncompressed_payload), max_size, content_dict)
+def make_compressed_response(payload, content_dict, collection_name,
+                             element_name, compression_type, charset):
+    uncompressed_payload = payload
+    payload = get_compressed_payload(payload, compression_type)
+    max_payload_size = get_max_payload_size()
 
-         app_type, temp_payload = make_response_payload(
-             trimmed_payload, collection_name, element_name, charset)
-         payload = get_compressed_payload(temp_payload, compression_type)
+    # Check length of compressed payload, trimming the images so that the
+    # compressed data does not exceed MAX_PAYLOAD_SIZE limit
+    if (len(payload) > max_payload_size and
+            is_trimmable_collection(content_dict, collection_name)):
+        payload = get_trimmed_compressed_payload(
+            content_dict, collection_name, element_name, compression_type,
+            charset, max_payload_size,
+            len(payload) / len(uncompressed_payload))
 
-     app_type = compression_type
-     return app_type, payload
+    app_type = compression_type
+    return app_type, payload
 
 
-def get_compressed_payload(payload, compression_type):
-    if compression_type == "bz2":
-        payload = bz2.compress(payload, compresslevel=9)
+def get_compressed_payload(payload, compression_type, level=None):
+    if level is None:
+        level = get_compression_level(compression_type, len(payload))
+    if compression_type == "bzip2":
+        payload = bz2.compress(payload, compresslevel=level)
     elif compression_type == "gzip":
-        payload = gzip.compress(payload, compresslevel=9)
-    elif compression_type == "lzma":    
-        payload = lzma.compress(payload, preset=9)
+        # NOTE: use a fixed mtime so that the same payload always
+        # compresses to the same bytes. gzip.compress() only accepts an
+        # mtime from Python 3.8 onwards.
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level,
+                           mtime=0) as gz:
+            gz.write(payload)
+        payload = buf.getvalue()
+    elif compression_type == "xz":
+        payload = lzma.compress(payload, preset=level)
+    elif compression_type == "zstd":
+        payload = zstandard.ZstdCompressor(level=level).compress(payload)
+    elif compression_type == "br":
+        payload = brotli.compress(payload, quality=level)
 
     return payload
 
 
-# Estimates how much payload data can fit under MAX_PAYLOAD_SIZE compressed limit
-def get_max_payload_for_limit(payload, limit_bytes):
-    low, high = 0, len(payload)
-    while low < high:
-        mid = (low + high) // 2
-        compressed = get_compressed_payload(payload[:mid], compression_type)
-        if len(compressed) <= limit_bytes:
-            low = mid + 1
+class BrotliStreamCompressor:
+    """Wrap a brotli compressor with the same interface as the other
+    stream compressors."""
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+def get_stream_compressor(compression_type, level):
+    # NOTE: these produce the same output as get_compressed_payload() when
+    # given the same data and level
+    if compression_type == "bzip2":
+        return bz2.BZ2Compressor(level)
+    elif compression_type == "xz":
+        return lzma.LZMACompressor(preset=level)
+    elif compression_type == "zstd":
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    elif compression_type == "br":
+        return BrotliStreamCompressor(level)
+
+
+def get_collection_payload_parts(rows, collection_name, element_name,
+                                 charset):
+    """Return the encoded opening, per row and closing parts that make up
+    the same payload as make_response_payload() for a non-empty
+    collection, so that the payload can be generated a row at a time."""
+    if get_response_format() == 'xml':
+        indent, newl = ('', '') if get_xml_compact() else ('  ', '\n')
+        opening = '<?xml version="1.0" ?>%s<%s>%s' % (
+            newl, collection_name, newl)
+        parts = [_xml_element(element_name, r, indent, newl) for r in rows]
+        closing = '</%s>%s' % (collection_name, newl)
+    else:
+        opening = '{%s:[' % json.dumps(collection_name)
+        if isinstance(rows, EncodedRows):
+            parts = list(rows.encoded)
         else:
-            high = mid
-    truncated = payload[:low-1]
-    return len(truncated)
+            parts = [encode_json(r) for r in rows]
+        parts[1:] = [',' + p for p in parts[1:]]
+        closing = ']}'
+    return (opening.encode(charset), [p.encode(charset) for p in parts],
+            closing.encode(charset))
+
+
+def get_publishedon_group_ends(rows):
+    # rows are sorted by publishedon, so each publishedon date is a
+    # contiguous group of rows, unless the publishedon dates weren't among
+    # the requested fields, in which case each row is a group of its own
+    if 'publishedon' not in rows[0]:
+        return list(range(1, len(rows) + 1))
+    ends = []
+    for index in range(1, len(rows)):
+        if rows[index]['publishedon'] != rows[index - 1]['publishedon']:
+            ends.append(index)
+    ends.append(len(rows))
+    return ends
+
+
+def get_trimmed_compressed_payload(rows, collection_name, element_name,
+                                   compression_type, charset,
+                                   max_payload_size, compression_ratio):
+    """Return the compressed payload for the longest run of whole
+    publishedon date groups of rows whose compressed size fits within
+    max_payload_size.
+
+    The payload is fed to a single streaming compressor a group at a time.
+    bzip2, xz, zstd and brotli compressors can't be copied, and flushing
+    them mid-stream would hurt the compression ratio, so the size is
+    estimated from the compression ratio, re-running with a lower estimated
+    ratio in the rare case the result is too large.
+    NOTE: gzip payloads are trimmed by get_gzip_members_payload() instead.
+    """
+    opening, parts, closing = get_collection_payload_parts(
+        rows, collection_name, element_name, charset)
+    group_ends = get_publishedon_group_ends(rows)
+    # use the level for the whole payload, which the compression ratio
+    # was measured with
+    level = get_compression_level(
+        compression_type,
+        len(opening) + sum(map(len, parts)) + len(closing))
+
+    while True:
+        compressor = get_stream_compressor(compression_type, level)
+        output = [compressor.compress(opening)]
+        input_size = len(opening) + len(closing)
+        kept = 0
+        for end in group_ends:
+            data = b''.join(parts[kept:end])
+            if (input_size + len(data)) * compression_ratio > max_payload_size:
+                break
+            output.append(compressor.compress(data))
+            input_size += len(data)
+            kept = end
+
+        if not kept:
+            _, payload = make_response_payload(
+                [], collection_name, element_name, charset)
+            return get_compressed_payload(payload, compression_type)
+
+        output.append(compressor.compress(closing))
+        output.append(compressor.flush())
+        payload = b''.join(output)
+        if len(payload) <= max_payload_size:
+            return payload
+
+        # the estimated compression ratio was too optimistic
+        compression_ratio *= len(payload) / max_payload_size * 1.01
+
+
+def get_gzip_member(data, level):
+    key = (hashlib.sha1(data).digest(), level)
+    member = gzip_member_cache.get(key)
+    if member is None:
+        member = get_compressed_payload(data, 'gzip', level)
+        gzip_member_cache.put(key, member, get_gzip_member_cache_max_size())
+    return member
+
+
+def get_gzip_members_payload(rows, payload_parts, collection_name,
+                             element_name, charset, max_payload_size):
+    """Return the gzip compressed payload for the rows, given their
+    get_collection_payload_parts(), as a series of gzip members, which
+    decompress as a single stream. Each member holds whole publishedon date
+    groups of rows, so that trimming the payload to max_payload_size only
+    needs to drop members from the end, and the compressed members are
+    cached for reuse by other responses."""
+    opening, parts, closing = payload_parts
+    # all members use the level for the whole payload
+    level = get_compression_level(
+        'gzip', len(opening) + sum(map(len, parts)) + len(closing))
+    opening = get_gzip_member(opening, level)
+    closing = get_gzip_member(closing, level)
+
+    members = []
+    block = []
+    block_size = start = 0
+    for end in get_publishedon_group_ends(rows):
+        block.extend(parts[start:end])
+        block_size += sum(map(len, parts[start:end]))
+        start = end
+        if block_size >= GZIP_MEMBER_MIN_SIZE or end == len(rows):
+            members.append(get_gzip_member(b''.join(block), level))
+            block = []
+            block_size = 0
+
+    payload_size = len(opening) + len(closing)
+    for kept, member in enumerate(members):
+        if payload_size + len(member) > max_payload_size:
+            members = members[:kept]
+            break
+        payload_size += len(member)
+
+    if not members:
+        _, payload = make_response_payload(
+            [], collection_name, element_name, charset)
+        return get_compressed_payload(payload, 'gzip')
+
+    return b''.join([opening] + members + [closing])
+
+
+@app.before_request
+def lookup_cached_response():
+    g.response_cache_key = None
+    g.response_cached = False
+    if request.method != 'GET' or not request.path.startswith('/v1/'):
+        return None
+
+    g.response_cache_key = cache_key = get_response_cache_key()
+    cached = None
+    if get_response_cache_max_size() > 0:
+        cached = response_cache.get(cache_key)
+
+    # the client already has the current response so there is no need
+    # to generate it again.
+    if is_not_modified(cache_key, cached is not None):
+        return Response('', status=304,
+                        headers=get_conditional_headers(cache_key))
+
+    if cached is None:
+        return None
+
+    g.response_cached = True
+    return Response(cached.payload, headers=cached.headers)
+
+
+@app.after_request
+def save_cached_response(response):
+    cache_key = g.get('response_cache_key')
+    if cache_key is None or response.status_code != 200:
+        return response
+
+    response.headers.update(get_conditional_headers(cache_key))
+
+    max_size = get_response_cache_max_size()
+    if not g.response_cached and max_size > 0:
+        headers = {h: response.headers[h]
+                   for h in CACHED_RESPONSE_HEADERS if h in response.headers}
+        response_cache.put(cache_key,
+                           CachedResponse(response.get_data(), headers),
+                           max_size)
+    return response
 
 
 @app.route('/v1/providers', methods=['GET'])
@@ -967,6 +2444,31 @@ def get_image_deletiondate_for_provider_region(provider, region, image):
     return make_response(deletiondate, None, None)
 
 
+@app.route('/v1/<provider>/<region>/images/deletiondate',
+           methods=['GET', 'POST'])
+@app.route('/v1/<provider>/<region>/images/deletiondate.json',
+           methods=['GET', 'POST'])
+@app.route('/v1/<provider>/<region>/images/deletiondate.xml',
+           methods=['GET', 'POST'])
+def get_images_deletiondates_for_provider_region(provider, region):
+    assert_valid_provider(provider)
+    assert_valid_provider_region(provider, region)
+    names = get_requested_image_names()
+    deletiondates = get_images_deletiondates_in_provider(names, provider,
+                                                         region)
+    return make_deletiondates_response(deletiondates)
+
+
+@app.route('/v1/<provider>/images/deletiondate', methods=['GET', 'POST'])
+@app.route('/v1/<provider>/images/deletiondate.json', methods=['GET', 'POST'])
+@app.route('/v1/<provider>/images/deletiondate.xml', methods=['GET', 'POST'])
+def get_images_deletiondates_for_provider(provider):
+    assert_valid_provider(provider)
+    names = get_requested_image_names()
+    deletiondates = get_images_deletiondates_in_provider(names, provider)
+    return make_deletiondates_response(deletiondates)
+
+
 @app.route('/v1/<provider>/images/deletiondate/<image>', methods=['GET'])
 @app.route('/v1/<provider>/images/deletiondate/<image>.json', methods=['GET'])
 @app.route('/v1/<provider>/images/deletiondate/<image>.xml', methods=['GET'])
@@ -999,22 +2501,14 @@ def list_images_deletedby_for_provider(provider, date):
     return make_response(images, 'images', 'image')
 
 
-# TODO(rtamalin):
-#   Re-enable global deletedby request once make_response has been
-#   updated to generate validly formated XML responses.
-#@app.route('/v1/images/deletedby/<date>', methods=['GET'])
-#@app.route('/v1/images/deletedby/<date>.json', methods=['GET'])
-#@app.route('/v1/images/deletedby/<date>.xml', methods=['GET'])
-#def list_images_deletedby(date):
-#    assert_valid_date(date)
-#    deletedby = get_datetime_date(date)
-#    provider_images = {}
-#    providers = []
-#    for provider in PROVIDER_IMAGES_MODEL_MAP.keys():
-#        providers.append(dict(name=provider,
-#            images=get_provider_images_to_be_deletedby(deletedby,
-#                                                       provider)))
-#    return make_response(providers, 'providers', 'provider')
+@app.route('/v1/images/deletedby/<date>', methods=['GET'])
+@app.route('/v1/images/deletedby/<date>.json', methods=['GET'])
+@app.route('/v1/images/deletedby/<date>.xml', methods=['GET'])
+def list_images_deletedby(date):
+    assert_valid_date(date)
+    deletedby = get_datetime_date(date)
+    providers = get_images_to_be_deletedby(deletedby)
+    return make_response(providers, 'providers', 'provider')
 
 
 @app.route('/v1/<provider>/images/<state>', methods=['GET'])
@@ -1060,6 +2554,28 @@ def get_provider_category_data_version(provider):
     return make_response(version, None, None)
 
 
+# NOTE: the changes routes are explicit for each category, as otherwise
+# the images/<state> and servers/<server_type> routes would match them.
+@app.route('/v1/<provider>/images/changes', methods=['GET'])
+@app.route('/v1/<provider>/images/changes.json', methods=['GET'])
+@app.route('/v1/<provider>/images/changes.xml', methods=['GET'])
+def list_provider_images_changes(provider):
+    assert_valid_provider(provider)
+    since = get_changes_since()
+    changes = get_provider_changes_since(provider, 'images', since)
+    return make_response(changes, 'changes', 'change')
+
+
+@app.route('/v1/<provider>/servers/changes', methods=['GET'])
+@app.route('/v1/<provider>/servers/changes.json', methods=['GET'])
+@app.route('/v1/<provider>/servers/changes.xml', methods=['GET'])
+def list_provider_servers_changes(provider):
+    assert_valid_provider(provider)
+    since = get_changes_since()
+    changes = get_provider_changes_since(provider, 'servers', since)
+    return make_response(changes, 'changes', 'change')
+
+
 @app.route('/package-version', methods=['GET'])
 def get_package_version():
     return make_response(
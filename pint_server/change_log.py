@@ -0,0 +1,127 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Change log of the rows added, updated and removed by each data update
+of the versioned provider tables.
+
+The changelog table holds a row for each change, recording the version
+of the table the change was made in, and the column values of the changed
+row; after the change for added and updated rows, or before it for
+removed rows. The changelogbase table records, for each table, the version
+the changelog is complete from, i.e. the changes since any later version
+can be found in the changelog.
+"""
+
+import datetime
+import enum
+import logging
+from decimal import Decimal
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+LOG = logging.getLogger(__name__)
+
+CHANGE_OPERATIONS = ['added', 'updated', 'removed']
+
+# by default the changes made by the last 30 versions of each table are
+# kept in the changelog
+DEFAULT_CHANGE_LOG_RETENTION = 30
+
+metadata = sa.MetaData()
+
+change_log_table = sa.Table(
+    'changelog', metadata,
+    sa.Column('id', sa.BigInteger, sa.Sequence('changelog_id_seq'),
+              primary_key=True),
+    sa.Column('tablename', sa.String(100), nullable=False),
+    sa.Column('version', sa.Numeric, nullable=False),
+    sa.Column('operation', sa.Enum(*CHANGE_OPERATIONS,
+                                   name='change_operation'),
+              nullable=False),
+    sa.Column('data', postgresql.JSONB, nullable=False),
+    sa.Index('ix_changelog_tablename_version_id', 'tablename', 'version',
+             'id'))
+
+change_log_base_table = sa.Table(
+    'changelogbase', metadata,
+    sa.Column('tablename', sa.String(100), primary_key=True),
+    sa.Column('version', sa.Numeric, nullable=False))
+
+
+def encode_row(row):
+    """Return the column values of the given model instance as a JSON
+    serializable dict."""
+    data = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        if isinstance(value, enum.Enum):
+            value = value.value
+        elif isinstance(value, datetime.date):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        data[column.key] = value
+    return data
+
+
+def record_changes(db, tablename, previous_version, version, changes):
+    """Record the (operation, model instance) changes made to the table
+    in the given version, which was previously at previous_version, or
+    None if the table had no version."""
+    # assign any generated column values, e.g. ids, of added rows
+    db.flush()
+
+    # the changelog of a table is complete from the version preceding
+    # the first changes it records
+    base = db.execute(sa.select(change_log_base_table.c.version).where(
+        change_log_base_table.c.tablename == tablename)).first()
+    if base is None:
+        db.execute(change_log_base_table.insert().values(
+            tablename=tablename, version=previous_version or 0))
+
+    LOG.info("Recording %d changes for table %s in version %s",
+             len(changes), repr(tablename), repr(version))
+    db.execute(change_log_table.insert(), [
+        dict(tablename=tablename, version=version, operation=operation,
+             data=encode_row(row))
+        for operation, row in changes])
+
+
+def prune_change_log(db, retention=DEFAULT_CHANGE_LOG_RETENTION):
+    """Remove the changes made by all but the last retention versions of
+    each table from the changelog."""
+    bases = db.execute(sa.select(change_log_base_table)).all()
+    for tablename, base_version in bases:
+        # the oldest version whose changes are removed
+        cutoff = db.execute(
+            sa.select(change_log_table.c.version).distinct().where(
+                change_log_table.c.tablename == tablename).order_by(
+                change_log_table.c.version.desc()).offset(
+                retention).limit(1)).scalar()
+        if cutoff is None:
+            continue
+
+        LOG.info("Pruning changes up to version %s for table %s",
+                 repr(cutoff), repr(tablename))
+        db.execute(change_log_table.delete().where(
+            change_log_table.c.tablename == tablename,
+            change_log_table.c.version <= cutoff))
+        db.execute(change_log_base_table.update().where(
+            change_log_base_table.c.tablename == tablename).values(
+            version=cutoff))
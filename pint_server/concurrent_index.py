@@ -0,0 +1,160 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Online index builds for the schema migrations.
+
+A plain CREATE INDEX blocks writes to the table until the index is built,
+and, as the migrations run within a transaction, holds its locks until the
+transaction ends, stalling the live API for the duration of the upgrade.
+The operations provided here instead build and drop indexes CONCURRENTLY,
+outside of the migration's transaction, which commits any preceding
+changes. For example:
+
+    from pint_server.concurrent_index import create_index_concurrently
+
+    def upgrade():
+        create_index_concurrently('ix_amazonimages_name', 'amazonimages',
+                                  ['name'])
+
+The progress of an index build is reported, from
+pg_stat_progress_create_index, every index_progress_interval seconds, which
+can be set in the Alembic config attributes.
+
+A failed concurrent build leaves an invalid index behind, which is dropped,
+so that the migration can be safely retried. An invalid index left behind
+by an interrupted migration is likewise dropped, and rebuilt, when the
+migration is retried, while an existing valid index is kept as is.
+"""
+
+import logging
+import threading
+
+from alembic import op
+import sqlalchemy as sa
+
+
+LOG = logging.getLogger(__name__)
+
+# by default the progress of an index build is reported every 30 seconds
+DEFAULT_INDEX_PROGRESS_INTERVAL = 30
+
+
+def get_index_progress_interval(context):
+    environment = context.environment_context
+    if environment is not None and environment.config is not None:
+        return environment.config.attributes.get(
+            'index_progress_interval', DEFAULT_INDEX_PROGRESS_INTERVAL)
+    return DEFAULT_INDEX_PROGRESS_INTERVAL
+
+
+def get_index_valid(connection, index_name):
+    """Return whether the named index is valid, or None if there is no
+    such index."""
+    return connection.execute(
+        sa.text("SELECT indisvalid FROM pg_index "
+                "WHERE indexrelid = to_regclass(:index_name)"),
+        dict(index_name=index_name)).scalar()
+
+
+class IndexBuildProgress:
+    """Context manager reporting the progress of the index build run by
+    the given connection, from a separate connection, every interval
+    seconds until exited."""
+
+    def __init__(self, connection, index_name, interval):
+        self._engine = connection.engine
+        self._pid = connection.execute(
+            sa.text("SELECT pg_backend_pid()")).scalar()
+        self._index_name = index_name
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._report, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def _report(self):
+        try:
+            with self._engine.connect() as connection:
+                while not self._stopped.wait(self._interval):
+                    progress = connection.execute(
+                        sa.text("SELECT phase, blocks_done, blocks_total, "
+                                "tuples_done, tuples_total "
+                                "FROM pg_stat_progress_create_index "
+                                "WHERE pid = :pid"),
+                        dict(pid=self._pid)).first()
+                    if progress is not None:
+                        LOG.info("Building index %s: %s, blocks %d/%d, "
+                                 "tuples %d/%d", repr(self._index_name),
+                                 *progress)
+        except Exception as e:
+            # the progress report is informational only
+            LOG.warning("Failed to report the progress of index %s: %s",
+                        repr(self._index_name), e)
+
+
+def drop_invalid_index(connection, index_name):
+    LOG.warning("Dropping invalid index %s", repr(index_name))
+    connection.execute(sa.text(
+        "DROP INDEX CONCURRENTLY IF EXISTS %s" %
+        connection.dialect.identifier_preparer.quote(index_name)))
+
+
+def create_index_concurrently(index_name, table_name, columns, **kw):
+    """Create the index, as op.create_index() does, without blocking
+    writes to the table."""
+    context = op.get_context()
+    with context.autocommit_block():
+        if context.as_sql:
+            op.create_index(index_name, table_name, columns,
+                            postgresql_concurrently=True, **kw)
+            return
+
+        connection = context.connection
+        valid = get_index_valid(connection, index_name)
+        if valid:
+            LOG.info("Index %s already exists", repr(index_name))
+            return
+        if valid is not None:
+            # left behind by a failed build
+            drop_invalid_index(connection, index_name)
+
+        LOG.info("Building index %s on table %s", repr(index_name),
+                 repr(table_name))
+        try:
+            with IndexBuildProgress(connection, index_name,
+                                    get_index_progress_interval(context)):
+                op.create_index(index_name, table_name, columns,
+                                postgresql_concurrently=True, **kw)
+        except Exception:
+            if get_index_valid(connection, index_name) is False:
+                drop_invalid_index(connection, index_name)
+            raise
+
+
+def drop_index_concurrently(index_name):
+    """Drop the index, if it exists, without blocking access to the
+    table."""
+    context = op.get_context()
+    with context.autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS %s" %
+                   context.dialect.identifier_preparer.quote(index_name))
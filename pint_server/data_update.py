@@ -15,8 +15,10 @@
 # To contact SUSE about this file by physical or electronic mail,
 # you may find current contact information at www.suse.com
 
-from datetime import datetime
+from datetime import date, datetime
 from lxml import etree
+import enum
+import ipaddress
 from urllib.parse import quote_plus
 import argparse
 import click
@@ -27,6 +29,10 @@ import re
 import subprocess
 import sys
 
+from sqlalchemy import and_, exists, literal_column, or_, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql import column, table
+
 from pint_models.database import init_db
 from pint_models.models import (
             AlibabaImagesModel,
@@ -42,6 +48,12 @@ from pint_models.models import (
             ServerType,
             VersionsModel
         )
+from pint_server.change_log import (
+            DEFAULT_CHANGE_LOG_RETENTION,
+            prune_change_log,
+            record_changes
+        )
+from pint_server.deletion_date import update_deletiondates
 
 class DataUpdateError(Exception):
     pass
@@ -206,7 +218,79 @@ IDENTITY_OVERRIDES = {
         c.name for c in MicrosoftImagesModel.unique_constraints()[0]]
 }
 
-def orm_update_table(db, provider, table_name, table_rows, version):
+# The servers tables store their addresses as INET values, which the DB
+# compares by address, rather than by how they are written.
+INET_FIELDS = ['ip', 'ipv6']
+
+# The number of added and updated entries written to the DB at a time
+UPDATE_BATCH_SIZE = 1000
+
+# The servers tables have partial unique indexes on the region and each
+# of the ip and ipv6 addresses, covering the entries that have one.
+SERVERS_MERGE_KEYS = [
+    (['region', 'ip'], 'ip IS NOT NULL'),
+    (['region', 'ipv6'], 'ipv6 IS NOT NULL'),
+]
+
+# Per-table (fields, index condition) unique keys, in order of preference,
+# on which the copy engine merges rows into existing entries, rather than
+# the primary key fields.
+MERGE_KEY_OVERRIDES = {
+    MicrosoftImagesModel.__name__: [
+        (IDENTITY_OVERRIDES[MicrosoftImagesModel.__name__], None)],
+    AmazonServersModel.__name__: SERVERS_MERGE_KEYS,
+    GoogleServersModel.__name__: SERVERS_MERGE_KEYS,
+    MicrosoftServersModel.__name__: SERVERS_MERGE_KEYS,
+}
+
+
+def get_search_value(field, value):
+    if field in INET_FIELDS and value is not None:
+        return ipaddress.ip_interface(value)
+    return value
+
+
+class ExistingEntries:
+    """The existing entries of a table, loaded with a single query, which
+    are looked up by the search data, i.e. the values of a set of fields,
+    in the same way that the DB would match them."""
+
+    def __init__(self, db, model):
+        self._entries = db.query(model).all()
+        # the entries indexed by search data values, for each set of
+        # search data fields
+        self._indexes = {}
+
+    def _index(self, fields):
+        index = self._indexes.get(fields)
+        if index is None:
+            index = {}
+            for entry in self._entries:
+                index.setdefault(self._key(fields, entry), entry)
+            self._indexes[fields] = index
+        return index
+
+    @staticmethod
+    def _key(fields, entry):
+        return tuple(get_search_value(f, getattr(entry, f)) for f in fields)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, search_data):
+        fields = tuple(sorted(search_data))
+        return self._index(fields).get(
+            tuple(get_search_value(f, search_data[f]) for f in fields))
+
+    def add(self, entry):
+        self._entries.append(entry)
+        for fields, index in self._indexes.items():
+            index.setdefault(self._key(fields, entry), entry)
+
+
+def get_table_model(provider, table_name):
+    """Return the model of the provider's table, and whether the table
+    is versioned."""
     if table_name == "regionmap":
         table_name_caps = "RegionMap"
         need_version = False
@@ -218,6 +302,11 @@ def orm_update_table(db, provider, table_name, table_rows, version):
     LOG.debug("Using model %s for provider %s table %s",
                  repr(model.__name__), repr(provider),
                  repr(table_name))
+    return model, need_version
+
+
+def orm_update_table(db, provider, table_name, table_rows, version):
+    model, need_version = get_table_model(provider, table_name)
 
     # fields used to identify a matching existing entry
     identity_fields = IDENTITY_OVERRIDES.get(model.__name__, [])
@@ -225,11 +314,21 @@ def orm_update_table(db, provider, table_name, table_rows, version):
         LOG.debug("For %s using %s instead of primary key fields for "
                   "existing entry checking", repr(model.__name__),
                   repr(identity_fields))
+    primary_key_fields = {c.name for c in
+                          model.__table__.primary_key.columns}
+
+    # NOTE: rather than querying for each row's existing entry, the whole
+    # table is loaded once and the rows are matched against it in memory.
+    existing_entries = ExistingEntries(db, model)
+    LOG.debug("Loaded %d existing entries for model %s",
+              len(existing_entries), repr(model.__name__))
 
     LOG.debug("Attempting to add %d new entries for model %s",
                  len(table_rows), repr(model.__name__))
     rows_added = 0
     rows_updated = 0
+    # (operation, row) changes to be recorded in the change log
+    changes = []
     for row_data in table_rows:
         # if identity_fields overrides have been specified use those
         # fields to construct the search_data that will be used to
@@ -239,8 +338,7 @@ def orm_update_table(db, provider, table_name, table_rows, version):
             search_data = {k:row_data[k] for k in identity_fields}
         else:
             search_data = {k:v for k, v in row_data.items()
-                               if getattr(model.__table__.columns,
-                                          k).primary_key}
+                               if k in primary_key_fields}
 
         # if no search_data was identified, fall back on doing a whole
         # row match search, to see if there is already an exact match
@@ -248,30 +346,50 @@ def orm_update_table(db, provider, table_name, table_rows, version):
         if not search_data:
             search_data = row_data
 
-        LOG.debug("Checking for existing entries in %s using: %s",
-                  repr(model.__name__),
-                  repr(search_data))
+        LOG.debug("Checking for existing entries in %s using: %r",
+                  repr(model.__name__), search_data)
 
         # if we find no match for the primary keys then add a new row
-        found_row = db.query(model).filter_by(**search_data).one_or_none()
+        found_row = existing_entries.find(search_data)
         if not found_row:
             row = model(**row_data)
-            LOG.debug("Adding new row %s", repr(row))
+            LOG.debug("Adding new row %r", row)
             db.add(row)
+            # later rows may match the new row, as they would if it had
+            # been flushed to the DB
+            existing_entries.add(row)
             rows_added += 1
-            continue
-
+            changes.append(('added', row))
         # Now check if the found row is an exact match?
-        if all([v == getattr(found_row, k)
-                for k, v in row_data.items()]):
-            LOG.debug("Skipping existing row: %s", repr(found_row))
+        elif all([v == getattr(found_row, k)
+                  for k, v in row_data.items()]):
+            LOG.debug("Skipping existing row: %r", found_row)
             continue
-
-        LOG.debug("Updating existing row: %s", repr(found_row))
-        for k, v in row_data.items():
-            setattr(found_row, k, v)
-        rows_updated += 1
-
+        else:
+            LOG.debug("Updating existing row: %r", found_row)
+            for k, v in row_data.items():
+                setattr(found_row, k, v)
+            rows_updated += 1
+            changes.append(('updated', found_row))
+
+        # write the added and updated rows in batches, which the flush
+        # issues as executemany statements
+        if len(changes) % UPDATE_BATCH_SIZE == 0:
+            db.flush()
+
+    finish_table_update(db, provider, table_name, model, need_version,
+                        version, rows_added, rows_updated, changes)
+
+
+def finish_table_update(db, provider, table_name, model, need_version,
+                        version, rows_added, rows_updated, changes):
+    """Log the entries added to and updated in the provider's table, and
+    bump the table's version, recording the changes in the change log,
+    if any were made."""
+    if table_name == "images":
+        # bring the expected deletion dates of the images up to date
+        db.flush()
+        update_deletiondates(db, model, provider)
 
     if not rows_added and not rows_updated:
         LOG.info("No new entries found for model %s",
@@ -297,6 +415,7 @@ def orm_update_table(db, provider, table_name, table_rows, version):
                 LOG.info("Updating %s table entry for table %s with "
                             "version %s", repr(VersionsModel.__tablename__),
                             repr(model.__tablename__), repr(version))
+                previous_version = version_entry.version
                 # If the suggested version is >= the existing version
                 # we can just use it, as this means that the associated
                 # commit date stamp is newer than the previous one.
@@ -323,20 +442,190 @@ def orm_update_table(db, provider, table_name, table_rows, version):
                 LOG.info("Adding %s table entry for table %s with "
                             "version %s", repr(VersionsModel.__tablename__),
                             repr(model.__tablename__), repr(version))
-                db.add(VersionsModel(tablename=model.__tablename__,
-                                     version=version))
+                previous_version = None
+                version_entry = VersionsModel(tablename=model.__tablename__,
+                                              version=version)
+                db.add(version_entry)
+
+            # record the changes made in the new version of the table, so
+            # that clients can fetch them rather than the whole table
+            record_changes(db, model.__tablename__, previous_version,
+                           version_entry.version, changes)
+
+
+class CopyRows:
+    """A file-like object from which COPY reads the values of the fields
+    of the rows, in its text format."""
+
+    def __init__(self, fields, rows):
+        self._lines = (self.format_row(fields, row) for row in rows)
+        self._buffer = ''
+
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return '\\N'
+        if isinstance(value, enum.Enum):
+            value = value.name
+        elif isinstance(value, date):
+            value = value.isoformat()
+        return str(value).replace('\\', '\\\\').replace(
+            '\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    @classmethod
+    def format_row(cls, fields, row):
+        return '\t'.join(cls.format_value(row[f]) for f in fields) + '\n'
+
+    def read(self, size=-1):
+        for line in self._lines:
+            self._buffer += line
+            if 0 <= size <= len(self._buffer):
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def get_merge_keys(model):
+    """Return the (fields, index condition) unique keys of the model's
+    table on which rows are merged into existing entries."""
+    merge_keys = MERGE_KEY_OVERRIDES.get(model.__name__)
+    if merge_keys is None:
+        merge_keys = [([c.name for c in model.__table__.primary_key.columns],
+                       None)]
+    return merge_keys
+
+
+def group_copy_rows(model, table_rows):
+    """Group the rows by their fields and the merge key, if any, whose
+    fields all have values, dropping all but the last of the rows that
+    have the same key, or the same values if they have no key."""
+    merge_keys = get_merge_keys(model)
+    groups = {}
+    for row_data in table_rows:
+        fields = tuple(sorted(row_data))
+        key_index = next((i for i, (key_fields, _) in enumerate(merge_keys)
+                          if all(row_data.get(f) is not None
+                                 for f in key_fields)), None)
+        if key_index is None:
+            key_fields = fields
+        else:
+            key_fields = merge_keys[key_index][0]
+        key = tuple(get_search_value(f, row_data[f]) for f in key_fields)
+        groups.setdefault((fields, key_index), {})[key] = row_data
+
+    return [(fields, None if key_index is None else merge_keys[key_index],
+             list(rows.values()))
+            for (fields, key_index), rows in groups.items()]
 
 
-def orm_update_tables(db, provider, tables, version):
+def copy_update_table(db, provider, table_name, table_rows, version):
+    model, need_version = get_table_model(provider, table_name)
+    model_table = model.__table__
+    staging_name = f"{model.__tablename__}_staging"
+    column_names = [c.name for c in model_table.columns]
+
+    LOG.debug("Attempting to add %d new entries for model %s",
+                 len(table_rows), repr(model.__name__))
+    rows_added = 0
+    rows_updated = 0
+    # (operation, row) changes to be recorded in the change log
+    changes = []
+
+    # NOTE: the rows are streamed into a temporary staging table with
+    # COPY, and merged from there into the table with a statement for each
+    # group of rows with the same fields, so write any pending changes
+    # first.
+    db.flush()
+    db.execute(text(f"CREATE TEMPORARY TABLE {staging_name} AS "
+                    f"SELECT {', '.join(column_names)} "
+                    f"FROM {model.__tablename__} WITH NO DATA"))
+    cursor = db.connection().connection.cursor()
+    try:
+        for fields, merge_key, rows in group_copy_rows(model, table_rows):
+            db.execute(text(f"TRUNCATE {staging_name}"))
+            cursor.copy_expert(f"COPY {staging_name} ({', '.join(fields)}) "
+                               f"FROM STDIN", CopyRows(fields, rows))
+            LOG.debug("Copied %d rows with fields %r for model %s",
+                      len(rows), fields, repr(model.__name__))
+
+            staging = table(staging_name,
+                            *[column(f, model_table.c[f].type)
+                              for f in fields])
+            rows_select = select(*[staging.c[f] for f in fields])
+            if merge_key is None:
+                # without a key, add the rows that have no exact match
+                stmt = postgresql.insert(model_table).from_select(
+                    fields, rows_select.where(~exists().where(and_(
+                        *[model_table.c[f].is_not_distinct_from(staging.c[f])
+                          for f in fields]))))
+            else:
+                key_fields, index_where = merge_key
+                stmt = postgresql.insert(model_table).from_select(
+                    fields, rows_select)
+                if index_where is not None:
+                    index_where = text(index_where)
+                update_fields = [f for f in fields if f not in key_fields]
+                if update_fields:
+                    # only update the entries that differ from their rows
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=key_fields, index_where=index_where,
+                        set_={f: stmt.excluded[f] for f in update_fields},
+                        where=or_(*[model_table.c[f].is_distinct_from(
+                                        stmt.excluded[f])
+                                    for f in update_fields]))
+                else:
+                    stmt = stmt.on_conflict_do_nothing(
+                        index_elements=key_fields, index_where=index_where)
+
+            # the xmax of the entries that were added, rather than updated,
+            # is 0
+            stmt = stmt.returning(
+                *model_table.columns,
+                literal_column('xmax = 0').label('merge_added'))
+            for result in db.execute(stmt):
+                entry = model(**{c: result._mapping[c]
+                                 for c in column_names})
+                if result.merge_added:
+                    LOG.debug("Added new row %r", entry)
+                    rows_added += 1
+                    changes.append(('added', entry))
+                else:
+                    LOG.debug("Updated existing row %r", entry)
+                    rows_updated += 1
+                    changes.append(('updated', entry))
+    finally:
+        cursor.close()
+    db.execute(text(f"DROP TABLE {staging_name}"))
+
+    finish_table_update(db, provider, table_name, model, need_version,
+                        version, rows_added, rows_updated, changes)
+
+
+# The ways in which the data update can update a provider's table
+TABLE_UPDATE_ENGINES = {
+    'orm': orm_update_table,
+    'copy': copy_update_table,
+}
+
+DEFAULT_TABLE_UPDATE_ENGINE = 'orm'
+
+
+def orm_update_tables(db, provider, tables, version,
+                      engine=DEFAULT_TABLE_UPDATE_ENGINE):
+    update_table = TABLE_UPDATE_ENGINES[engine]
     for table_name, table_rows in tables.items():
         if not table_rows:
             LOG.debug("Skipping table %s for provider %s; no entries "
                          "found", repr(table_name), repr(provider))
             continue
-        orm_update_table(db, provider, table_name, table_rows, version)
+        update_table(db, provider, table_name, table_rows, version)
 
 
-def orm_load_database(pint_data, db_logfile=None):
+def orm_load_database(pint_data, db_logfile=None,
+                      changelog_retention=DEFAULT_CHANGE_LOG_RETENTION,
+                      engine=DEFAULT_TABLE_UPDATE_ENGINE):
     db = init_db(outputfile=db_logfile, create_all=False)
 
     data_files = gen_data_files_list(pint_data_repo=pint_data)
@@ -362,12 +651,17 @@ def orm_load_database(pint_data, db_logfile=None):
                         "No %s table data for provider %s" %
                         (repr(table_name), repr(provider)))
 
-        orm_update_tables(db, provider, tables, version)
+        orm_update_tables(db, provider, tables, version, engine=engine)
+
+    prune_change_log(db, retention=changelog_retention)
 
     if db.new or db.dirty:
         LOG.debug("Added to the Database: %s", db.new)
         LOG.debug("Modified in the Database: %s", db.dirty)
-        db.commit()
+
+    # the change log is written with flushed statements, which leave
+    # nothing new or dirty in the session, so always commit
+    db.commit()
 
 
 def create_db_uri(host, port, user, password, database, ssl_mode, root_cert):
@@ -418,13 +712,24 @@ def pint_db(ctx, debug, quiet, host, port, user, password, database,
 @click.option('--pint-data', help='Path to pint-data dir', type=str)
 @click.option('--db-logfile', help='DB debug log file', default=None,
               required=False, type=str)
+@click.option('--changelog-retention',
+              help='Number of table versions to keep in the change log',
+              default=DEFAULT_CHANGE_LOG_RETENTION, show_default=True,
+              type=click.IntRange(min=1))
+@click.option('--engine',
+              help='How the tables are updated: with the ORM, or by '
+                   'merging the rows COPYed into staging tables',
+              default=DEFAULT_TABLE_UPDATE_ENGINE, show_default=True,
+              type=click.Choice(list(TABLE_UPDATE_ENGINES)))
 @click.pass_context
-def update(ctx, pint_data, db_logfile):
+def update(ctx, pint_data, db_logfile, changelog_retention, engine):
     try:
         LOG.info('Updating data')
         # import data
         os.environ['DATABASE_URI'] = ctx.obj['db_uri']
-        orm_load_database(pint_data, db_logfile=db_logfile)
+        orm_load_database(pint_data, db_logfile=db_logfile,
+                          changelog_retention=changelog_retention,
+                          engine=engine)
         print('Pint database successfully updated.')
     except Exception as e:
         LOG.debug(e, exc_info=True)
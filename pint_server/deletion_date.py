@@ -0,0 +1,108 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Expected deletion dates of provider images.
+
+Each image entry's expected deletion date is stored in the deletiondate
+column of the images tables, which is maintained by the data update: the
+deletedon date of deleted images, and the deprecatedon date plus the
+provider specific relative deletion delta of deprecated images. It is NULL
+for any other images.
+"""
+
+import logging
+
+from sqlalchemy import (
+    case,
+    cast,
+    column,
+    Date,
+    literal,
+    literal_column,
+    null,
+    table)
+from sqlalchemy.dialects.postgresql import INTERVAL
+
+from pint_models.models import ImageState
+
+
+LOG = logging.getLogger(__name__)
+
+# Provider specific deletion relative time deltas
+DELETION_RELATIVE_DELTA_MAP = {
+    'amazon': {
+        'years':2,
+        'months':0,
+        'days':0
+    }
+}
+
+# Default deletion relative time deltas
+DELETION_RELATIVE_DELTA_DEFAULT = {
+    'years':0,
+    'months':6,
+    'days':0
+}
+
+def get_deletiondate_column(model):
+    # NOTE: the deletiondate column is added to the images tables by this
+    # repo's schema migrations, rather than being mapped by the pint_models
+    # models, so it is referred to by name. It is therefore never loaded
+    # with the ORM entities, nor selected for the image lists.
+    return literal_column('%s.deletiondate' % model.__tablename__, Date)
+
+
+def get_deletion_table(model):
+    # the images table columns needed to maintain the deletion dates
+    return table(model.__tablename__,
+                 column('state', model.__table__.c.state.type),
+                 column('deprecatedon', Date),
+                 column('deletedon', Date),
+                 column('deletiondate', Date))
+
+
+def get_deletion_interval(provider):
+    # the provider specific relative deletion delta as a SQL interval,
+    # which adds to dates the same way, e.g. clamping to the end of month
+    delta = DELETION_RELATIVE_DELTA_MAP.get(provider,
+                                            DELETION_RELATIVE_DELTA_DEFAULT)
+    return cast(literal(' '.join('%d %s' % (value, unit)
+                                 for unit, value in delta.items())),
+                INTERVAL)
+
+
+def get_deletiondate_expression(images, provider):
+    """Return a SQL expression for the expected deletion date of an entry
+    of the given images table."""
+    return case(
+        (images.c.state == ImageState.deleted, images.c.deletedon),
+        (images.c.state == ImageState.deprecated,
+         cast(images.c.deprecatedon + get_deletion_interval(provider), Date)),
+        else_=null())
+
+
+def update_deletiondates(db, model, provider):
+    """Update the deletion dates of the image entries whose deletion date
+    has changed, returning the number of entries updated."""
+    images = get_deletion_table(model)
+    deletiondate = get_deletiondate_expression(images, provider)
+    result = db.execute(images.update().where(
+        images.c.deletiondate.is_distinct_from(deletiondate)).values(
+        deletiondate=deletiondate))
+    LOG.info("Updated the deletion dates of %d entries for model %s",
+             result.rowcount, repr(model.__name__))
+    return result.rowcount
@@ -18,7 +18,8 @@ config = context.config
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from pint_models.models import Base
-target_metadata = Base.metadata
+from pint_server import change_log
+target_metadata = [Base.metadata, change_log.metadata]
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -44,6 +45,7 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
     )
 
     with context.begin_transaction():
@@ -64,8 +66,12 @@ def run_migrations_online():
     )
 
     with connectable.connect() as connection:
+        # NOTE: each migration runs in its own transaction, so that when a
+        # migration builds indexes concurrently, outside of a transaction,
+        # only the preceding migrations, recorded as applied, are committed.
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            transaction_per_migration=True
         )
 
         with context.begin_transaction():
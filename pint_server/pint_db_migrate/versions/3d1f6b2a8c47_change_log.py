@@ -0,0 +1,49 @@
+"""change log
+
+Revision ID: 3d1f6b2a8c47
+Revises: 619a5afd89c4
+Create Date: 2026-10-18 14:03:51.118254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3d1f6b2a8c47'
+down_revision = '619a5afd89c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(sa.schema.CreateSequence(sa.Sequence('changelog_id_seq')))
+    op.create_table('changelog',
+        sa.Column('id', sa.BigInteger(),
+                  server_default=sa.text("nextval('changelog_id_seq')"),
+                  nullable=False),
+        sa.Column('tablename', sa.String(length=100), nullable=False),
+        sa.Column('version', sa.Numeric(), nullable=False),
+        sa.Column('operation', sa.Enum('added', 'updated', 'removed',
+                                       name='change_operation'),
+                  nullable=False),
+        sa.Column('data', postgresql.JSONB(astext_type=sa.Text()),
+                  nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_changelog_tablename_version', 'changelog',
+                    ['tablename', 'version'])
+    op.create_table('changelogbase',
+        sa.Column('tablename', sa.String(length=100), nullable=False),
+        sa.Column('version', sa.Numeric(), nullable=False),
+        sa.PrimaryKeyConstraint('tablename')
+    )
+
+
+def downgrade():
+    op.drop_table('changelogbase')
+    op.drop_index('ix_changelog_tablename_version', table_name='changelog')
+    op.drop_table('changelog')
+    op.execute(sa.schema.DropSequence(sa.Sequence('changelog_id_seq')))
+    sa.Enum(name='change_operation').drop(op.get_bind(), checkfirst=False)
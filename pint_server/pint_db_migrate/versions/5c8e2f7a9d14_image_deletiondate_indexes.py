@@ -0,0 +1,47 @@
+"""image deletiondate indexes
+
+Revision ID: 5c8e2f7a9d14
+Revises: 3d1f6b2a8c47
+Create Date: 2026-10-18 16:41:09.530612
+
+"""
+from pint_server.concurrent_index import (
+    create_index_concurrently,
+    drop_index_concurrently)
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8e2f7a9d14'
+down_revision = '3d1f6b2a8c47'
+branch_labels = None
+depends_on = None
+
+# Images tables to be updated, with the columns an image's deletion date
+# is looked up by, i.e. the name along with the region, or environment for
+# microsoft, if the table has one. The indexes are named after them.
+images_tables = {
+    "alibabaimages": ['name', 'region'],
+    "amazonimages": ['name', 'region'],
+    "googleimages": ['name'],
+    "microsoftimages": ['name', 'environment'],
+    "oracleimages": ['name'],
+}
+
+
+def index_name(table, columns):
+    return f"ix_{table}_{'_'.join(columns)}"
+
+
+def upgrade():
+    for table, columns in images_tables.items():
+        # include the columns the deletion date is determined from, so that
+        # it can be computed with an index only scan of an image's entries
+        create_index_concurrently(index_name(table, columns), table,
+                                  columns,
+                                  postgresql_include=['state', 'deprecatedon',
+                                                      'deletedon'])
+
+
+def downgrade():
+    for table, columns in reversed(list(images_tables.items())):
+        drop_index_concurrently(index_name(table, columns))
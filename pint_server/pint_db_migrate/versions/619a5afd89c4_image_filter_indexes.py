@@ -0,0 +1,36 @@
+"""image filter indexes
+
+Revision ID: 619a5afd89c4
+Revises: ee82c541fae0
+Create Date: 2026-10-18 10:12:37.402817
+
+"""
+from pint_server.concurrent_index import (
+    create_index_concurrently,
+    drop_index_concurrently)
+
+
+# revision identifiers, used by Alembic.
+revision = '619a5afd89c4'
+down_revision = 'ee82c541fae0'
+branch_labels = None
+depends_on = None
+
+# Images tables to be updated
+images_tables = ["alibabaimages", "amazonimages", "googleimages",
+                 "microsoftimages", "oracleimages"]
+
+
+def upgrade():
+    for table in images_tables:
+        # support the name LIKE 'prefix%' image name filter, which can
+        # only use an index with the pattern operator class unless the
+        # database uses the C collation
+        create_index_concurrently(
+            f'ix_{table}_name_pattern', table, ['name'],
+            postgresql_ops={'name': 'varchar_pattern_ops'})
+
+
+def downgrade():
+    for table in reversed(images_tables):
+        drop_index_concurrently(f'ix_{table}_name_pattern')
@@ -0,0 +1,39 @@
+"""image deletiondate column
+
+Revision ID: a4d7c2e9b3f1
+Revises: 5c8e2f7a9d14
+Create Date: 2026-10-18 18:07:44.261390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7c2e9b3f1'
+down_revision = '5c8e2f7a9d14'
+branch_labels = None
+depends_on = None
+
+# Images tables to be updated
+images_tables = [
+    "alibabaimages",
+    "amazonimages",
+    "googleimages",
+    "microsoftimages",
+    "oracleimages",
+]
+
+
+def upgrade():
+    # NOTE: adding a nullable column without a default doesn't rewrite the
+    # table, so it is only briefly locked. The column is populated, and
+    # indexed, by the following revisions, each in its own transaction.
+    for table in images_tables:
+        op.add_column(table, sa.Column('deletiondate', sa.Date(),
+                                       nullable=True))
+
+
+def downgrade():
+    for table in reversed(images_tables):
+        op.drop_column(table, 'deletiondate')
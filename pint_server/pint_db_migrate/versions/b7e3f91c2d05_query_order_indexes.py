@@ -0,0 +1,55 @@
+"""query order indexes
+
+Revision ID: b7e3f91c2d05
+Revises: d9f2b4c6e1a3
+Create Date: 2026-10-18 19:26:51.804113
+
+"""
+import sqlalchemy as sa
+
+from pint_server.concurrent_index import (
+    create_index_concurrently,
+    drop_index_concurrently)
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f91c2d05'
+down_revision = 'd9f2b4c6e1a3'
+branch_labels = None
+depends_on = None
+
+# Images tables to be updated, with the primary key columns, other than
+# the name, that break ties in the order the images are listed in, i.e.
+# newest images first, then by name.
+images_tables = {
+    "alibabaimages": ['id'],
+    "amazonimages": ['id'],
+    "googleimages": [],
+    "microsoftimages": ['id'],
+    "oracleimages": ['id'],
+}
+
+
+def upgrade():
+    for table, keys in images_tables.items():
+        # the table's images are loaded in the order they are listed in,
+        # which an index matching it can provide without sorting them. As
+        # the index leads with publishedon, it also supports the
+        # publishedafter and publishedbefore image filters.
+        create_index_concurrently(
+            f'ix_{table}_publishedon_name', table,
+            [sa.text('publishedon DESC'), 'name'] + keys)
+
+    # the changes since a version are read in the order they were made
+    create_index_concurrently('ix_changelog_tablename_version_id',
+                              'changelog', ['tablename', 'version', 'id'])
+    drop_index_concurrently('ix_changelog_tablename_version')
+
+
+def downgrade():
+    create_index_concurrently('ix_changelog_tablename_version', 'changelog',
+                              ['tablename', 'version'])
+    drop_index_concurrently('ix_changelog_tablename_version_id')
+
+    for table in reversed(list(images_tables)):
+        drop_index_concurrently(f'ix_{table}_publishedon_name')
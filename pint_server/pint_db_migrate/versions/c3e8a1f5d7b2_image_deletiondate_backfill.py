@@ -0,0 +1,75 @@
+"""image deletiondate backfill
+
+Revision ID: c3e8a1f5d7b2
+Revises: a4d7c2e9b3f1
+Create Date: 2026-10-18 21:12:37.406528
+
+"""
+import logging
+import os
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import INTERVAL
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a1f5d7b2'
+down_revision = 'a4d7c2e9b3f1'
+branch_labels = None
+depends_on = None
+
+
+# Get a logger to use for log messages
+logger = logging.getLogger(os.path.basename(__file__))
+
+# Images tables to be updated, with the provider specific relative
+# deletion delta as at this revision.
+images_tables = {
+    "alibabaimages": '6 months',
+    "amazonimages": '2 years',
+    "googleimages": '6 months',
+    "microsoftimages": '6 months',
+    "oracleimages": '6 months',
+}
+
+
+def images_table(table):
+    # temporary definition of the images table columns that are needed to
+    # populate the deletiondate column
+    return sa.table(table,
+                    sa.column('state', sa.String),
+                    sa.column('deprecatedon', sa.Date),
+                    sa.column('deletedon', sa.Date),
+                    sa.column('deletiondate', sa.Date))
+
+
+def deletiondate_expression(images, interval):
+    # the deletedon date of deleted images, and the deprecatedon date plus
+    # the deletion delta of deprecated images
+    return sa.case(
+        (images.c.state == 'deleted', images.c.deletedon),
+        (images.c.state == 'deprecated',
+         sa.cast(images.c.deprecatedon +
+                 sa.literal_column(f"INTERVAL '{interval}'", INTERVAL),
+                 sa.Date)),
+        else_=sa.null())
+
+
+def upgrade():
+    # Each table is updated with a single UPDATE, which only locks the
+    # updated rows, so the images can still be read while it runs.
+    conn = op.get_bind()
+    for table, interval in images_tables.items():
+        images = images_table(table)
+        deletiondate = deletiondate_expression(images, interval)
+        result = conn.execute(images.update().where(
+            images.c.deletiondate.is_distinct_from(deletiondate)).values(
+            deletiondate=deletiondate))
+        logger.info('%s: Populated %d deletiondate entries', table,
+                    result.rowcount)
+
+
+def downgrade():
+    # the deletiondate column is dropped by the previous revision
+    pass
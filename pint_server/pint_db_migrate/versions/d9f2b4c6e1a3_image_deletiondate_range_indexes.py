@@ -0,0 +1,48 @@
+"""image deletiondate range indexes
+
+Revision ID: d9f2b4c6e1a3
+Revises: c3e8a1f5d7b2
+Create Date: 2026-10-18 21:14:02.918347
+
+"""
+import sqlalchemy as sa
+
+from pint_server.concurrent_index import (
+    create_index_concurrently,
+    drop_index_concurrently)
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f2b4c6e1a3'
+down_revision = 'c3e8a1f5d7b2'
+branch_labels = None
+depends_on = None
+
+# Images tables to be updated, with the columns, other than deletiondate,
+# that the deprecated images to be deleted by a date are looked up by.
+images_tables = {
+    "alibabaimages": [[], ['region']],
+    "amazonimages": [[], ['region']],
+    "googleimages": [[]],
+    "microsoftimages": [[], ['environment']],
+    "oracleimages": [[]],
+}
+
+
+def index_name(table, columns):
+    return '_'.join(['ix', table] + columns + ['deletiondate'])
+
+
+def upgrade():
+    for table, indexes in images_tables.items():
+        # only deprecated images are looked up by their deletion date
+        for columns in indexes:
+            create_index_concurrently(
+                index_name(table, columns), table, columns + ['deletiondate'],
+                postgresql_where=sa.text("state = 'deprecated'"))
+
+
+def downgrade():
+    for table, indexes in reversed(list(images_tables.items())):
+        for columns in reversed(indexes):
+            drop_index_concurrently(index_name(table, columns))
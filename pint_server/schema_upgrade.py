@@ -22,6 +22,8 @@ import click
 import logging
 import sys
 
+from pint_server.concurrent_index import DEFAULT_INDEX_PROGRESS_INTERVAL
+
 
 LOG = logging.getLogger(__name__)
 
@@ -98,13 +100,21 @@ def db_version(ctx):
 
 
 @click.command(help='Upgrade database schema')
+@click.option('--index-progress-interval',
+              help='Seconds between index build progress reports',
+              default=DEFAULT_INDEX_PROGRESS_INTERVAL,
+              type=click.FloatRange(min=0, min_open=True))
 @click.pass_context
-def upgrade(ctx):
+def upgrade(ctx, index_progress_interval):
     try:
         LOG.info('Creating version control')
         LOG.info('Upgrading schema')
-        command.upgrade(get_alembic_config(
-            ctx.obj['repository'], ctx.obj['db_uri']), 'head')
+        alembic_cfg = get_alembic_config(
+            ctx.obj['repository'], ctx.obj['db_uri'])
+        # used by the migrations that build indexes concurrently
+        alembic_cfg.attributes['index_progress_interval'] = (
+            index_progress_interval)
+        command.upgrade(alembic_cfg, 'head')
         print('Pint database schema migration successfully completed.')
     except Exception as e:
         LOG.debug(e, exc_info=True)
@@ -0,0 +1,91 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Compare loading provider images as ORM entities with Core row tuples.
+
+Requires a populated database, configured in the same way as for the
+server itself.
+
+Usage:
+
+  python -m pint_server.tests.benchmark.bench_queries [provider ...]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from sqlalchemy import event
+
+from pint_server import app
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self)
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def load_orm(provider):
+    # the original implementation, formatting ORM entities
+    model = app.PROVIDER_IMAGES_MODEL_MAP[provider]
+    exclude_attrs = app.PROVIDER_IMAGES_EXCLUDE_ATTRS.get(provider)
+    images = model.query.order_by(*app.get_images_order_by(model)).all()
+    return [app.get_formatted_dict(i, exclude_attrs=exclude_attrs)
+            for i in images]
+
+
+def load_core(provider):
+    model = app.PROVIDER_IMAGES_MODEL_MAP[provider]
+    return app.formatted_provider_images(provider, app.load_table_rows(model))
+
+
+def measure(counter, loader, provider):
+    app.db_session.remove()
+    counter.count = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = loader(provider)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, counter.count, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('providers', nargs='*',
+                        default=['amazon', 'microsoft'])
+    args = parser.parse_args()
+
+    counter = QueryCounter(app.db_session.get_bind())
+    for provider in args.providers:
+        orm = measure(counter, load_orm, provider)
+        core = measure(counter, load_core, provider)
+        assert orm[0] == core[0]
+        for name, (result, queries, peak, elapsed) in [('orm', orm),
+                                                       ('core', core)]:
+            print('%-10s %-5s rows=%-8d queries=%-3d peak=%8.1fMiB '
+                  'time=%8.1fms' % (provider, name, len(result), queries,
+                                    peak / 2**20, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
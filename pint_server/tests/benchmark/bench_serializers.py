@@ -0,0 +1,113 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Compare get_formatted_dict() with the compiled row serializers.
+
+Usage:
+
+  python -m pint_server.tests.benchmark.bench_serializers [--rows N]
+"""
+
+import argparse
+import datetime
+import timeit
+
+from pint_server import app
+from pint_models.models import (AmazonImagesModel, AmazonServersModel,
+                                ImageState, ServerType)
+
+
+def make_amazon_images(count):
+    states = list(ImageState)
+    start = datetime.date(2015, 1, 1)
+    images = []
+    for i in range(count):
+        state = states[i % len(states)]
+        images.append(dict(
+            name='suse-sles-15-sp%d-v%08d-hvm-ssd-x86_64' % (i % 5, i),
+            state=state,
+            replacementname='',
+            publishedon=start + datetime.timedelta(days=i % 3000),
+            deprecatedon=(start + datetime.timedelta(days=i % 3000 + 90)
+                          if state != ImageState.active else None),
+            deletedon=None,
+            changeinfo=('https://publiccloudimagechangeinfo.suse.com/'
+                        'amazon/suse-sles-15-v%08d/' % i) if i % 2 else None,
+            id='ami-%017x' % i,
+            replacementid='',
+            region='us-east-%d' % (i % 2 + 1)))
+    return images
+
+
+def make_amazon_servers(count):
+    servers = []
+    for i in range(count):
+        servers.append(dict(
+            type=ServerType.region if i % 2 else ServerType.update,
+            shape='ipv6' if i % 3 == 0 else None,
+            name='smt-ec2.susecloud.net',
+            ip='10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+            region='us-east-%d' % (i % 2 + 1),
+            ipv6=None,
+            id=i))
+    return servers
+
+
+def bench(name, model, columns, exclude_attrs, repeat):
+    # the original code formatted ORM entities, the compiled serializer
+    # formats the row tuples selected by select_model_rows()
+    entities = [model(**c) for c in columns]
+    attrs = app.get_model_attrs(model)
+    rows = [tuple(c[a] for a in attrs) for c in columns]
+    serializer = app.compile_row_serializer(model, exclude_attrs)
+
+    def reference():
+        return [app.get_formatted_dict(e, exclude_attrs=exclude_attrs)
+                for e in entities]
+
+    def compiled():
+        return [serializer(r) for r in rows]
+
+    # the compiled serializer must produce identical output, including
+    # the attribute order as the entities were constructed in column order
+    expected = reference()
+    actual = compiled()
+    assert actual == expected
+    assert [list(d) for d in actual] == [list(d) for d in expected]
+
+    ref_time = min(timeit.repeat(reference, number=1, repeat=repeat))
+    new_time = min(timeit.repeat(compiled, number=1, repeat=repeat))
+    print('%-16s rows=%-8d get_formatted_dict=%8.1fms compiled=%8.1fms '
+          'speedup=%.2fx' % (name, len(rows), ref_time * 1000,
+                             new_time * 1000, ref_time / new_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    bench('amazonimages', AmazonImagesModel, make_amazon_images(args.rows),
+          app.PROVIDER_IMAGES_EXCLUDE_ATTRS.get('amazon'), args.repeat)
+    bench('amazonservers', AmazonServersModel,
+          make_amazon_servers(args.rows),
+          app.PROVIDER_SERVERS_EXCLUDE_ATTRS.get('amazon'), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -31,3 +31,23 @@ def client():
 
     with flask_app.test_client() as client:
         yield client
+
+
+@pytest.fixture(autouse=True)
+def reset_caches():
+    # start every test with empty caches, and as there is no DB use an
+    # empty set of data versions.
+    app.response_cache.clear()
+    app.gzip_member_cache.clear()
+    with mock.patch.dict(app._data_versions,
+                         {'versions': {}, 'checked': None}):
+        with mock.patch.dict(app._table_snapshots, clear=True), \
+                mock.patch.dict(app._provider_registries, clear=True), \
+                mock.patch.dict(app._azure_region_index, {'index': None}), \
+                mock.patch.dict(app._supported_providers,
+                                {'versions': None, 'providers': []}):
+            with mock.patch('pint_server.app.VersionsModel') as versions_model:
+                versions_model.query.all.return_value = []
+                yield
+    app.response_cache.clear()
+    app.gzip_member_cache.clear()
@@ -203,7 +203,7 @@ class MockDBImagesQuery:
 
 
 # Create a table of mocked images lists, one per test image
-# name, that can be used as the mocked return value for the
+# name, whose entries are aggregated by the
 # pint_server.app.query_image_in_provider_region() call
 _deprecatedon_date = get_datetime_date('20220101')
 _deprecatedon_later_date = get_datetime_date('20220201')
@@ -15,14 +15,85 @@
 # To contact SUSE about this file by physical or electronic mail,
 # you may find current contact information at www.suse.com
 
+import bz2
+import contextlib
+import datetime
+import flask
+import gzip
+import hashlib
 import json
+import lzma
 import mock
 import os
 import pytest
+import threading
+
+from collections import namedtuple
+from decimal import Decimal
+from sqlalchemy.dialects import postgresql
+from xml.etree import ElementTree as ET
+from werkzeug.exceptions import HTTPException
 
 import pint_server
+from pint_models.models import ImageState, ServerType
 from pint_server.tests.unit import mock_pint_data
 
+# the .xml routes and the function, mocked with the golden_xml_data()
+# of the same kind, that they get their data from
+XML_GOLDEN_ROUTES = [
+    ('/v1/{provider}/images.xml', 'get_provider_images', 'images'),
+    ('/v1/{provider}/images/active.xml', 'get_provider_images_for_state',
+     'images'),
+    ('/v1/{provider}/us-west-1/images.xml', 'get_provider_images_for_region',
+     'images'),
+    ('/v1/{provider}/us-west-1/images/active.xml',
+     'get_provider_images_for_region_and_state', 'images'),
+    ('/v1/{provider}/images/deletedby/20220101.xml',
+     'get_provider_images_to_be_deletedby', 'images'),
+    ('/v1/{provider}/us-west-1/images/deletedby/20220101.xml',
+     'get_provider_images_to_be_deletedby', 'images'),
+    ('/v1/{provider}/servers.xml', 'get_provider_servers', 'servers'),
+    ('/v1/{provider}/servers/region.xml', 'get_provider_servers_for_type',
+     'servers'),
+    ('/v1/{provider}/us-west-1/servers.xml',
+     'get_provider_servers_for_region', 'servers'),
+    ('/v1/{provider}/us-west-1/servers/region.xml',
+     'get_provider_servers_for_region_and_type', 'servers'),
+    ('/v1/{provider}/regions.xml', 'get_provider_regions', 'regions'),
+    ('/v1/{provider}/servers/types.xml', 'get_provider_servers_types',
+     'types'),
+    ('/v1/{provider}/images/deletiondate/image4.xml',
+     'get_image_deletiondate_in_provider', 'deletiondate'),
+    ('/v1/{provider}/us-west-1/images/deletiondate/image4.xml',
+     'get_image_deletiondate_in_provider', 'deletiondate'),
+    ('/v1/{provider}/dataversion.xml?category=images',
+     'get_data_version_for_provider_category', 'dataversion'),
+    ('/v1/providers.xml', 'get_supported_providers', 'providers'),
+    ('/v1/images/states.xml', None, 'states'),
+]
+
+
+def golden_xml_data(provider, kind):
+    return {
+        'images': mock_pint_data.mocked_return_value_images[provider],
+        'servers': mock_pint_data.mocked_return_value_servers[provider],
+        'regions': mock_pint_data.mocked_return_value_regions[provider],
+        'types': mock_pint_data.mocked_return_value_server_types,
+        'deletiondate': {'deletiondate': '20220701'},
+        'dataversion': {'version': '20220101.0'},
+        'providers': mock_pint_data.get_supported_providers_return_value,
+        'states': None,
+    }[kind]
+
+
+def golden_xml_file(provider, kind):
+    if kind in ['images', 'servers', 'regions']:
+        name = '%s_%s.xml' % (provider, kind)
+    else:
+        name = '%s.xml' % kind
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'goldenxml', name)
+
 def test_root_request(client):
     """Start with a blank database."""
     rv = client.get('/')
@@ -338,6 +409,103 @@ def test_get_provider_regions_deletedby(client, provider, date, extension):
                             assert expected_images == json.loads(rv.data)
 
 
+@pytest.mark.parametrize("extension", ['', '.json', '.xml'])
+def test_get_images_deletedby(client, extension):
+    rows = make_image_rows(5)
+    threads = set()
+
+    def query_deletedby_images(deletedby, provider):
+        assert deletedby == mock_pint_data.get_datetime_date('20221231')
+        threads.add(threading.current_thread().name)
+        return rows if provider == 'amazon' else []
+
+    with mock.patch(
+            'pint_server.app.query_deletedby_images_in_provider_region',
+            side_effect=query_deletedby_images) as query:
+        rv = client.get('/v1/images/deletedby/20221231' + extension)
+    validate(rv, 200, extension)
+    assert query.call_count == len(pint_server.app.PROVIDER_IMAGES_MODEL_MAP)
+    assert all(t.startswith('deletedby') for t in threads)
+
+    with pint_server.app.app.test_request_context('/v1/amazon/images'):
+        images = pint_server.app.formatted_provider_images('amazon', rows)
+    expected = [dict(name=provider,
+                     images=images if provider == 'amazon' else [])
+                for provider in pint_server.app.PROVIDER_IMAGES_MODEL_MAP]
+    if extension == '.xml':
+        root = ET.fromstring(rv.data)
+        assert root.tag == 'providers'
+        assert [(e.get('name'), [[dict(i.attrib) for i in c] for c in e])
+                for e in root] == [
+            (p['name'], [[{k: str(v) for k, v in i.items()}
+                          for i in p['images']]])
+            for p in expected]
+    else:
+        assert json.loads(rv.data) == {'providers': expected}
+
+
+@pytest.mark.parametrize("max_payload_size", ['100000', '10000', '10'])
+def test_get_images_deletedby_trimmed(client, max_payload_size):
+    rows = make_image_rows(100)
+    with mock.patch.dict(os.environ, {"MAX_PAYLOAD_SIZE": max_payload_size}), \
+            mock.patch(
+                'pint_server.app.query_deletedby_images_in_provider_region',
+                side_effect=lambda deletedby, provider: (
+                    rows if provider == 'amazon' else [])):
+        rv = client.get('/v1/images/deletedby/20221231')
+    assert rv.status_code == 200
+    images = json.loads(rv.data)['providers'][0]['images']
+    if max_payload_size == '100000':
+        assert len(images) == len(rows)
+    else:
+        assert len(rv.data) <= int(max_payload_size) or not images
+        assert len(images) < len(rows)
+        assert [i['id'] for i in images] == [r.id for r in rows[:len(images)]]
+
+
+def test_get_images_deletedby_fields(client):
+    # fields that only some providers' images have are left out of the
+    # others' images
+    rows = {'amazon': make_image_rows(2),
+            'google': [make_row(pint_server.app.GoogleImagesModel,
+                                name='sles-15', project='suse-cloud',
+                                state=ImageState.active,
+                                publishedon=datetime.date(2022, 1, 1))]}
+    with mock.patch(
+            'pint_server.app.query_deletedby_images_in_provider_region',
+            side_effect=lambda deletedby, provider: rows.get(provider, [])):
+        rv = client.get('/v1/images/deletedby/20221231?fields=region,project')
+    assert rv.status_code == 200
+    providers = {p['name']: p['images']
+                 for p in json.loads(rv.data)['providers']}
+    assert providers['amazon'] == [{'region': 'us-east-1'}] * 2
+    assert providers['google'] == [{'project': 'suse-cloud'}]
+    assert providers['oracle'] == []
+
+    # fields that no provider's images have are rejected
+    with mock.patch(
+            'pint_server.app.query_deletedby_images_in_provider_region'
+            ) as query:
+        rv = client.get('/v1/images/deletedby/20221231?fields=region,bogus')
+    assert rv.status_code == 400
+    query.assert_not_called()
+
+
+# the row select_image_deletiondate() selects for an image, along with its
+# name when selected for multiple images
+DeletionDateRow = namedtuple('DeletionDateRow',
+                             ['name', 'images', 'deletiondate'])
+
+
+def make_deletiondate_row(provider, image):
+    # the aggregate of the mocked deletion date image's entries
+    images = mock_pint_data.mocked_deletiondate_images[image]
+    deletiondate = mock_pint_data.mocked_expected_deletiondate[provider][image]
+    if deletiondate:
+        deletiondate = mock_pint_data.get_datetime_date(deletiondate).date()
+    return DeletionDateRow(image, len(images), deletiondate or None)
+
+
 @pytest.mark.parametrize("image", mock_pint_data.mocked_deletiondate_images.keys())
 @pytest.mark.parametrize("extension", ['', '.json', '.xml'])
 @pytest.mark.parametrize("provider", mock_pint_data.mocked_expected_deletiondate.keys())
@@ -347,10 +515,10 @@ def test_get_provider_regions_image_deletiondate(client, provider, image, extens
     for region in mock_valid_regions:
         with mock.patch('pint_server.app.assert_valid_provider'):
             with mock.patch('pint_server.app.assert_valid_provider_region'):
-                deletiondate_images = mock_pint_data.mocked_deletiondate_images[image]
+                deletiondate_image = make_deletiondate_row(provider, image)
                 expected_deletiondate = mock_pint_data.mocked_expected_deletiondate[provider][image]
                 with mock.patch('pint_server.app.query_image_in_provider_region',
-                                return_value=deletiondate_images) as query_image_in_provider_region:
+                                return_value=deletiondate_image) as query_image_in_provider_region:
                     route = '/v1/' + provider
                     if region:
                         route += '/' + region
@@ -365,6 +533,115 @@ def test_get_provider_regions_image_deletiondate(client, provider, image, extens
                         assert expected_deletiondate == rv.json['deletiondate']
 
 
+def test_get_provider_image_deletiondate_not_found(client):
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.query_image_in_provider_region',
+                       return_value=DeletionDateRow(None, 0, None)):
+        rv = client.get('/v1/amazon/images/deletiondate/unknown')
+    assert rv.status_code == 404
+
+
+@pytest.mark.parametrize("provider,interval", [('amazon', '2 years'),
+                                               ('google', '6 months')])
+def test_select_image_deletiondate(provider, interval):
+    model = pint_server.app.PROVIDER_IMAGES_MODEL_MAP[provider]
+    statement = pint_server.app.select_image_deletiondate(provider).where(
+        model.name == 'image1')
+    compiled = statement.compile(dialect=postgresql.dialect())
+    sql = ' '.join(str(compiled).split())
+    table = model.__tablename__
+    # a single aggregate row, with the deletion date computed by the DB
+    assert 'count(*) AS images' in sql
+    assert 'CASE WHEN bool_or(%s.state = %%(state_1)s)' % table in sql
+    assert ('THEN min(%s.deletedon) FILTER (WHERE %s.state IN' %
+            (table, table)) in sql
+    assert ('ELSE CAST((min(%s.deprecatedon) FILTER (WHERE %s.state IN' %
+            (table, table)) in sql
+    assert 'AS INTERVAL) AS DATE) END AS deletiondate' in sql
+    assert 'GROUP BY' not in sql
+    assert interval in ' '.join(
+        v for v in compiled.params.values() if isinstance(v, str))
+
+
+@pytest.mark.parametrize("provider,interval", [('amazon', '2 years'),
+                                               ('google', '6 months')])
+def test_update_deletiondates(provider, interval):
+    model = pint_server.app.PROVIDER_IMAGES_MODEL_MAP[provider]
+    db = mock.Mock()
+    db.execute.return_value.rowcount = 3
+    assert pint_server.deletion_date.update_deletiondates(
+        db, model, provider) == 3
+    compiled = db.execute.call_args[0][0].compile(
+        dialect=postgresql.dialect())
+    sql = ' '.join(str(compiled).split())
+    table = model.__tablename__
+    # a single statement, only updating the changed deletion dates
+    assert sql.startswith('UPDATE %s SET deletiondate=CASE' % table)
+    assert ('WHERE %s.deletiondate IS DISTINCT FROM CASE' % table) in sql
+    assert 'FROM %s' % table not in sql
+    assert interval in ' '.join(
+        v for v in compiled.params.values() if isinstance(v, str))
+
+
+@pytest.mark.parametrize("method", ['GET', 'POST'])
+@pytest.mark.parametrize("extension", ['', '.json', '.xml'])
+@pytest.mark.parametrize("region", [None, 'us-west-1'])
+@pytest.mark.parametrize("provider", mock_pint_data.mocked_expected_deletiondate.keys())
+def test_get_provider_images_deletiondates(client, provider, region,
+                                           extension, method):
+    # the same results as the single image requests, without unknown names
+    expected = mock_pint_data.mocked_expected_deletiondate[provider]
+    names = list(expected) + ['unknown', 'image1']
+    route = '/v1/%s%s/images/deletiondate%s' % (
+        provider, '/' + region if region else '', extension)
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.assert_valid_provider_region'), \
+            mock.patch('pint_server.app.query_images_in_provider_region',
+                       return_value=[make_deletiondate_row(provider, image)
+                                     for image in expected]) as query:
+        if method == 'POST':
+            rv = client.post(route, json={'names': names})
+        else:
+            rv = client.get(route + '?names=' + ','.join(names))
+    query.assert_called_once_with(list(expected) + ['unknown'], provider,
+                                  region)
+    validate(rv, 200, extension)
+    if extension == '.xml':
+        root = ET.fromstring(rv.data)
+        assert root.tag == 'deletiondates'
+        assert [dict(e.attrib) for e in root] == [
+            {'name': name, 'deletiondate': deletiondate}
+            for name, deletiondate in expected.items()]
+    else:
+        assert json.loads(rv.data) == {'deletiondates': expected}
+
+
+@pytest.mark.parametrize("request_args", [
+    {'path': '/v1/amazon/images/deletiondate'},
+    {'path': '/v1/amazon/images/deletiondate?names=,'},
+    {'path': '/v1/amazon/images/deletiondate?names=' +
+     ','.join('image%d' % i for i in range(1001))},
+    {'path': '/v1/amazon/images/deletiondate', 'method': 'POST',
+     'json': {'names': 'image1'}},
+    {'path': '/v1/amazon/images/deletiondate', 'method': 'POST',
+     'json': ['image1']},
+    {'path': '/v1/amazon/images/deletiondate', 'method': 'POST',
+     'json': {'names': [1]}},
+])
+def test_get_provider_images_deletiondates_bad_request(client, request_args):
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.query_images_in_provider_region',
+                       return_value=[]):
+        rv = client.open(**request_args)
+    assert rv.status_code == 400
+
+
+def test_post_only_accepted_by_deletiondate_routes(client):
+    # the deployment forwards POST requests for any path to the app
+    rv = client.post('/v1/amazon/images', json={'names': ['image1']})
+    assert rv.status_code == 405
+
+
 def test_get_max_payload_size_default_value(client):
     assert pint_server.app.get_max_payload_size() == pint_server.app.DEFAULT_MAX_PAYLOAD_SIZE
 
@@ -374,6 +651,925 @@ def test_get_max_payload_size_default_override(client):
     assert pint_server.app.get_max_payload_size() == 100
 
 
+@mock.patch.dict(os.environ, {"DATA_VERSION_CHECK_INTERVAL": "3600"})
+def test_get_data_versions_check_interval(client):
+    def get_data_versions():
+        # each request gets a new app context
+        with pint_server.app.app.app_context():
+            return pint_server.app.get_data_versions()
+
+    versions = [mock.Mock(tablename='amazonimages', version=1)]
+    with mock.patch.dict(pint_server.app._data_versions,
+                         {'versions': None, 'checked': None}):
+        with mock.patch('pint_server.app.VersionsModel') as versions_model:
+            versions_model.query.all.return_value = versions
+            assert get_data_versions() == {'amazonimages': 1}
+            assert get_data_versions() == {'amazonimages': 1}
+            assert versions_model.query.all.call_count == 1
+
+            with mock.patch.dict(os.environ,
+                                 {"DATA_VERSION_CHECK_INTERVAL": "0"}):
+                get_data_versions()
+                assert versions_model.query.all.call_count == 2
+
+                # the versions are only checked once per request
+                with pint_server.app.app.app_context():
+                    pint_server.app.get_data_versions()
+                    pint_server.app.get_data_versions()
+                assert versions_model.query.all.call_count == 3
+
+
+def test_get_table_snapshot_reloads_on_version_change(client):
+    model = pint_server.app.AmazonImagesModel
+    with mock.patch.dict(pint_server.app._table_snapshots, clear=True):
+        with mock.patch('pint_server.app.get_table_data_version',
+                        return_value='1.0'):
+            with mock.patch('pint_server.app.load_table_rows',
+                            return_value=['row1']) as load_table_rows:
+                assert pint_server.app.get_table_snapshot(model) == ['row1']
+                assert pint_server.app.get_table_snapshot(model) == ['row1']
+                load_table_rows.assert_called_once_with(model)
+
+        with mock.patch('pint_server.app.get_table_data_version',
+                        return_value='2.0'):
+            with mock.patch('pint_server.app.load_table_rows',
+                            return_value=['row2']) as load_table_rows:
+                assert pint_server.app.get_table_snapshot(model) == ['row2']
+                load_table_rows.assert_called_once_with(model)
+
+
+def test_get_table_data_version_unversioned_table(client):
+    versions = {'microsoftimages': 1, 'microsoftservers': 2}
+    with mock.patch('pint_server.app.get_data_versions',
+                    return_value=versions):
+        assert pint_server.app.get_table_data_version(
+            pint_server.app.MicrosoftImagesModel) == 1
+        assert pint_server.app.get_table_data_version(
+            pint_server.app.MicrosoftRegionMapModel) == (1, 2)
+
+
+def test_query_provider_regions_from_snapshot(client):
+    snapshots = {
+        pint_server.app.AmazonServersModel: [
+            mock.Mock(region='us-west-1'), mock.Mock(region='ap-south-1')],
+        pint_server.app.AmazonImagesModel: [
+            mock.Mock(region='us-west-1'), mock.Mock(region='eu-west-1')],
+    }
+    with mock.patch('pint_server.app.get_table_snapshot',
+                    side_effect=lambda model: snapshots[model]):
+        assert pint_server.app.query_provider_regions('amazon') == [
+            'ap-south-1', 'us-west-1', 'eu-west-1']
+
+
+def test_get_supported_providers_from_data_versions(client):
+    versions = {'amazonimages': 1, 'amazonservers': 1, 'oracleimages': 1}
+    with mock.patch('pint_server.app.get_data_versions',
+                    return_value=versions):
+        assert pint_server.app.get_supported_providers() == [
+            'amazon', 'oracle']
+        pint_server.app.assert_valid_provider('amazon')
+        with pytest.raises(HTTPException):
+            pint_server.app.assert_valid_provider('google')
+
+
+def test_provider_registry_rebuilt_on_version_change(client):
+    versions = {'amazonimages': 1, 'amazonservers': 1, 'googleimages': 1}
+    with mock.patch('pint_server.app.get_data_versions',
+                    return_value=versions):
+        with mock.patch('pint_server.app.query_provider_regions',
+                        return_value=['us-west-1']) as query_provider_regions:
+            with mock.patch('pint_server.app.get_provider_servers_types',
+                            return_value=[{'name': 'region'}]):
+                pint_server.app.assert_valid_provider_region(
+                    'amazon', 'us-west-1')
+                with pytest.raises(HTTPException):
+                    pint_server.app.assert_valid_provider_region(
+                        'amazon', 'us-east-1')
+                assert pint_server.app.get_mapped_server_type_for_provider(
+                    'amazon', 'regionserver') == 'region'
+                with pytest.raises(HTTPException):
+                    pint_server.app.get_mapped_server_type_for_provider(
+                        'amazon', 'smt')
+                assert query_provider_regions.call_count == 1
+
+                # other providers' data versions are not relevant
+                versions['googleimages'] = 2
+                pint_server.app.assert_valid_provider_region(
+                    'amazon', 'us-west-1')
+                assert query_provider_regions.call_count == 1
+
+                versions['amazonservers'] = 2
+                pint_server.app.assert_valid_provider_region(
+                    'amazon', 'us-west-1')
+                assert query_provider_regions.call_count == 2
+
+
+def test_azure_region_index(client):
+    regionmap = [
+        mock.Mock(environment='PublicAzure', region='westus',
+                  canonicalname='westus'),
+        mock.Mock(environment='PublicAzure', region='uswest',
+                  canonicalname='westus'),
+        mock.Mock(environment='ChinaAzure', region='chinanorth',
+                  canonicalname='chinanorth'),
+    ]
+    servers = [make_row(pint_server.app.MicrosoftServersModel,
+                        region='uswest', type=ServerType.update),
+               make_row(pint_server.app.MicrosoftServersModel,
+                        region='chinanorth', type=ServerType.update)]
+    snapshots = {pint_server.app.MicrosoftRegionMapModel: regionmap,
+                 pint_server.app.MicrosoftServersModel: servers}
+    with mock.patch('pint_server.app.get_table_data_version',
+                    return_value=1) as get_table_data_version:
+        with mock.patch('pint_server.app.get_table_snapshot',
+                        side_effect=snapshots.get) as get_table_snapshot:
+            assert pint_server.app._get_all_azure_regions() == [
+                'chinanorth', 'uswest', 'westus']
+            for region in ['westus', 'uswest']:
+                assert pint_server.app._get_azure_environment_name_for_region(
+                    region) == 'PublicAzure'
+                assert [s['region'] for s in
+                        pint_server.app._get_azure_servers(region)] == [
+                    'uswest']
+            with pytest.raises(HTTPException):
+                pint_server.app._get_azure_canonical_region('eastus')
+            # the index is only built once for the region map version
+            regionmap_loads = [
+                c for c in get_table_snapshot.call_args_list
+                if c.args[0] is pint_server.app.MicrosoftRegionMapModel]
+            assert len(regionmap_loads) == 1
+
+            get_table_data_version.return_value = 2
+            pint_server.app._get_all_azure_regions()
+            regionmap_loads = [
+                c for c in get_table_snapshot.call_args_list
+                if c.args[0] is pint_server.app.MicrosoftRegionMapModel]
+            assert len(regionmap_loads) == 2
+
+
+@pytest.mark.parametrize("provider", ['amazon', 'microsoft'])
+def test_compiled_row_serializer(provider):
+    images_model = pint_server.app.PROVIDER_IMAGES_MODEL_MAP[provider]
+    servers_model = pint_server.app.PROVIDER_SERVERS_MODEL_MAP[provider]
+    image_columns = dict(
+        name='suse-sles-15-sp4-v20220101', state=ImageState.deprecated,
+        replacementname='suse-sles-15-sp4-v20220201',
+        publishedon=datetime.date(2022, 1, 1),
+        deprecatedon=datetime.date(2022, 2, 1), deletedon=None,
+        changeinfo=None)
+    if provider == 'microsoft':
+        image_columns.update(id=1, environment='PublicAzure', urn='')
+    else:
+        image_columns.update(id='ami-0123', replacementid='ami-4567',
+                             region='us-east-1')
+    rows = [
+        (images_model, image_columns,
+         pint_server.app.PROVIDER_IMAGES_EXCLUDE_ATTRS.get(provider)),
+        (servers_model, dict(type=ServerType.region, shape='ipv6',
+                             name='smt', ip='10.0.0.1', region='us-east-1',
+                             ipv6=None, id=1),
+         pint_server.app.PROVIDER_SERVERS_EXCLUDE_ATTRS.get(provider)),
+        (servers_model, dict(type=ServerType.update, shape=None, name='smt',
+                             ip='10.0.0.2', region='us-east-1', ipv6='::1',
+                             id=2),
+         pint_server.app.PROVIDER_SERVERS_EXCLUDE_ATTRS.get(provider)),
+    ]
+    for model, columns, exclude_attrs in rows:
+        serializer = pint_server.app.get_row_serializer(model, exclude_attrs)
+        expected = pint_server.app.get_formatted_dict(
+            model(**columns), extra_attrs={'region': 'westus'},
+            exclude_attrs=exclude_attrs)
+        assert serializer(make_row(model, **columns),
+                          {'region': 'westus'}) == expected
+        assert serializer is pint_server.app.get_row_serializer(
+            model, exclude_attrs)
+
+
+@pytest.mark.parametrize("route,function,kind", XML_GOLDEN_ROUTES)
+@pytest.mark.parametrize("provider", ['amazon', 'microsoft', 'google', 'alibaba', 'oracle'])
+def test_xml_golden_files(client, provider, route, function, kind):
+    with open(golden_xml_file(provider, kind), 'rb') as f:
+        expected = f.read()
+    if function:
+        data_patch = mock.patch('pint_server.app.' + function,
+                                return_value=golden_xml_data(provider, kind))
+    else:
+        # NOTE: contextlib.nullcontext() requires Python 3.7
+        data_patch = contextlib.ExitStack()
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.assert_valid_provider_region'), \
+            data_patch:
+        rv = client.get(route.format(provider=provider))
+    validate(rv, 200, '.xml')
+    assert rv.data == expected
+
+
+@pytest.mark.parametrize("content,collection_name,element_name,golden", [
+    ([{'name': 'a&b<c>d"e\'f', 'changeinfo': 'x\ny\tz\r\nw', 'empty': ''},
+      {'name': 'plain'}], 'images', 'image', 'escaping'),
+    ({'deletiondate': 'a&b<c>"d\r\ne\rf'}, None, None, 'escaping_text'),
+    ({'deletiondate': ''}, None, None, 'empty_text'),
+])
+def test_json_to_xml_escaping(content, collection_name, element_name, golden):
+    with open(golden_xml_file(None, golden), 'rb') as f:
+        expected = f.read()
+    assert pint_server.app.json_to_xml(
+        content, collection_name, element_name).encode('utf-8') == expected
+
+
+def test_json_to_xml_compact(client):
+    images = [{'name': 'image1', 'state': 'active'}, {'name': 'image2'}]
+    assert pint_server.app.json_to_xml(images, 'images', 'image',
+                                       compact=True) == (
+        '<?xml version="1.0" ?><images><image name="image1" '
+        'state="active"/><image name="image2"/></images>')
+    assert pint_server.app.json_to_xml([], 'images', 'image',
+                                       compact=True) == (
+        '<?xml version="1.0" ?><images/>')
+
+    with mock.patch.dict(os.environ, {'XML_COMPACT': 'true'}):
+        rv = client.get('/v1/images/states.xml')
+    validate(rv, 200, '.xml')
+    assert rv.data.startswith(b'<?xml version="1.0" ?><states><state ')
+
+
+@pytest.mark.parametrize("max_payload_size", ['100000', '1500'])
+def test_trim_images_payload_encoded_once(max_payload_size):
+    images = mock_pint_data.mocked_return_value_images['amazon']
+    images = images + [dict(images[0], name='caf\u00e9')]
+    with mock.patch.dict(os.environ, {'MAX_PAYLOAD_SIZE': max_payload_size}):
+        with pint_server.app.app.test_request_context('/v1/amazon/images'):
+            encoded = [json.dumps(i, separators=(',', ':')) for i in images]
+            assert pint_server.app.get_encoded_rows_payload_size(
+                'images', encoded) == flask.jsonify(
+                    images=images).content_length
+
+            with mock.patch('pint_server.app.json.dumps',
+                            wraps=json.dumps) as dumps:
+                trimmed = pint_server.app.trim_images_payload(images)
+                payload = pint_server.app.make_response_payload(
+                    trimmed, 'images', 'image', 'utf-8')[1]
+            # each image is only encoded once
+            encoded_images = [c.args[0] for c in dumps.call_args_list
+                              if c.args[0] in images]
+            assert encoded_images == images
+
+    assert json.loads(payload) == {'images': list(trimmed)}
+    if max_payload_size == '1500':
+        assert len(trimmed) < len(images)
+    else:
+        assert trimmed == images
+
+
+def make_synthetic_images(count):
+    # images with hard to compress ids, a handful per publishedon date,
+    # sorted by publishedon like the real images lists
+    images = []
+    for i in range(count):
+        digest = hashlib.sha256(str(i).encode()).hexdigest()
+        images.append({
+            'name': 'suse-sles-15-sp4-%s' % digest[:16],
+            'state': 'active',
+            'replacementname': '',
+            'publishedon': '2022%04d' % (9999 - i // 5),
+            'deprecatedon': '',
+            'deletedon': '',
+            'changeinfo': 'https://publiccloudimagechangeinfo.suse.com/%s/'
+                          % digest[16:32],
+            'id': 'ami-%s' % digest[32:49],
+            'replacementid': '',
+            'region': 'us-east-1'})
+    return images
+
+
+@pytest.mark.parametrize("extension", ['.json', '.xml'])
+@pytest.mark.parametrize("encoding,content_encoding,decompress", [
+    ('bzip2', 'bzip2', bz2.decompress), ('gzip', 'gzip', gzip.decompress),
+    ('xz', 'lzma', lzma.decompress)])
+def test_compressed_payload_trimmed_to_limit(client, encoding,
+                                             content_encoding, decompress,
+                                             extension):
+    images = make_synthetic_images(2000)
+    max_payload_size = 10000
+    with mock.patch.dict(os.environ,
+                         {'MAX_PAYLOAD_SIZE': str(max_payload_size)}), \
+            mock.patch('pint_server.app.GZIP_MEMBER_MIN_SIZE', 4096), \
+            mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_provider_images',
+                       return_value=images):
+        rv = client.get('/v1/amazon/images' + extension,
+                        headers={'Accept-Encoding': encoding})
+    assert rv.status_code == 200
+    assert rv.headers['Content-Encoding'] == content_encoding
+    assert len(rv.data) <= max_payload_size
+    payload = decompress(rv.data)
+    if extension == '.xml':
+        root = ET.fromstring(payload)
+        trimmed = [dict(e.attrib) for e in root]
+    else:
+        trimmed = json.loads(payload)['images']
+
+    # only whole publishedon groups of images are kept
+    assert 0 < len(trimmed) < len(images)
+    assert trimmed == images[:len(trimmed)]
+    assert (images[len(trimmed)]['publishedon'] !=
+            trimmed[-1]['publishedon'])
+    # the trimmed payload is the same as for the untrimmed images list
+    with pint_server.app.app.test_request_context(
+            '/v1/amazon/images' + extension):
+        _, expected = pint_server.app.make_response_payload(
+            trimmed, 'images', 'image', 'utf-8')
+    assert payload == expected
+
+
+@mock.patch('pint_server.app.GZIP_MEMBER_MIN_SIZE', 65536)
+def test_gzip_members_payload(client):
+    images = make_synthetic_images(2000)
+    with pint_server.app.app.test_request_context('/v1/amazon/images'):
+        _, expected = pint_server.app.make_response_payload(
+            images, 'images', 'image', 'utf-8')
+        with mock.patch('pint_server.app.get_compressed_payload',
+                        wraps=pint_server.app.get_compressed_payload) as \
+                get_compressed_payload:
+            payload = pint_server.app.get_gzip_members_payload(
+                images, pint_server.app.get_collection_payload_parts(
+                    images, 'images', 'image', 'utf-8'),
+                'images', 'image', 'utf-8', 5000000)
+            members = get_compressed_payload.call_count
+            # the data is split into multiple members, that make up a
+            # single stream
+            assert members > 3
+            assert gzip.decompress(payload) == expected
+
+            # members are reused for other responses containing the same
+            # publishedon date groups, and trimming drops whole members
+            trimmed = pint_server.app.get_gzip_members_payload(
+                images[:1000], pint_server.app.get_collection_payload_parts(
+                    images[:1000], 'images', 'image', 'utf-8'),
+                'images', 'image', 'utf-8', len(payload) // 2)
+            assert get_compressed_payload.call_count == members + 1
+    assert len(trimmed) <= len(payload) // 2
+    trimmed = json.loads(gzip.decompress(trimmed))['images']
+    assert 0 < len(trimmed) < 1000
+    assert trimmed == images[:len(trimmed)]
+
+
+@pytest.mark.parametrize("accept_encoding,expected", [
+    (None, (None, None, None)),
+    ('', (None, None, None)),
+    ('gzip', ('gzip', 'gzip', None)),
+    ('bzip2', ('bzip2', 'bzip2', None)),
+    ('xz', ('xz', 'lzma', None)),
+    ('GZip', ('gzip', 'gzip', None)),
+    ('bzip2, gzip, xz', ('gzip', 'gzip', None)),
+    ('gzip, zstd', ('zstd', 'zstd', None)),
+    ('gzip, br;q=1.0', ('br', 'br', None)),
+    ('gzip;q=0.5, bzip2', ('bzip2', 'bzip2', None)),
+    ('gzip;q=0.5, bzip2;q=0.4, zstd;q=0', ('gzip', 'gzip', None)),
+    ('gzip;q=0', (None, None, None)),
+    ('gzip;q=foo, bzip2', ('bzip2', 'bzip2', None)),
+    ('compress, deflate', (None, None, None)),
+    ('*', ('zstd', 'zstd', 1.0)),
+    ('*;q=0.5, zstd;q=0, br;q=0', ('gzip', 'gzip', 0.5)),
+    ('gzip;q=0.5, identity', (None, None, 1.0)),
+    ('gzip, identity;q=0', ('gzip', 'gzip', 0.0)),
+    ('deflate, identity;q=0', 406),
+    ('*;q=0', 406),
+])
+def test_negotiate_compression(accept_encoding, expected):
+    headers = {}
+    if accept_encoding is not None:
+        headers['Accept-Encoding'] = accept_encoding
+    with pint_server.app.app.test_request_context('/v1/amazon/images',
+                                                  headers=headers), \
+            mock.patch('pint_server.app.zstandard', mock.Mock()), \
+            mock.patch('pint_server.app.brotli', mock.Mock()):
+        if expected == 406:
+            with pytest.raises(HTTPException) as e:
+                pint_server.app.negotiate_compression()
+            assert e.value.response.status_code == 406
+        else:
+            assert pint_server.app.negotiate_compression() == expected
+
+
+def test_negotiate_compression_configuration():
+    headers = {'Accept-Encoding': 'gzip, bzip2, zstd, br'}
+    with pint_server.app.app.test_request_context('/v1/amazon/images',
+                                                  headers=headers):
+        # optional codings are not used if their library isn't available
+        with mock.patch('pint_server.app.zstandard', None), \
+                mock.patch('pint_server.app.brotli', None):
+            assert pint_server.app.negotiate_compression() == (
+                'gzip', 'gzip', None)
+            with mock.patch.dict(os.environ,
+                                 {'COMPRESSION_PREFERENCE': 'bzip2,gzip'}):
+                assert pint_server.app.negotiate_compression() == (
+                    'bzip2', 'bzip2', None)
+
+    get_compression_level = pint_server.app.get_compression_level
+    assert get_compression_level('gzip', 1000) == 6
+    assert get_compression_level('gzip', 65536) == 9
+    assert get_compression_level('xz', 5000000) == 9
+    with mock.patch.dict(os.environ, {'COMPRESSION_LEVELS':
+                                      'gzip:9@10000, gzip:1,zstd:3'}):
+        assert get_compression_level('gzip', 1000) == 1
+        assert get_compression_level('gzip', 10000) == 9
+        assert get_compression_level('zstd', 5000000) == 3
+        assert get_compression_level('bzip2', 1000) == 1
+        assert get_compression_level('bzip2', 5000000) == 9
+
+
+@pytest.mark.parametrize("extension", ['', '.xml'])
+def test_compression_min_size(client, caplog, extension):
+    images = make_synthetic_images(1)
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_provider_images',
+                       return_value=images):
+        with caplog.at_level('INFO', logger='pint_server.app'):
+            rv = client.get('/v1/amazon/images' + extension,
+                            headers={'Accept-Encoding': 'gzip'})
+        assert rv.status_code == 200
+        assert rv.headers['Content-Encoding'] == 'gzip'
+        assert 'with gzip level 6: ratio=' in caplog.text
+
+        # payloads below the threshold are not compressed
+        caplog.clear()
+        pint_server.app.response_cache.clear()
+        with mock.patch.dict(os.environ, {'COMPRESSION_MIN_SIZE': '100000'}), \
+                caplog.at_level('INFO', logger='pint_server.app'):
+            rv = client.get('/v1/amazon/images' + extension,
+                            headers={'Accept-Encoding': 'gzip'})
+        assert rv.status_code == 200
+        assert 'Content-Encoding' not in rv.headers
+        assert rv.headers['Content-Type'].startswith(
+            'application/%s' % (extension[1:] or 'json'))
+        assert 'compressed' not in caplog.text
+
+
+def test_small_payload_identity_refused(client):
+    # payloads below the threshold are still compressed if the client
+    # refuses them uncompressed
+    rv = client.get('/v1/images/states',
+                    headers={'Accept-Encoding': 'identity;q=0, gzip'})
+    assert rv.status_code == 200
+    assert rv.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(rv.data))['states']
+
+
+def make_image_rows(count):
+    # amazon image rows, a handful per publishedon date, in snapshot order
+    model = pint_server.app.AmazonImagesModel
+    rows = [make_row(model, name='suse-sles-15-sp%d' % (i % 5),
+                     state=ImageState.active,
+                     publishedon=(datetime.date(2022, 1, 1) -
+                                  datetime.timedelta(days=i // 5)),
+                     id='ami-%04d' % i, region='us-east-1')
+            for i in range(count)]
+    rows.sort(key=pint_server.app.get_row_sort_key(model))
+    return rows
+
+
+def get_images_page(client, url):
+    rv = client.get(url)
+    assert rv.status_code == 200
+    if '.xml' in url:
+        root = ET.fromstring(rv.data)
+        images = [dict(e.attrib) for e in root]
+        next_cursor = root.get('nextcursor')
+    else:
+        content = json.loads(rv.data)
+        images = content['images']
+        next_cursor = content.get('nextcursor')
+    if next_cursor:
+        assert rv.headers['Link'] == (
+            '<http://localhost/v1/amazon/images%s?limit=10&cursor=%s>; '
+            'rel="next"' % ('.xml' if '.xml' in url else '', next_cursor))
+    else:
+        assert 'Link' not in rv.headers
+    return images, next_cursor
+
+
+@pytest.mark.parametrize("extension", ['', '.xml'])
+def test_paginated_images(client, extension):
+    rows = make_image_rows(23)
+    url = '/v1/amazon/images' + extension
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_table_snapshot',
+                       return_value=rows):
+        expected, next_cursor = get_images_page(client, url)
+        assert len(expected) == 23 and next_cursor is None
+
+        images = []
+        next_cursor = ''
+        for page in range(3):
+            page_images, next_cursor = get_images_page(
+                client, url + '?limit=10&cursor=' + next_cursor)
+            images.extend(page_images)
+        assert next_cursor is None
+        assert images == expected
+
+        # the cursor continues after the last row of the previous page,
+        # even when rows have since been added
+        _, next_cursor = get_images_page(client, url + '?limit=10')
+        pint_server.app.response_cache.clear()
+        rows.insert(0, make_row(
+            pint_server.app.AmazonImagesModel, name='suse-sles-15-sp6',
+            state=ImageState.active, publishedon=datetime.date(2022, 6, 1),
+            id='ami-9999', region='us-east-1'))
+        images, _ = get_images_page(
+            client, url + '?limit=10&cursor=' + next_cursor)
+        assert images == expected[10:20]
+
+
+@pytest.mark.parametrize("args", [
+    'limit=0', 'limit=10001', 'limit=foo', 'limit=10&cursor=foo',
+    'limit=10&cursor=WyJmb28iXQ', 'limit=10&cursor=WzEsMiwzXQ'])
+def test_paginated_images_bad_request(client, args):
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_table_snapshot',
+                       return_value=make_image_rows(23)):
+        rv = client.get('/v1/amazon/images?' + args)
+    assert rv.status_code == 400
+
+
+@pytest.mark.parametrize("extension", ['', '.xml'])
+def test_requested_fields(client, extension):
+    rows = make_image_rows(23)
+    url = '/v1/amazon/images%s?fields=state,%%20id,name' % extension
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_table_snapshot',
+                       return_value=rows):
+        rv = client.get(url)
+        assert rv.status_code == 200
+        if extension == '.xml':
+            images = [dict(e.attrib) for e in ET.fromstring(rv.data)]
+        else:
+            images = json.loads(rv.data)['images']
+        # the fields are in the usual attribute order
+        assert [list(i) for i in images] == [['name', 'state', 'id']] * 23
+        assert images[0] == {'name': rows[0].name, 'state': 'active',
+                             'id': rows[0].id}
+
+        # the images are trimmed individually without their publishedon
+        pint_server.app.response_cache.clear()
+        with mock.patch.dict(os.environ, {'MAX_PAYLOAD_SIZE': '1000'}):
+            rv = client.get('/v1/amazon/images?fields=name,id')
+        trimmed = json.loads(rv.data)['images']
+        assert len(rv.data) <= 1000
+        assert 0 < len(trimmed) < 23 and len(trimmed) % 5
+        assert trimmed == [{'name': r.name, 'id': r.id}
+                           for r in rows[:len(trimmed)]]
+
+        for fields in ['', 'name,bogus', 'replacementname,shape']:
+            rv = client.get('/v1/amazon/images?fields=' + fields)
+            assert rv.status_code == 400
+
+
+def test_select_model_rows_requested_fields():
+    model = pint_server.app.AmazonImagesModel
+    attrs = pint_server.app.get_model_attrs(model)
+    statement = pint_server.app.select_model_rows(model, {'name', 'id'})
+    assert [c.name for c in statement.selected_columns] == list(attrs)
+    sql = str(statement)
+    assert 'amazonimages.name' in sql and 'amazonimages.id' in sql
+    assert 'amazonimages.state' not in sql
+    assert sql.count('NULL') == len(attrs) - 2
+
+
+@pytest.mark.parametrize("route", [
+    '/v1/amazon/images', '/v1/amazon/images/active',
+    '/v1/amazon/us-east-1/images', '/v1/amazon/us-east-1/images/active'])
+@pytest.mark.parametrize("args,expected", [
+    ('name=suse-sles-15-sp1', lambda r: r.name == 'suse-sles-15-sp1'),
+    ('name=suse-sles-15-sp*', lambda r: True),
+    ('name=*-sp1', lambda r: r.name.endswith('-sp1')),
+    ('name=suse_sles*', lambda r: False),
+    ('publishedafter=20211229',
+     lambda r: r.publishedon > datetime.date(2021, 12, 29)),
+    ('publishedafter=20211220&publishedbefore=20211229&name=*sp[23]',
+     lambda r: False),
+    ('publishedafter=20211220&publishedbefore=20211229&name=*sp3',
+     lambda r: (datetime.date(2021, 12, 20) < r.publishedon <
+                datetime.date(2021, 12, 29) and r.name.endswith('sp3'))),
+    ('state=active,deprecated', lambda r: r.state != ImageState.inactive),
+    ('state=inactive', lambda r: r.state == ImageState.inactive),
+])
+def test_image_filters(client, route, args, expected):
+    rows = make_image_rows(60)
+    for row in rows[::7]:
+        rows[rows.index(row)] = row._replace(state=ImageState.inactive)
+    if route.endswith('active'):
+        rows = [r for r in rows if r.state == ImageState.active]
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.assert_valid_provider_region'), \
+            mock.patch('pint_server.app.get_table_snapshot',
+                       return_value=rows):
+        rv = client.get(route + '?fields=id&' + args)
+    assert rv.status_code == 200
+    assert json.loads(rv.data)['images'] == [
+        {'id': r.id} for r in rows if expected(r)]
+
+
+@pytest.mark.parametrize("args", [
+    'publishedafter=2022', 'publishedbefore=20221301', 'state=',
+    'state=active,bogus'])
+def test_image_filters_bad_request(client, args):
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_table_snapshot',
+                       return_value=make_image_rows(10)):
+        rv = client.get('/v1/amazon/images?' + args)
+    assert rv.status_code == 400
+
+
+def test_image_filter_conditions():
+    model = pint_server.app.AmazonImagesModel
+    args = 'name=suse_sles-15%25*&publishedafter=20240101&state=active'
+    with pint_server.app.app.test_request_context(
+            '/v1/amazon/images/deletedby/20250101?' + args):
+        conditions = pint_server.app.get_image_filter_conditions(model)
+        statement = pint_server.app.select_model_rows(model).where(
+            *conditions)
+    compiled = statement.compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert 'amazonimages.name LIKE %(name_1)s ESCAPE' in sql
+    assert 'amazonimages.publishedon > %(publishedon_1)s' in sql
+    assert 'amazonimages.state IN' in sql
+    assert compiled.params['name_1'] == 'suse\\_sles-15\\%%'
+    assert compiled.params['publishedon_1'] == datetime.date(2024, 1, 1)
+
+
+def make_change_log(rows):
+    changes = []
+    for version, (operation, row) in zip(['20220101.01', '20220102.0'],
+                                         rows):
+        data = {k: v.value if isinstance(v, ImageState) else
+                v.isoformat() if isinstance(v, datetime.date) else v
+                for k, v in row._asdict().items()}
+        changes.append((operation, Decimal(version), data))
+    return changes
+
+
+@pytest.mark.parametrize("extension", ['', '.json', '.xml'])
+def test_provider_changes(client, extension):
+    rows = make_image_rows(2)
+    changes = make_change_log([('added', rows[0]), ('updated', rows[1])])
+    versions = {'amazonimages': Decimal('20220102.0')}
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_data_versions',
+                       return_value=versions), \
+            mock.patch('pint_server.app.query_change_log_base_version',
+                       return_value=Decimal('20220101.0')), \
+            mock.patch('pint_server.app.query_change_log',
+                       return_value=changes) as query_change_log:
+        rv = client.get('/v1/amazon/images/changes%s?since=20220101.0' %
+                        extension)
+        assert rv.status_code == 200
+        query_change_log.assert_called_once_with(
+            'amazonimages', Decimal('20220101.0'), versions['amazonimages'])
+
+        # the changes are formatted the same as the images list entries
+        with pint_server.app.app.test_request_context('/v1/amazon/images'):
+            expected = pint_server.app.formatted_provider_images('amazon',
+                                                                 rows)
+        expected[0].update(operation='added', version='20220101.01')
+        expected[1].update(operation='updated', version='20220102.0')
+        if extension == '.xml':
+            root = ET.fromstring(rv.data)
+            assert root.tag == 'changes'
+            assert [c.attrib for c in root] == [
+                {k: str(v) for k, v in e.items()} for e in expected]
+        else:
+            assert json.loads(rv.data) == {'changes': expected}
+
+        # nothing has changed since the current version
+        query_change_log.reset_mock()
+        rv = client.get('/v1/amazon/images/changes%s?since=20220102.0' %
+                        extension)
+        assert rv.status_code == 200
+        assert not query_change_log.called
+
+        # there is no oracle servers table, so never any changes
+        rv = client.get('/v1/oracle/servers/changes?since=20220101')
+        assert json.loads(rv.data) == {'changes': []}
+
+
+@pytest.mark.parametrize("since,base_version,status", [
+    ('20211231.0', Decimal('20220101.0'), 410),
+    ('20220101.0', None, 410),
+    ('', Decimal('20220101.0'), 400),
+    ('latest', Decimal('20220101.0'), 400),
+    ('NaN', Decimal('20220101.0'), 400),
+    (None, Decimal('20220101.0'), 400),
+])
+def test_provider_changes_unavailable(client, since, base_version, status):
+    versions = {'amazonimages': Decimal('20220102.0')}
+    route = '/v1/amazon/images/changes'
+    if since is not None:
+        route += '?since=' + since
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_data_versions',
+                       return_value=versions), \
+            mock.patch('pint_server.app.query_change_log_base_version',
+                       return_value=base_version), \
+            mock.patch('pint_server.app.query_change_log',
+                       return_value=[]):
+        rv = client.get(route)
+    assert rv.status_code == status
+
+
+@pytest.mark.parametrize("encoding,library", [('zstd', 'zstandard'),
+                                              ('br', 'brotli')])
+def test_optional_content_codings(client, encoding, library):
+    library = pytest.importorskip(library)
+    if encoding == 'zstd':
+        decompress = library.ZstdDecompressor().decompressobj().decompress
+    else:
+        decompress = library.decompress
+    with mock.patch('pint_server.app.assert_valid_provider'), \
+            mock.patch('pint_server.app.get_provider_images',
+                       return_value=mock_pint_data.mocked_return_value_images['amazon']):
+        rv = client.get('/v1/amazon/images',
+                        headers={'Accept-Encoding': encoding + ', gzip'})
+    assert rv.status_code == 200
+    assert rv.headers['Content-Encoding'] == encoding
+    assert json.loads(decompress(rv.data)) == (
+        mock_pint_data.expected_json_images['amazon'])
+
+
+def test_response_cache_lru_eviction():
+    cache = pint_server.app.ResponseCache()
+    entry = lambda size: pint_server.app.CachedResponse(b'x' * size, {})
+    cache.put('a', entry(40), 100)
+    cache.put('b', entry(40), 100)
+    # refresh 'a' so that 'b' is the least recently used entry
+    assert cache.get('a') is not None
+    cache.put('c', entry(40), 100)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.size == 80
+    # entries larger than the cache are not saved
+    cache.put('d', entry(101), 100)
+    assert cache.get('d') is None
+    assert len(cache) == 2
+
+
+@pytest.mark.parametrize("encoding", [None, 'gzip'])
+def test_response_cache_shared_between_route_variants(client, encoding):
+    provider = 'amazon'
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    with mock.patch('pint_server.app.assert_valid_provider'):
+        with mock.patch('pint_server.app.get_provider_images',
+                        return_value=mock_pint_data.mocked_return_value_images[provider]) as get_provider_images:
+            rv = client.get('/v1/' + provider + '/images', headers=headers)
+            rv_json = client.get('/v1/' + provider + '/images.json',
+                                 headers=headers)
+            assert get_provider_images.call_count == 1
+            assert rv.data == rv_json.data
+            assert rv.headers['Content-Type'] == rv_json.headers['Content-Type']
+            assert (rv.headers.get('Content-Encoding') ==
+                    rv_json.headers.get('Content-Encoding'))
+
+            rv_xml = client.get('/v1/' + provider + '/images.xml',
+                                headers=headers)
+            assert get_provider_images.call_count == 2
+            assert rv_xml.data != rv.data
+
+            # a different content encoding is a different entry
+            client.get('/v1/' + provider + '/images',
+                       headers={'Accept-Encoding': 'bzip2'})
+            assert get_provider_images.call_count == 3
+
+
+def test_response_cache_data_version_change(client):
+    provider = 'amazon'
+    with mock.patch('pint_server.app.assert_valid_provider'):
+        with mock.patch('pint_server.app.get_provider_images',
+                        return_value=mock_pint_data.mocked_return_value_images[provider]) as get_provider_images:
+            with mock.patch('pint_server.app.get_data_versions',
+                            return_value={'amazonimages': 1,
+                                          'googleimages': 1}):
+                client.get('/v1/' + provider + '/images')
+                client.get('/v1/' + provider + '/images')
+                assert get_provider_images.call_count == 1
+            # other providers' data versions are not relevant
+            with mock.patch('pint_server.app.get_data_versions',
+                            return_value={'amazonimages': 1,
+                                          'googleimages': 2}):
+                client.get('/v1/' + provider + '/images')
+                assert get_provider_images.call_count == 1
+            with mock.patch('pint_server.app.get_data_versions',
+                            return_value={'amazonimages': 2,
+                                          'googleimages': 2}):
+                client.get('/v1/' + provider + '/images')
+                assert get_provider_images.call_count == 2
+
+
+def test_response_cache_ignores_unrecognised_args(client):
+    provider = 'amazon'
+    with mock.patch('pint_server.app.assert_valid_provider'):
+        with mock.patch('pint_server.app.get_provider_images',
+                        return_value=mock_pint_data.mocked_return_value_images[provider]) as get_provider_images:
+            client.get('/v1/' + provider + '/images')
+            for i in range(3):
+                client.get('/v1/%s/images?x=%d' % (provider, i))
+            assert get_provider_images.call_count == 1
+            assert len(pint_server.app.response_cache) == 1
+
+            # the endpoint's own arguments are different entries
+            client.get('/v1/' + provider + '/images?fields=name')
+            assert get_provider_images.call_count == 2
+
+        with mock.patch('pint_server.app.get_provider_servers',
+                        return_value=[]) as get_provider_servers:
+            # the image filters don't apply to server lists
+            client.get('/v1/' + provider + '/servers')
+            client.get('/v1/' + provider + '/servers?name=server1')
+            assert get_provider_servers.call_count == 1
+
+
+@mock.patch.dict(os.environ, {"RESPONSE_CACHE_MAX_SIZE": "0"})
+def test_response_cache_disabled(client):
+    provider = 'amazon'
+    with mock.patch('pint_server.app.assert_valid_provider'):
+        with mock.patch('pint_server.app.get_provider_images',
+                        return_value=mock_pint_data.mocked_return_value_images[provider]) as get_provider_images:
+            client.get('/v1/' + provider + '/images')
+            client.get('/v1/' + provider + '/images')
+            assert get_provider_images.call_count == 2
+            assert len(pint_server.app.response_cache) == 0
+
+
+@mock.patch.dict(os.environ, {"RESPONSE_CACHE_MAX_SIZE": "0"})
+def test_conditional_get(client):
+    provider = 'amazon'
+    versions = {'amazonimages': 20220101.01, 'amazonservers': 20211231.0}
+    with mock.patch('pint_server.app.assert_valid_provider'):
+        with mock.patch('pint_server.app.get_data_versions',
+                        return_value=versions):
+            with mock.patch('pint_server.app.get_provider_images',
+                            return_value=mock_pint_data.mocked_return_value_images[provider]) as get_provider_images:
+                rv = client.get('/v1/' + provider + '/images')
+                validate(rv, 200, '')
+                etag = rv.headers['ETag']
+                assert etag.startswith('"') and etag.endswith('"')
+                assert rv.headers['Last-Modified'] == 'Sat, 01 Jan 2022 00:00:00 GMT'
+                assert rv.headers['Cache-Control'] == 'public, max-age=60'
+                assert rv.headers['Vary'] == 'Accept-Encoding'
+
+                # the ETag differs by format and encoding
+                rv_xml = client.get('/v1/' + provider + '/images.xml')
+                assert rv_xml.headers['ETag'] != etag
+                rv_gzip = client.get('/v1/' + provider + '/images',
+                                     headers={'Accept-Encoding': 'gzip'})
+                assert rv_gzip.headers['ETag'] != etag
+                assert get_provider_images.call_count == 3
+
+                for if_none_match in [etag, 'W/' + etag, '"foo", ' + etag]:
+                    rv = client.get('/v1/' + provider + '/images.json',
+                                    headers={'If-None-Match': if_none_match})
+                    assert rv.status_code == 304
+                    assert rv.data == b''
+                    assert rv.headers['ETag'] == etag
+                    assert rv.headers['Vary'] == 'Accept-Encoding'
+                assert get_provider_images.call_count == 3
+
+                rv = client.get('/v1/' + provider + '/images',
+                                headers={'If-None-Match': '"foo"'})
+                validate(rv, 200, '')
+                assert get_provider_images.call_count == 4
+
+            versions['amazonimages'] = 20220102.0
+            with mock.patch('pint_server.app.get_provider_images',
+                            return_value=mock_pint_data.mocked_return_value_images[provider]) as get_provider_images:
+                rv = client.get('/v1/' + provider + '/images',
+                                headers={'If-None-Match': etag})
+                validate(rv, 200, '')
+                assert rv.headers['ETag'] != etag
+                assert get_provider_images.call_count == 1
+
+
+def test_conditional_get_star(client):
+    provider = 'amazon'
+    with mock.patch('pint_server.app.assert_valid_provider'):
+        with mock.patch('pint_server.app.get_provider_images',
+                        return_value=mock_pint_data.mocked_return_value_images[provider]) as get_provider_images:
+            # only responses known to exist match '*'
+            rv = client.get('/v1/' + provider + '/images',
+                            headers={'If-None-Match': '*'})
+            validate(rv, 200, '')
+            rv = client.get('/v1/' + provider + '/images',
+                            headers={'If-None-Match': '*'})
+            assert rv.status_code == 304
+            assert get_provider_images.call_count == 1
+
+
+def make_row(model, **columns):
+    # mimic a row tuple selected by select_model_rows()
+    attrs = pint_server.app.get_model_attrs(model)
+    return namedtuple('Row', attrs)(*[columns.get(a) for a in attrs])
+
+
 def validate(rv, expected_status, extension):
     assert expected_status == rv.status_code
     assert rv.headers['Access-Control-Allow-Origin'] == '*'
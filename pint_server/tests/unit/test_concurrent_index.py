@@ -0,0 +1,92 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Check the concurrent index builds.
+
+Like the query plan tests, these tests need a local PostgreSQL database,
+specified by the "TEST_DATABASE_URI" environment variable, and are skipped
+otherwise.
+"""
+
+import os
+import pytest
+
+from alembic.operations import Operations
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import create_engine, exc, text
+
+from pint_server.concurrent_index import (
+    create_index_concurrently,
+    drop_index_concurrently,
+    get_index_valid)
+
+
+pytestmark = pytest.mark.skipif('TEST_DATABASE_URI' not in os.environ,
+                                reason='TEST_DATABASE_URI is not set')
+
+
+@pytest.fixture
+def connection():
+    # a scratch table, with duplicate names
+    engine = create_engine(os.environ['TEST_DATABASE_URI'])
+    with engine.connect() as connection:
+        connection.execute(text(
+            "CREATE TABLE concurrentindextest (id integer, name text)"))
+        connection.execute(text(
+            "INSERT INTO concurrentindextest VALUES "
+            "(1, 'image1'), (2, 'image1'), (3, 'image2')"))
+        try:
+            with Operations.context(MigrationContext.configure(connection)):
+                yield connection
+        finally:
+            connection.execute(text("DROP TABLE concurrentindextest"))
+    engine.dispose()
+
+
+def test_create_index_concurrently(connection):
+    create_index_concurrently('ix_concurrentindextest_name',
+                              'concurrentindextest', ['name'])
+    assert get_index_valid(connection, 'ix_concurrentindextest_name')
+
+    # an existing index is kept
+    create_index_concurrently('ix_concurrentindextest_name',
+                              'concurrentindextest', ['name'])
+    assert get_index_valid(connection, 'ix_concurrentindextest_name')
+
+    drop_index_concurrently('ix_concurrentindextest_name')
+    assert get_index_valid(connection, 'ix_concurrentindextest_name') is None
+    drop_index_concurrently('ix_concurrentindextest_name')
+
+
+def test_create_index_concurrently_retry(connection):
+    # the invalid index left by a failed build is dropped
+    with pytest.raises(exc.IntegrityError):
+        create_index_concurrently('ix_concurrentindextest_name',
+                                  'concurrentindextest', ['name'],
+                                  unique=True)
+    assert get_index_valid(connection, 'ix_concurrentindextest_name') is None
+
+    # and one left by an interrupted migration is rebuilt
+    with pytest.raises(exc.IntegrityError):
+        connection.execution_options(isolation_level='AUTOCOMMIT').execute(
+            text("CREATE UNIQUE INDEX CONCURRENTLY "
+                 "ix_concurrentindextest_name ON concurrentindextest (name)"))
+    assert get_index_valid(connection, 'ix_concurrentindextest_name') is False
+    connection.execute(text("DELETE FROM concurrentindextest WHERE id = 2"))
+    create_index_concurrently('ix_concurrentindextest_name',
+                              'concurrentindextest', ['name'], unique=True)
+    assert get_index_valid(connection, 'ix_concurrentindextest_name')
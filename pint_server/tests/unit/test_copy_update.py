@@ -0,0 +1,155 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Check the data update's copy engine merges rows into the tables.
+
+Like the query plan tests, these tests need a local PostgreSQL database,
+specified by the "TEST_DATABASE_URI" environment variable, and are skipped
+otherwise. The changes made are rolled back.
+"""
+
+import datetime
+import logging
+import os
+import pytest
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from pint_models.models import (
+    AmazonServersModel,
+    ImageState,
+    MicrosoftImagesModel,
+    ServerType)
+from pint_server import data_update
+from pint_server.change_log import change_log_table
+
+
+pytestmark = pytest.mark.skipif('TEST_DATABASE_URI' not in os.environ,
+                                reason='TEST_DATABASE_URI is not set')
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(os.environ['TEST_DATABASE_URI'])
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            yield Session(bind=connection)
+        finally:
+            transaction.rollback()
+    engine.dispose()
+
+
+def copy_update(db, caplog, provider, table_name, rows, version):
+    # return the update's log messages and the changes it recorded
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger=data_update.LOG.name):
+        data_update.orm_update_tables(db, provider, {table_name: rows},
+                                      version, engine='copy')
+    model, _ = data_update.get_table_model(provider, table_name)
+    changes = db.execute(
+        select(change_log_table.c.operation, change_log_table.c.data).
+        where(change_log_table.c.tablename == model.__tablename__,
+              change_log_table.c.version == version).
+        order_by(change_log_table.c.id)).all()
+    return caplog.messages, changes
+
+
+def make_server(**kwargs):
+    server = dict(type=ServerType.region, shape='', name='server1',
+                  ip='10.0.0.1', ipv6=None, region='us-west-1')
+    server.update(kwargs)
+    return server
+
+
+def test_copy_update_servers(db, caplog):
+    servers = [
+        make_server(),
+        make_server(name='server2', ip=None, ipv6='2600:1f14:abcd::2'),
+        make_server(name='server3', ip=None),
+        make_server(name='server4', ip='10.0.0.4'),
+    ]
+    messages, changes = copy_update(db, caplog, 'amazon', 'servers',
+                                    servers, '20220101.0')
+    assert "Added 4 entries for model 'AmazonServersModel'" in messages
+    assert [op for op, _ in changes] == ['added'] * 4
+    ids = {s.name: s.id for s in db.query(AmazonServersModel)}
+
+    servers = [
+        # renamed, matching on the region and ip partial unique index
+        make_server(name='server1-renamed'),
+        # retyped, matching on the region and ipv6 partial unique index,
+        # however the address is written
+        make_server(name='server2', ip=None, ipv6='2600:1F14:ABCD:0::2',
+                    type=ServerType.update),
+        # unchanged, without an address
+        make_server(name='server3', ip=None),
+        # unchanged
+        make_server(name='server4', ip='10.0.0.4'),
+        make_server(name='server5', ip='10.0.0.5'),
+    ]
+    messages, changes = copy_update(db, caplog, 'amazon', 'servers',
+                                    servers, '20220102.0')
+    assert "Added 1 entries for model 'AmazonServersModel'" in messages
+    assert "Updated 2 entries for model 'AmazonServersModel'" in messages
+    assert sorted((op, data['name'], data['type'])
+                  for op, data in changes) == [
+        ('added', 'server5', 'region'),
+        ('updated', 'server1-renamed', 'region'),
+        ('updated', 'server2', 'update'),
+    ]
+
+    # the updated entries are updated in place
+    entries = {s.name: s for s in db.query(AmazonServersModel)}
+    assert len(entries) == 5
+    assert entries['server1-renamed'].id == ids['server1']
+    assert entries['server2'].id == ids['server2']
+    assert entries['server2'].type == ServerType.update
+
+    # the staging table is dropped
+    assert db.execute(select(1).where(
+        text("to_regclass('amazonservers_staging') IS NOT NULL")
+    )).first() is None
+
+    messages, changes = copy_update(db, caplog, 'amazon', 'servers',
+                                    servers, '20220103.0')
+    assert "No new entries found for model 'AmazonServersModel'" in messages
+    assert changes == []
+
+
+def test_copy_update_microsoft_images(db, caplog):
+    image = dict(name='image1', environment='PublicAzure', urn='urn1',
+                 state=ImageState.active,
+                 publishedon=datetime.date(2020, 1, 1))
+    images = [image, dict(image, environment='AzureChinaCloud')]
+    messages, changes = copy_update(db, caplog, 'microsoft', 'images',
+                                    images, '20220101.0')
+    assert "Added 2 entries for model 'MicrosoftImagesModel'" in messages
+    ids = {i.environment: i.id for i in db.query(MicrosoftImagesModel)}
+
+    # matching on the name and environment unique constraint
+    images = [dict(image, state=ImageState.deprecated,
+                   deprecatedon=datetime.date(2020, 6, 1)),
+              dict(image, environment='AzureChinaCloud')]
+    messages, changes = copy_update(db, caplog, 'microsoft', 'images',
+                                    images, '20220102.0')
+    assert "Updated 1 entries for model 'MicrosoftImagesModel'" in messages
+    assert not any(m.startswith('Added') for m in messages)
+    assert [(op, data['id'], data['state'], data['deprecatedon'])
+            for op, data in changes] == [
+        ('updated', ids['PublicAzure'], 'deprecated', '2020-06-01')]
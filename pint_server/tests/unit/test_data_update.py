@@ -0,0 +1,82 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+import mock
+
+from pint_models.models import AmazonServersModel, ServerType
+from pint_server import data_update
+
+
+def make_server(**kwargs):
+    server = dict(type=ServerType.region, shape='', name='server1',
+                  ip='10.0.0.1', ipv6=None, region='us-west-1')
+    server.update(kwargs)
+    return AmazonServersModel(**server)
+
+
+def test_existing_entries():
+    servers = [make_server(),
+               make_server(name='server2', ip='10.0.0.2',
+                           ipv6='2600:1f14:abcd::1')]
+    db = mock.Mock()
+    db.query.return_value.all.return_value = list(servers)
+    entries = data_update.ExistingEntries(db, AmazonServersModel)
+    db.query.assert_called_once_with(AmazonServersModel)
+    assert len(entries) == 2
+
+    assert entries.find(dict(name='server1', ip='10.0.0.1')) is servers[0]
+    assert entries.find(dict(name='server1', ip='10.0.0.2')) is None
+    # None matches NULL, and addresses match however they are written
+    assert entries.find(dict(ip='10.0.0.1', ipv6=None)) is servers[0]
+    assert entries.find(dict(ipv6='2600:1F14:ABCD:0::1')) is servers[1]
+
+    # added entries are found, including by the already indexed fields
+    server = make_server(name='server3', ip='10.0.0.3')
+    entries.add(server)
+    assert len(entries) == 3
+    assert entries.find(dict(name='server3', ip='10.0.0.3')) is server
+    assert entries.find(dict(ip='10.0.0.3', ipv6=None)) is server
+    assert entries.find(dict(region='us-west-1')) is servers[0]
+
+
+def test_copy_rows():
+    fields = ['name', 'type', 'ipv6']
+    rows = [dict(name='tab\there', type=ServerType.region, ipv6=None),
+            dict(name='back\\slash\r\n', type=ServerType.update,
+                 ipv6='2600:1f14:abcd::1')]
+    expected = ('tab\\there\tregion\t\\N\n'
+                'back\\\\slash\\r\\n\tupdate\t2600:1f14:abcd::1\n')
+    assert data_update.CopyRows(fields, rows).read() == expected
+
+    # the lines are streamed in chunks of the requested size
+    copy_rows = data_update.CopyRows(fields, rows)
+    chunks = iter(lambda: copy_rows.read(5), '')
+    assert ''.join(chunks) == expected
+
+
+def test_group_copy_rows():
+    rows = [dict(name='server1', ip='10.0.0.1', ipv6=None, region='r1'),
+            dict(name='server2', ip=None, ipv6='2600::1', region='r1'),
+            dict(name='server3', ip=None, ipv6=None, region='r1'),
+            dict(name='server3', ip=None, ipv6=None, region='r1'),
+            # the last row with the same key wins
+            dict(name='server4', ip=None, ipv6='2600:0::1', region='r1')]
+    fields = ('ip', 'ipv6', 'name', 'region')
+    assert data_update.group_copy_rows(AmazonServersModel, rows) == [
+        (fields, data_update.SERVERS_MERGE_KEYS[0], [rows[0]]),
+        (fields, data_update.SERVERS_MERGE_KEYS[1], [rows[4]]),
+        (fields, None, [rows[2]])]
@@ -0,0 +1,151 @@
+# Copyright (c) 2021 SUSE LLC
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of version 3 of the GNU General Public License as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.   See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, contact SUSE LLC.
+#
+# To contact SUSE about this file by physical or electronic mail,
+# you may find current contact information at www.suse.com
+
+"""Check the plans of the queries the endpoints issue use the indexes.
+
+These tests need a local PostgreSQL database, upgraded to the latest
+schema revision, specified by the "TEST_DATABASE_URI" environment
+variable, e.g.
+
+  TEST_DATABASE_URI=postgresql://postgres@localhost/pinttest
+
+and are skipped otherwise. The tables may be empty, as the queries are
+planned with sequential scans disabled, so that the planner only falls
+back to one if no index can be used for a query.
+"""
+
+import contextlib
+import datetime
+import json
+import mock
+import os
+import pytest
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+import pint_server
+from pint_models.models import MicrosoftRegionMapModel
+
+
+pytestmark = pytest.mark.skipif('TEST_DATABASE_URI' not in os.environ,
+                                reason='TEST_DATABASE_URI is not set')
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine(os.environ['TEST_DATABASE_URI'])
+    yield engine
+    engine.dispose()
+
+
+@contextlib.contextmanager
+def captured_statements(engine):
+    # run the app's queries with a session of the test database, capturing
+    # the statements issued along with their parameters
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    session = scoped_session(sessionmaker(bind=engine))
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        with mock.patch('pint_server.app.db_session', session):
+            yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+        session.remove()
+
+
+def explain(engine, statement, parameters):
+    with engine.connect() as conn:
+        conn.exec_driver_sql('SET enable_seqscan = off')
+        plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement,
+                                    parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def plan_node_types(plan):
+    yield plan['Node Type']
+    for subplan in plan.get('Plans', []):
+        yield from plan_node_types(subplan)
+
+
+def assert_index_scans(engine, statements, sorted_by_index=False):
+    assert statements
+    for statement, parameters in statements:
+        node_types = list(plan_node_types(
+            explain(engine, statement, parameters)))
+        assert 'Seq Scan' not in node_types, statement
+        assert any('Index' in t for t in node_types), statement
+        if sorted_by_index:
+            assert 'Sort' not in node_types, statement
+            assert 'Incremental Sort' not in node_types, statement
+
+
+@pytest.mark.parametrize("model", [
+    *pint_server.app.PROVIDER_IMAGES_MODEL_MAP.values(),
+    *pint_server.app.PROVIDER_SERVERS_MODEL_MAP.values(),
+    MicrosoftRegionMapModel])
+def test_load_table_rows_plan(engine, model):
+    # the table snapshots, which the list endpoints are served from, are
+    # read in the order they are listed in
+    with captured_statements(engine) as statements:
+        pint_server.app.load_table_rows(model)
+    assert_index_scans(engine, statements, sorted_by_index=True)
+
+
+@pytest.mark.parametrize("query_string", [
+    '', 'name=suse-sles-15-*&publishedafter=20200101&state=deprecated'])
+@pytest.mark.parametrize("region", [None, 'us-east-1'])
+@pytest.mark.parametrize("provider",
+                         pint_server.app.PROVIDER_IMAGES_MODEL_MAP.keys())
+def test_deletedby_plan(engine, provider, region, query_string):
+    with captured_statements(engine) as statements, \
+            pint_server.app.app.test_request_context(
+                '/v1/images/deletedby/20221231?' + query_string), \
+            mock.patch('pint_server.app._get_azure_environment_name_for_region',
+                       return_value='PublicAzure'):
+        pint_server.app.query_deletedby_images_in_provider_region(
+            datetime.date(2022, 12, 31), provider, region)
+    assert_index_scans(engine, statements)
+
+
+@pytest.mark.parametrize("region", [None, 'us-east-1'])
+@pytest.mark.parametrize("provider",
+                         pint_server.app.PROVIDER_IMAGES_MODEL_MAP.keys())
+def test_deletiondate_plan(engine, provider, region):
+    with captured_statements(engine) as statements, \
+            mock.patch('pint_server.app._get_azure_environment_name_for_region',
+                       return_value='PublicAzure'):
+        pint_server.app.query_image_in_provider_region(
+            'image1', provider, region)
+        pint_server.app.query_images_in_provider_region(
+            ['image1', 'image2'], provider, region)
+    assert_index_scans(engine, statements)
+
+
+def test_changes_plan(engine):
+    with captured_statements(engine) as statements:
+        pint_server.app.query_change_log_base_version('amazonimages')
+        pint_server.app.query_change_log('amazonimages', 1, 10)
+    assert_index_scans(engine, statements[:1])
+    # the changes are read in the order they were made
+    assert_index_scans(engine, statements[1:], sorted_by_index=True)